@@ -1,6 +1,7 @@
 from passlib.context import CryptContext
 from sqlalchemy.orm import Session  # Changed from requests import Session
 from db.models import Dbuser
+from tracing import tracer
 
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
@@ -8,11 +9,14 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 class Hash:
     @staticmethod
     def bcrypt(password: str) -> str:
-        return pwd_context.hash(password)
+        with tracer.span("bcrypt.hash"):
+            return pwd_context.hash(password)
 
     @staticmethod
     def verify(plain_password: str, hashed_password: str) -> bool:
-        return pwd_context.verify(plain_password, hashed_password)  # Arguments fixed
+        # Arguments fixed
+        with tracer.span("bcrypt.verify"):
+            return pwd_context.verify(plain_password, hashed_password)
 
     @staticmethod
     def update_password(
@@ -1,8 +1,11 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, insert
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from tracing import instrument_engine
 
 
 load_dotenv()
@@ -10,6 +13,7 @@ SQLALCHEMY_DATABASE_URL = os.getenv("SQLALCHEMY_DATABASE_URL")
 engine = create_engine(
     SQLALCHEMY_DATABASE_URL,
 )
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
@@ -21,3 +25,21 @@ def get_db():
         yield db
     finally:
         db.close()
+
+
+def insert_if_missing(db, model, values: dict):
+    """
+    INSERT a row unless one with the same key exists, without failing when a
+    concurrent transaction inserts it first. Lock the row afterwards with a
+    SELECT ... FOR UPDATE to change it.
+    """
+    dialect = db.get_bind().dialect.name
+    if dialect in ("postgresql", "sqlite"):
+        dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+        db.execute(dialect_insert(model).values(**values).on_conflict_do_nothing())
+        return
+    try:
+        with db.begin_nested():
+            db.execute(insert(model).values(**values))
+    except IntegrityError:
+        pass  # Inserted by someone else
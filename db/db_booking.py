@@ -1,26 +1,30 @@
 from operator import and_, or_
 from typing import Optional
 from sqlalchemy.orm import Session
-from db.models import Dbbooking, Dbhotel, Dbroom, IsActive, IsRoomStatus
+from db.models import Dbbooking, Dbhotel, Dbroom, IsActive
+from db.loading import with_profile
+from db.db_rate_plan import quote_stays
+from db.db_notification import notify_owner
 from schemas import BookingCreate, BookingUpdate
 from datetime import date
 
 
 def calculate_total_cost(
-    db: Session, room_id: int, check_in_date: date, check_out_date: date
+    db: Session,
+    room_id: int,
+    check_in_date: date,
+    check_out_date: date,
+    room: Optional[Dbroom] = None,
 ):
-    # Fetch the room's price per night
-    room = db.query(Dbroom).filter(Dbroom.id == room_id).first()
+    # Fetch the room unless the caller already has it
+    if room is None:
+        room = db.query(Dbroom).filter(Dbroom.id == room_id).first()
 
     if not room:
         return None  # Room not found
 
-    # Calculate the total cost for the booking
-    total_nights = (check_out_date - check_in_date).days
-    if total_nights <= 0:
-        return None  # Invalid booking dates
-
-    return room.price_per_night * total_nights  # Return the total cost
+    # Invalid booking dates give an empty quote
+    return quote_stays(db, [room], check_in_date, check_out_date).get(room.id)
 
 
 def check_room_availability(
@@ -78,22 +82,30 @@ def create_booking(db: Session, request: BookingCreate, user_id: int):
         check_out_date=request.check_out_date,
     )
 
+    room = db.query(Dbroom).filter(Dbroom.id == request.room_id).first()
+
     # Calculate the total cost
     total_cost = calculate_total_cost(
-        db, request.room_id, request.check_in_date, request.check_out_date
+        db, request.room_id, request.check_in_date, request.check_out_date, room=room
     )
     if total_cost is None:
         return None  # If there's an issue with the cost calculation
 
     new_booking.total_cost = total_cost
 
-    # Update the room status to reserved
-    room = db.query(Dbroom).filter(Dbroom.id == request.room_id).first()
-    if room:
-        room.status = IsRoomStatus.reserved
-        db.commit()
-
     db.add(new_booking)
+    db.flush()  # Assigns the id for the owner's digest
+    notify_owner(
+        db,
+        new_booking.hotel_id,
+        "booking_created",
+        {
+            "booking_id": new_booking.id,
+            "check_in_date": str(new_booking.check_in_date),
+            "check_out_date": str(new_booking.check_out_date),
+            "total_cost": str(total_cost),
+        },
+    )
     db.commit()
     db.refresh(new_booking)
 
@@ -120,7 +132,7 @@ def get_booking_by_id(db: Session, booking_id: int):
         .filter(Dbbooking.is_active != IsActive.deleted)
     )
 
-    return query.first()
+    return with_profile(query, "booking_detail").first()
 
 
 def soft_delete_booking(db: Session, booking_id: int):
@@ -133,12 +145,16 @@ def soft_delete_booking(db: Session, booking_id: int):
         IsActive.deleted
     )  # Mark the booking as inactive instead of deleting
 
-    # Update the room status to available
-    room = db.query(Dbroom).filter(Dbroom.id == booking.room_id).first()
-    if room:
-        room.status = IsRoomStatus.available
-        db.commit()
-
+    notify_owner(
+        db,
+        booking.hotel_id,
+        "booking_cancelled",
+        {
+            "booking_id": booking.id,
+            "check_in_date": str(booking.check_in_date),
+            "check_out_date": str(booking.check_out_date),
+        },
+    )
     db.commit()
     db.refresh(booking)
     return booking  # Return the updated booking
@@ -168,7 +184,7 @@ def get_all_bookings(
     if status is not None:
         query = query.filter(Dbbooking.status == status)
 
-    return query.all()
+    return with_profile(query, "booking_list").all()
 
 
 def update_booking_in_db(
@@ -181,9 +197,12 @@ def update_booking_in_db(
         .filter(Dbbooking.is_active != IsActive.deleted)
     )
 
-    # Check if the booking exists
-    if not booking.first():
+    # Check if the booking exists; locked so only one update sees it go to
+    # cancelled and notifies the owner
+    existing = booking.with_for_update().first()
+    if not existing:
         return None  # Return None if the booking is not found
+    was_cancelled = existing.status == "cancelled"
 
     # Prepare data for updating the booking
     request_data = request.dict(exclude_unset=True)
@@ -191,6 +210,19 @@ def update_booking_in_db(
     # Update the booking fields (only the fields that are included in the request)
     booking.update(request_data)
 
+    updated = booking.populate_existing().first()
+    if updated.status == "cancelled" and not was_cancelled:
+        notify_owner(
+            db,
+            updated.hotel_id,
+            "booking_cancelled",
+            {
+                "booking_id": updated.id,
+                "check_in_date": str(updated.check_in_date),
+                "check_out_date": str(updated.check_out_date),
+            },
+        )
+
     # Commit the changes to the database
     db.commit()
 
@@ -1,9 +1,30 @@
-from sqlalchemy.orm import Session
-from db.models import Dbhotel, IsActive, Dbuser
-from schemas import HotelBase, HotelUpdate
-from typing import Optional
-from fastapi import BackgroundTasks
-from email_utils import send_email
+from sqlalchemy.orm import Session, Query
+from sqlalchemy import and_, or_, case, func, literal, select
+from db.models import Dbhotel, Dbroom, IsActive, Dbuser
+from db.db_room import best_value_score
+from db.loading import with_profile
+from db.file_services import get_image_by_url
+from schemas import HotelBase, HotelUpdate, SearchSort
+from typing import List, Optional
+from db.db_job import enqueue_job
+from email_templates import templates
+from geo_utils import (
+    GEOHASH_PRECISION,
+    covered_radius_km,
+    encode_geohash,
+    haversine_km,
+    neighbour_cells,
+    precision_for_radius,
+)
+
+# Nearest-k searches start at ~1km cells and widen until k hotels are found
+NEAREST_START_PRECISION = 6
+
+
+def compute_geohash(latitude: Optional[float], longitude: Optional[float]):
+    if latitude is None or longitude is None:
+        return None
+    return encode_geohash(latitude, longitude)
 
 
 def create_hotel(db: Session, request: HotelBase, owner_id: int):
@@ -26,13 +47,24 @@ def create_hotel(db: Session, request: HotelBase, owner_id: int):
         phone_number=request.phone_number,
         email=request.email,
         owner_id=owner_id,
+        latitude=request.latitude,
+        longitude=request.longitude,
+        geohash=compute_geohash(request.latitude, request.longitude),
     )
+    link_image_renditions(db, new_hotel)
     db.add(new_hotel)
     db.commit()
     db.refresh(new_hotel)
     return new_hotel
 
 
+def link_image_renditions(db: Session, hotel: Dbhotel):
+    # Point list pages at the small renditions when img_link is one of our uploads
+    image = get_image_by_url(db, hotel.img_link) if hotel.img_link else None
+    hotel.img_thumbnail_link = image.thumbnail_url if image else None
+    hotel.img_card_link = image.card_url if image else None
+
+
 # delete hotel
 def delete_hotel(db: Session, id: int):
     hotel = db.query(Dbhotel).filter(Dbhotel.id == id).first()
@@ -45,6 +77,100 @@ def delete_hotel(db: Session, id: int):
         return None  # Return None if hotel not found
 
 
+def min_room_price():
+    # Correlated lookup served by ix_room_hotel_id_price_per_night
+    return (
+        select(func.min(Dbroom.price_per_night))
+        .where(Dbroom.hotel_id == Dbhotel.id, Dbroom.is_active != IsActive.deleted)
+        .correlate(Dbhotel)
+        .scalar_subquery()
+    )
+
+
+def hotel_sort_order(sort: SearchSort, search_term: Optional[str] = None):
+    if sort == SearchSort.price_asc:
+        return [min_room_price().asc().nulls_last(), Dbhotel.id.asc()]
+    if sort == SearchSort.price_desc:
+        return [min_room_price().desc().nulls_last(), Dbhotel.id.asc()]
+    if sort == SearchSort.rating:
+        return [Dbhotel.avg_review_score.desc().nulls_last(), Dbhotel.id.asc()]
+    if sort == SearchSort.newest:
+        return [Dbhotel.id.desc()]
+    if sort == SearchSort.best_value:
+        return [
+            best_value_score(Dbhotel.avg_review_score, min_room_price())
+            .desc()
+            .nulls_last(),
+            Dbhotel.id.asc(),
+        ]
+
+    # Relevance: exact name, then prefix, then substring matches, best rated first
+    if search_term:
+        rank = case(
+            (Dbhotel.name.ilike(search_term), 0),
+            (Dbhotel.name.ilike(f"{search_term}%"), 1),
+            else_=literal(2),
+        )
+        return [rank, Dbhotel.avg_review_score.desc().nulls_last(), Dbhotel.id.asc()]
+    return [Dbhotel.avg_review_score.desc().nulls_last(), Dbhotel.id.asc()]
+
+
+def filter_by_cells(query: Query, cells: List[str]) -> Query:
+    # Each cell is a contiguous range of the geohash index
+    return query.filter(
+        or_(
+            *[
+                Dbhotel.geohash.between(
+                    cell.ljust(GEOHASH_PRECISION, "0"),
+                    cell.ljust(GEOHASH_PRECISION, "z"),
+                )
+                for cell in cells
+            ]
+        )
+    )
+
+
+def sort_by_distance(
+    hotels: List[Dbhotel], latitude: float, longitude: float
+) -> List[Dbhotel]:
+    for hotel in hotels:
+        # Transient attribute, picked up by HotelDisplay.distance_km
+        hotel.distance_km = round(
+            haversine_km(latitude, longitude, hotel.latitude, hotel.longitude), 3
+        )
+    return sorted(hotels, key=lambda hotel: hotel.distance_km)
+
+
+def hotels_within_radius(
+    query: Query, latitude: float, longitude: float, radius_km: float
+) -> List[Dbhotel]:
+    precision = precision_for_radius(latitude, radius_km)
+    if precision:
+        query = filter_by_cells(
+            query, neighbour_cells(latitude, longitude, precision)
+        )
+
+    hotels = sort_by_distance(query.all(), latitude, longitude)
+    return [hotel for hotel in hotels if hotel.distance_km <= radius_km]
+
+
+def nearest_hotels(
+    query: Query, latitude: float, longitude: float, k: int
+) -> List[Dbhotel]:
+    for precision in range(NEAREST_START_PRECISION, 0, -1):
+        cells = neighbour_cells(latitude, longitude, precision)
+        hotels = sort_by_distance(
+            filter_by_cells(query, cells).all(), latitude, longitude
+        )
+        # The k-th hit is only trustworthy if nothing outside the cells can be closer
+        if len(hotels) >= k and hotels[k - 1].distance_km <= covered_radius_km(
+            latitude, precision
+        ):
+            return hotels[:k]
+
+    return sort_by_distance(query.all(), latitude, longitude)[:k]
+
+
 def combined_search_filter(
     db: Session,
     search_term: Optional[str] = None,
@@ -53,10 +179,21 @@ def combined_search_filter(
     max_rating: Optional[float] = None,
     is_approved: Optional[bool] = None,
     owner_id: Optional[int] = None,
+    latitude: Optional[float] = None,
+    longitude: Optional[float] = None,
+    radius_km: Optional[float] = None,
+    nearest: Optional[int] = None,
+    min_latitude: Optional[float] = None,
+    max_latitude: Optional[float] = None,
+    min_longitude: Optional[float] = None,
+    max_longitude: Optional[float] = None,
+    sort: Optional[SearchSort] = None,
     skip: int = 0,
     limit: int = 100,
 ):
-    query = db.query(Dbhotel).filter(Dbhotel.is_active != "deleted")
+    query = with_profile(
+        db.query(Dbhotel).filter(Dbhotel.is_active != "deleted"), "hotel_list"
+    )
 
     if search_term:
         query = query.filter(Dbhotel.name.ilike(f"%{search_term}%"))
@@ -76,7 +213,40 @@ def combined_search_filter(
     if owner_id is not None:
         query = query.filter(Dbhotel.owner_id == owner_id)
 
-    return query.offset(skip).limit(limit).all()
+    # Bounding box: range scan on (latitude, longitude)
+    if min_latitude is not None and max_latitude is not None:
+        query = query.filter(Dbhotel.latitude.between(min_latitude, max_latitude))
+
+    if min_longitude is not None and max_longitude is not None:
+        if min_longitude <= max_longitude:
+            query = query.filter(
+                Dbhotel.longitude.between(min_longitude, max_longitude)
+            )
+        else:
+            # The box crosses the antimeridian
+            query = query.filter(
+                or_(
+                    Dbhotel.longitude >= min_longitude,
+                    Dbhotel.longitude <= max_longitude,
+                )
+            )
+
+    if latitude is None or longitude is None:
+        if sort is not None:
+            query = query.order_by(*hotel_sort_order(sort, search_term))
+        return query.offset(skip).limit(limit).all()
+
+    # Point searches: only hotels with coordinates, sorted by distance
+    query = query.filter(
+        and_(Dbhotel.latitude.isnot(None), Dbhotel.longitude.isnot(None))
+    )
+
+    if radius_km is not None:
+        hotels = hotels_within_radius(query, latitude, longitude, radius_km)
+    else:
+        hotels = nearest_hotels(query, latitude, longitude, nearest or skip + limit)
+
+    return hotels[skip : skip + limit]
 
 
 def get_all_hotels(db: Session):
@@ -84,14 +254,14 @@ def get_all_hotels(db: Session):
 
 
 def get_hotel(db: Session, id: int):
-    return db.query(Dbhotel).filter(Dbhotel.id == id).first()
+    query = db.query(Dbhotel).filter(Dbhotel.id == id)
+    return with_profile(query, "hotel_detail").first()
 
 
 def update_hotel(
     db: Session,
     id: int,
     request: HotelUpdate,
-    background_tasks: BackgroundTasks,
     current_user: Dbuser,
 ):
     hotel = db.query(Dbhotel).filter(Dbhotel.id == id).first()
@@ -107,8 +277,12 @@ def update_hotel(
     for key, value in update_data.items():
         setattr(hotel, key, value)
 
-    db.commit()
-    db.refresh(hotel)
+    # Keep the spatial index in step with the coordinates
+    if "latitude" in update_data or "longitude" in update_data:
+        hotel.geohash = compute_geohash(hotel.latitude, hotel.longitude)
+
+    if "img_link" in update_data:
+        link_image_renditions(db, hotel)
 
     # Check for changing approval status
     if (
@@ -118,16 +292,23 @@ def update_hotel(
     ):
         owner = db.query(Dbuser).filter(Dbuser.id == hotel.owner_id).first()
 
-        if hotel.is_approved:
-            # Approval email
-            subject = "Your Hotel Has Been Approved"
-            body = f"Congratulations {owner.username},\n\nYour hotel '{hotel.name}' has been approved.\n\nBest regards,\nHotel Management Team."
-        else:
-            # Rejection email
-            subject = "Your Hotel Has Been Rejected"
-            body = f"Dear {owner.username},\n\nYour hotel '{hotel.name}' has been rejected. Please contact support for further information.\n\nBest regards,\nHotel Management Team."
+        # Approval or rejection email
+        subject, body = templates.render(
+            "hotel_approved" if hotel.is_approved else "hotel_rejected",
+            username=owner.username,
+            hotel_name=hotel.name,
+        )
 
         to_email = owner.email
-        background_tasks.add_task(send_email, to_email, subject, body)
+        # Sent by the job worker, with retries, after this request has returned.
+        # Committed together with the update, so neither exists without the other
+        enqueue_job(
+            db,
+            "send_email",
+            {"to_email": to_email, "subject": subject, "body": body},
+            commit=False,
+        )
 
+    db.commit()
+    db.refresh(hotel)
     return hotel
@@ -0,0 +1,326 @@
+import os
+import random
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from db.models import Dbjob, Dbjobrun, IsJobStatus
+
+
+def start_job_run(db: Session, job_name: str) -> Dbjobrun:
+    run = Dbjobrun(job_name=job_name, started_at=datetime.utcnow())
+    db.add(run)
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+def finish_job_run(
+    db: Session,
+    run: Dbjobrun,
+    rows_scanned: int = 0,
+    rows_updated: int = 0,
+    error: Optional[str] = None,
+) -> Dbjobrun:
+    run.finished_at = datetime.utcnow()
+    run.rows_scanned = rows_scanned
+    run.rows_updated = rows_updated
+    run.error = error
+    db.commit()
+    db.refresh(run)
+    return run
+
+
+
+# ------------------------------------------------------------------------------------------
+# Job queue
+
+JOB_BACKOFF_SECONDS = 30  # First retry delay; doubles on every attempt
+JOB_MAX_BACKOFF_SECONDS = 60 * 60
+# A running job this old lost its worker; keep it above the longest job
+JOB_STUCK_AFTER_SECONDS = int(os.getenv("JOB_STUCK_AFTER_SECONDS", 60 * 60))
+JOB_METRICS_SAMPLE = 10000  # Finished jobs read for the latency percentiles
+
+
+def enqueue_job(
+    db: Session,
+    kind: str,
+    payload: dict,
+    delay_seconds: float = 0,
+    max_attempts: int = 5,
+    singleton: bool = False,
+    commit: bool = True,
+) -> Optional[Dbjob]:
+    """
+    Add a job and commit it, along with any of the caller's pending changes.
+    For a job that must exist exactly when the change that caused it does,
+    make the change first and pass commit=False, then commit once. With
+    singleton, nothing is added while a job of that kind waits or runs.
+    """
+    if singleton:
+        pending = (
+            db.query(Dbjob.id)
+            .filter(
+                Dbjob.kind == kind,
+                Dbjob.status.in_([IsJobStatus.queued, IsJobStatus.running]),
+            )
+            .first()
+        )
+        if pending:
+            return None
+
+    now = datetime.utcnow()
+    job = Dbjob(
+        kind=kind,
+        payload=payload,
+        status=IsJobStatus.queued,
+        attempts=0,
+        max_attempts=max_attempts,
+        run_at=now + timedelta(seconds=delay_seconds),
+        created_at=now,
+    )
+    db.add(job)
+    if commit:
+        db.commit()
+        db.refresh(job)
+    return job
+
+
+def claim_job(
+    db: Session, worker: str, limits: Dict[str, Optional[int]]
+) -> Optional[Dbjob]:
+    """
+    Take the next due job of a kind in limits, skipping kinds that already have
+    their limit of running jobs. FOR UPDATE SKIP LOCKED lets many workers
+    dequeue at once without waiting on, or taking, each other's rows.
+
+    The limits are best-effort: running jobs are counted before claiming, so
+    workers claiming at the same moment can overshoot a limit by one job
+    each. Handlers that must never overlap guard themselves (e.g. with row
+    locks); the limits only keep load in check.
+    """
+    running = dict(
+        db.query(Dbjob.kind, func.count(Dbjob.id))
+        .filter(Dbjob.status == IsJobStatus.running)
+        .group_by(Dbjob.kind)
+        .all()
+    )
+    kinds = [
+        kind
+        for kind, limit in limits.items()
+        if limit is None or running.get(kind, 0) < limit
+    ]
+    if not kinds:
+        return None
+
+    now = datetime.utcnow()
+    job = (
+        db.query(Dbjob)
+        .filter(
+            Dbjob.status == IsJobStatus.queued,
+            Dbjob.run_at <= now,
+            Dbjob.kind.in_(kinds),
+        )
+        .order_by(Dbjob.run_at, Dbjob.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .first()
+    )
+    if not job:
+        db.rollback()  # Release the snapshot
+        return None
+
+    job.status = IsJobStatus.running
+    job.attempts += 1
+    job.started_at = now
+    job.locked_by = worker
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def claim_more_jobs(
+    db: Session,
+    worker: str,
+    kind: str,
+    limit: int,
+    max_concurrency: Optional[int] = None,
+) -> List[Dbjob]:
+    """
+    Take up to limit more due jobs of one kind, to handle them as a batch,
+    staying within max_concurrency running jobs (best-effort, as in claim_job)
+    """
+    if max_concurrency is not None:
+        running = (
+            db.query(func.count(Dbjob.id))
+            .filter(Dbjob.kind == kind, Dbjob.status == IsJobStatus.running)
+            .scalar()
+        )
+        limit = min(limit, max_concurrency - running)
+    if limit <= 0:
+        return []
+
+    now = datetime.utcnow()
+    jobs = (
+        db.query(Dbjob)
+        .filter(
+            Dbjob.status == IsJobStatus.queued,
+            Dbjob.run_at <= now,
+            Dbjob.kind == kind,
+        )
+        .order_by(Dbjob.run_at, Dbjob.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in jobs:
+        job.status = IsJobStatus.running
+        job.attempts += 1
+        job.started_at = now
+        job.locked_by = worker
+    db.commit()
+    return jobs
+
+
+def complete_job(db: Session, job: Dbjob) -> Dbjob:
+    job.status = IsJobStatus.done
+    job.finished_at = datetime.utcnow()
+    job.locked_by = None
+    job.last_error = None
+    db.commit()
+    return job
+
+
+def retry_delay(attempts: int) -> float:
+    """Exponential backoff with jitter, so failed jobs do not retry in lockstep"""
+    delay = min(JOB_BACKOFF_SECONDS * 2 ** (attempts - 1), JOB_MAX_BACKOFF_SECONDS)
+    return delay * random.uniform(0.5, 1.0)
+
+
+def fail_job(db: Session, job: Dbjob, error: str) -> Dbjob:
+    """Schedule a retry, or dead-letter the job once it is out of attempts"""
+    job.last_error = error[:2000]
+    job.locked_by = None
+    if job.attempts >= job.max_attempts:
+        job.status = IsJobStatus.dead
+        job.finished_at = datetime.utcnow()
+    else:
+        job.status = IsJobStatus.queued
+        job.run_at = datetime.utcnow() + timedelta(seconds=retry_delay(job.attempts))
+    db.commit()
+    return job
+
+
+def requeue_stuck_jobs(db: Session, stuck_after: int = JOB_STUCK_AFTER_SECONDS) -> int:
+    """
+    Jobs whose worker died mid-run go back to the queue (the attempt counts).
+    Like fail_job, a job out of attempts is dead-lettered instead, so a job
+    that keeps killing its worker does not loop forever.
+    """
+    now = datetime.utcnow()
+    stuck = db.query(Dbjob).filter(
+        Dbjob.status == IsJobStatus.running,
+        Dbjob.started_at < now - timedelta(seconds=stuck_after),
+    )
+    changes = {"locked_by": None, "last_error": "Worker stopped responding"}
+    dead = stuck.filter(Dbjob.attempts >= Dbjob.max_attempts).update(
+        {**changes, "status": IsJobStatus.dead, "finished_at": now},
+        synchronize_session=False,
+    )
+    requeued = stuck.filter(Dbjob.attempts < Dbjob.max_attempts).update(
+        {**changes, "status": IsJobStatus.queued, "run_at": now},
+        synchronize_session=False,
+    )
+    db.commit()
+    return dead + requeued
+
+
+def get_jobs(
+    db: Session, status: Optional[IsJobStatus] = None, skip: int = 0, limit: int = 100
+) -> List[Dbjob]:
+    query = db.query(Dbjob)
+    if status is not None:
+        query = query.filter(Dbjob.status == status)
+    return query.order_by(Dbjob.id.desc()).offset(skip).limit(limit).all()
+
+
+def retry_dead_job(db: Session, job_id: int) -> Optional[Dbjob]:
+    job = (
+        db.query(Dbjob)
+        .filter(Dbjob.id == job_id, Dbjob.status == IsJobStatus.dead)
+        .first()
+    )
+    if not job:
+        return None
+    job.status = IsJobStatus.queued
+    job.attempts = 0
+    job.run_at = datetime.utcnow()
+    job.finished_at = None
+    db.commit()
+    db.refresh(job)
+    return job
+
+
+def percentile(values: List[float], share: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(share * len(values)))]
+
+
+def queue_metrics(db: Session, window_minutes: int = 60) -> dict:
+    """
+    Queue depth per kind and status, the oldest due job's wait, and the wait
+    (due to started) and run times of jobs finished within the window.
+    """
+    now = datetime.utcnow()
+    depth = defaultdict(dict)
+    for kind, status, count in (
+        db.query(Dbjob.kind, Dbjob.status, func.count(Dbjob.id))
+        .filter(Dbjob.status != IsJobStatus.done)
+        .group_by(Dbjob.kind, Dbjob.status)
+    ):
+        depth[kind][status.value] = count
+
+    oldest_due = (
+        db.query(func.min(Dbjob.run_at))
+        .filter(Dbjob.status == IsJobStatus.queued, Dbjob.run_at <= now)
+        .scalar()
+    )
+
+    finished = (
+        db.query(Dbjob.kind, Dbjob.run_at, Dbjob.started_at, Dbjob.finished_at)
+        .filter(
+            Dbjob.status == IsJobStatus.done,
+            Dbjob.finished_at >= now - timedelta(minutes=window_minutes),
+        )
+        .limit(JOB_METRICS_SAMPLE)
+        .all()
+    )
+    waits, runs = defaultdict(list), defaultdict(list)
+    for kind, run_at, started_at, finished_at in finished:
+        waits[kind].append((started_at - run_at).total_seconds())
+        runs[kind].append((finished_at - started_at).total_seconds())
+
+    latency = {
+        kind: {
+            "completed": len(runs[kind]),
+            "wait_p50_seconds": percentile(waits[kind], 0.5),
+            "wait_p95_seconds": percentile(waits[kind], 0.95),
+            "run_p50_seconds": percentile(runs[kind], 0.5),
+            "run_p95_seconds": percentile(runs[kind], 0.95),
+        }
+        for kind in runs
+    }
+
+    return {
+        "depth": dict(depth),
+        "oldest_due_seconds": (
+            (now - oldest_due.replace(tzinfo=None)).total_seconds()
+            if oldest_due
+            else None
+        ),
+        "window_minutes": window_minutes,
+        "latency": latency,
+    }
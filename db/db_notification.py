@@ -0,0 +1,104 @@
+import os
+from collections import defaultdict
+from datetime import datetime
+from typing import Optional
+from sqlalchemy.orm import Session
+from db.models import Dbhotel, Dbownernotification, Dbuser, IsActive
+from db.db_job import enqueue_job
+from email_templates import templates
+
+
+DIGEST_WINDOW_MINUTES = int(os.getenv("DIGEST_WINDOW_MINUTES", 60))
+DIGEST_OWNER_BATCH = 500  # Owners rendered per transaction
+
+
+def notify_owner(db: Session, hotel_id: int, kind: str, payload: dict):
+    """
+    Queue an event for the hotel's owner digest. It is only added to the
+    session, so it commits (or rolls back) with the change it describes.
+    """
+    hotel = (
+        db.query(Dbhotel.owner_id, Dbhotel.name).filter(Dbhotel.id == hotel_id).first()
+    )
+    if not hotel or hotel.owner_id is None:
+        return
+    db.add(
+        Dbownernotification(
+            owner_id=hotel.owner_id,
+            kind=kind,
+            payload={"hotel_name": hotel.name, **payload},
+            created_at=datetime.utcnow(),
+        )
+    )
+
+
+def send_owner_digests(db: Session, until: Optional[datetime] = None) -> int:
+    """
+    Render one digest per owner from the events queued before `until` and
+    enqueue it as an email, marking the events digested in the same
+    transaction. Returns the number of digests sent.
+    """
+    until = until or datetime.utcnow()
+    sent = 0
+
+    while True:
+        owner_ids = [
+            owner_id
+            for (owner_id,) in db.query(Dbownernotification.owner_id)
+            .filter(
+                Dbownernotification.digested_at.is_(None),
+                Dbownernotification.created_at < until,
+            )
+            .distinct()
+            .limit(DIGEST_OWNER_BATCH)
+        ]
+        if not owner_ids:
+            return sent
+
+        events = (
+            db.query(Dbownernotification)
+            .filter(
+                Dbownernotification.owner_id.in_(owner_ids),
+                Dbownernotification.digested_at.is_(None),
+                Dbownernotification.created_at < until,
+            )
+            .order_by(Dbownernotification.owner_id, Dbownernotification.id)
+            .with_for_update()
+            .all()
+        )
+        by_owner = defaultdict(list)
+        for event in events:
+            by_owner[event.owner_id].append(event)
+
+        owners = {
+            owner.id: owner
+            for owner in db.query(Dbuser).filter(Dbuser.id.in_(list(by_owner)))
+        }
+
+        now = datetime.utcnow()
+        for owner_id, owner_events in by_owner.items():
+            owner = owners.get(owner_id)
+            if owner and owner.status != IsActive.deleted:
+                subject, body = templates.render(
+                    "owner_digest",
+                    username=owner.username,
+                    event_count=len(owner_events),
+                    since=min(event.created_at for event in owner_events).strftime(
+                        "%Y-%m-%d %H:%M"
+                    ),
+                    events="\n".join(
+                        templates.render_event(event.kind, event.payload)
+                        for event in owner_events
+                    ),
+                )
+                enqueue_job(
+                    db,
+                    "send_email",
+                    {"to_email": owner.email, "subject": subject, "body": body},
+                    commit=False,
+                )
+                sent += 1
+            for event in owner_events:
+                event.digested_at = now
+
+        db.commit()
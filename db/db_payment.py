@@ -1,9 +1,22 @@
+from sqlalchemy import func, or_
 from sqlalchemy.orm import Session
-from db.models import Dbpayment
+from db.models import (
+    Dbbooking,
+    Dbpayment,
+    Dbpaymentrollup,
+    IsActive,
+    IsPaymentStatus,
+)
+from db.database import insert_if_missing
 from schemas import PaymentCreate, PaymentStatus
 from decimal import Decimal
 from typing import Optional, List
-from datetime import date
+from datetime import date, datetime, timedelta
+import os
+
+# Longer than any gateway call, so only payments whose charge was lost expire
+PAYMENT_PENDING_TIMEOUT_MINUTES = int(os.getenv("PAYMENT_PENDING_TIMEOUT_MINUTES", 15))
+
 
 def create_payment(db: Session, payment: PaymentCreate, user_id: int, status: str, amount: Decimal):
     db_payment = Dbpayment(
@@ -12,12 +25,280 @@ def create_payment(db: Session, payment: PaymentCreate, user_id: int, status: st
         amount=amount,
         status=status,
         payment_date=payment.payment_date,
+        submitted_at=datetime.utcnow(),
     )
     db.add(db_payment)
+    shift_rollup(db, db_payment, 1)
     db.commit()
     db.refresh(db_payment)
     return db_payment
 
+def retry_failed_payment(
+    db: Session, db_payment: Dbpayment, payment: PaymentCreate
+) -> Optional[Dbpayment]:
+    """
+    Reset a declined payment to pending; its row is reused because booking_id
+    is unique. Returns None if the payment is no longer failed, e.g. a
+    concurrent retry reset it first.
+    """
+    db_payment = (
+        db.query(Dbpayment)
+        .filter(Dbpayment.id == db_payment.id)
+        .with_for_update()
+        .populate_existing()
+        .first()
+    )
+    if not db_payment or db_payment.status != IsPaymentStatus.failed:
+        db.rollback()
+        return None
+
+    shift_rollup(db, db_payment, -1)
+    db_payment.amount = payment.amount
+    db_payment.payment_date = payment.payment_date
+    db_payment.status = IsPaymentStatus.pending
+    db_payment.submitted_at = datetime.utcnow()
+    db_payment.sent_at = None
+    shift_rollup(db, db_payment, 1)
+    db.commit()
+    db.refresh(db_payment)
+    return db_payment
+
+
+def mark_payment_sent(db: Session, payment_id: int) -> bool:
+    """
+    Claim a pending payment for the gateway, right before it is charged.
+    False if it expired (or was settled) first: it must not be charged then.
+    Serialised with expire_stale_payments by the row lock.
+    """
+    db_payment = (
+        db.query(Dbpayment).filter(Dbpayment.id == payment_id).with_for_update().first()
+    )
+    if (
+        not db_payment
+        or db_payment.status != IsPaymentStatus.pending
+        or db_payment.sent_at is not None
+    ):
+        db.rollback()
+        return False
+    db_payment.sent_at = datetime.utcnow()
+    db.commit()
+    return True
+
+
+def settle_payment(db: Session, payment_id: int, approved: bool):
+    """
+    Record the gateway's answer. The payment status and the booking confirmation
+    are committed together; payments that are no longer pending are left alone.
+    """
+    db_payment = (
+        db.query(Dbpayment).filter(Dbpayment.id == payment_id).with_for_update().first()
+    )
+    if not db_payment or db_payment.status != IsPaymentStatus.pending:
+        return db_payment
+
+    shift_rollup(db, db_payment, -1)
+    if approved:
+        db_payment.status = IsPaymentStatus.completed
+        # Locked so a cancellation cannot slip in between the check and the write
+        booking = (
+            db.query(Dbbooking)
+            .filter(Dbbooking.id == db_payment.booking_id)
+            .with_for_update()
+            .first()
+        )
+        cancelled = (
+            booking is None
+            or booking.is_active == IsActive.deleted
+            or booking.status == "cancelled"
+        )
+        if cancelled:
+            # Cancelled while the charge was in flight: the money was taken
+            # but the booking stays cancelled. Flagged in the same commit, so
+            # the refund cannot be lost
+            db_payment.refund_needed = True
+        elif booking.status == "pending":
+            booking.status = "confirmed"
+    else:
+        db_payment.status = IsPaymentStatus.failed
+    shift_rollup(db, db_payment, 1)
+
+    db.commit()
+    return db_payment
+
+
+def expire_stale_payments(db: Session) -> int:
+    """
+    Fail payments that stayed pending longer than the timeout without ever
+    reaching the gateway: their charge was lost (the pipeline queue is in
+    memory, and card data is never stored, so they cannot be charged again
+    here). A failed payment can be retried on the same row, so the gateway
+    sees the same payment id again.
+
+    Payments already sent are left pending: the gateway may still approve
+    them, and failing them would let a retry charge the card twice. Their
+    answer arrives through settle_payment or its job on the queue.
+    """
+    cutoff = datetime.utcnow() - timedelta(minutes=PAYMENT_PENDING_TIMEOUT_MINUTES)
+    stale_ids = [
+        payment_id
+        for (payment_id,) in db.query(Dbpayment.id).filter(
+            Dbpayment.status == IsPaymentStatus.pending,
+            Dbpayment.sent_at.is_(None),
+            # Rows from before submitted_at existed count as stale
+            or_(Dbpayment.submitted_at < cutoff, Dbpayment.submitted_at.is_(None)),
+        )
+    ]
+    expired = 0
+    for payment_id in stale_ids:
+        db_payment = (
+            db.query(Dbpayment)
+            .filter(Dbpayment.id == payment_id)
+            .with_for_update()
+            .populate_existing()
+            .first()
+        )
+        # Re-checked under the lock: a worker may have sent it since
+        if (
+            not db_payment
+            or db_payment.status != IsPaymentStatus.pending
+            or db_payment.sent_at is not None
+        ):
+            db.rollback()
+            continue
+        shift_rollup(db, db_payment, -1)
+        db_payment.status = IsPaymentStatus.failed
+        shift_rollup(db, db_payment, 1)
+        db.commit()
+        expired += 1
+    return expired
+
+
+# ------------------------------------------------------------------------------------------
+# daily rollups (day x status x hotel)
+def shift_rollup(db: Session, db_payment: Dbpayment, sign: int):
+    """
+    Add (sign=1) or remove (sign=-1) a payment's current state from its rollup
+    row. Call it around every status, amount or date change; does not commit.
+    """
+    hotel_id = (
+        db.query(Dbbooking.hotel_id)
+        .filter(Dbbooking.id == db_payment.booking_id)
+        .scalar()
+    )
+    status = IsPaymentStatus(getattr(db_payment.status, "value", db_payment.status))
+
+    key = {"day": db_payment.payment_date, "status": status, "hotel_id": hotel_id}
+    rollup_query = (
+        db.query(Dbpaymentrollup)
+        .filter(
+            Dbpaymentrollup.day == key["day"],
+            Dbpaymentrollup.status == key["status"],
+            Dbpaymentrollup.hotel_id == key["hotel_id"],
+        )
+        .with_for_update()
+    )
+    rollup = rollup_query.first()
+    if rollup is None:
+        # The first payments for a key may race: only one row is inserted
+        insert_if_missing(
+            db,
+            Dbpaymentrollup,
+            {**key, "payment_count": 0, "amount_sum": Decimal("0")},
+        )
+        rollup = rollup_query.one()
+
+    rollup.payment_count += sign
+    rollup.amount_sum += sign * Decimal(db_payment.amount)
+
+
+def rebuild_payment_rollups(db: Session, start_date: Optional[date] = None) -> int:
+    """Recompute rollups from the payments (all days, or from start_date on)"""
+    rollups = db.query(Dbpaymentrollup)
+    totals = (
+        db.query(
+            Dbpayment.payment_date,
+            Dbpayment.status,
+            Dbbooking.hotel_id,
+            func.count(Dbpayment.id),
+            func.sum(Dbpayment.amount),
+        )
+        .join(Dbbooking, Dbbooking.id == Dbpayment.booking_id)
+    )
+    if start_date is not None:
+        rollups = rollups.filter(Dbpaymentrollup.day >= start_date)
+        totals = totals.filter(Dbpayment.payment_date >= start_date)
+
+    rollups.delete(synchronize_session=False)
+
+    rows = totals.group_by(
+        Dbpayment.payment_date, Dbpayment.status, Dbbooking.hotel_id
+    ).all()
+    db.add_all(
+        Dbpaymentrollup(
+            day=day,
+            status=status,
+            hotel_id=hotel_id,
+            payment_count=count,
+            amount_sum=amount_sum,
+        )
+        for day, status, hotel_id, count, amount_sum in rows
+    )
+    db.commit()
+    return len(rows)
+
+
+def reconcile_recent_payment_rollups(db: Session, days: int = 7) -> int:
+    # Full backfill the first time, then only the window where payments still change
+    if db.query(Dbpaymentrollup).first() is None:
+        return rebuild_payment_rollups(db)
+    return rebuild_payment_rollups(db, start_date=date.today() - timedelta(days=days))
+
+
+def payment_report(
+    db: Session,
+    group_by: List[str],
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    status: Optional[PaymentStatus] = None,
+    hotel_id: Optional[int] = None,
+):
+    columns = {
+        "day": Dbpaymentrollup.day,
+        "status": Dbpaymentrollup.status,
+        "hotel": Dbpaymentrollup.hotel_id,
+    }
+    group_columns = [columns[name] for name in group_by]
+
+    query = db.query(
+        *group_columns,
+        func.sum(Dbpaymentrollup.payment_count),
+        func.sum(Dbpaymentrollup.amount_sum),
+    )
+    if start_date:
+        query = query.filter(Dbpaymentrollup.day >= start_date)
+    if end_date:
+        query = query.filter(Dbpaymentrollup.day <= end_date)
+    if status:
+        query = query.filter(Dbpaymentrollup.status == status.value)
+    if hotel_id:
+        query = query.filter(Dbpaymentrollup.hotel_id == hotel_id)
+
+    report = []
+    for row in query.group_by(*group_columns).order_by(*group_columns):
+        values = dict(zip(group_by, row))
+        status_value = values.get("status")
+        report.append(
+            {
+                "day": values.get("day"),
+                "status": getattr(status_value, "value", status_value),
+                "hotel_id": values.get("hotel"),
+                "payment_count": row[-2] or 0,
+                "amount_sum": row[-1] or Decimal("0"),
+            }
+        )
+    return report
+
+
 def get_payment_by_booking(db: Session, booking_id: int):
     return db.query(Dbpayment).filter(Dbpayment.booking_id == booking_id).first()
 
@@ -38,6 +319,7 @@ def search_payments(
     end_date: Optional[date] = None,
     min_amount: Optional[Decimal] = None,
     max_amount: Optional[Decimal] = None,
+    refund_needed: Optional[bool] = None,
 ) -> List[Dbpayment]:
     query = db.query(Dbpayment)
 
@@ -62,4 +344,7 @@ def search_payments(
     if max_amount:
         query = query.filter(Dbpayment.amount <= max_amount)
 
+    if refund_needed is not None:
+        query = query.filter(Dbpayment.refund_needed == refund_needed)
+
     return query.all()
\ No newline at end of file
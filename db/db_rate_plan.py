@@ -0,0 +1,125 @@
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal, ROUND_HALF_UP
+from typing import Dict, List, Optional
+from sqlalchemy.orm import Session
+from db.models import Dbrateplan, Dbroom, IsActive
+from schemas import RatePlanBase
+
+
+WEEKEND_NIGHTS = (4, 5)  # Friday and Saturday nights
+CENT = Decimal("0.01")
+
+
+def create_rate_plan(db: Session, request: RatePlanBase) -> Dbrateplan:
+    rate_plan = Dbrateplan(**request.dict())
+    db.add(rate_plan)
+    db.commit()
+    db.refresh(rate_plan)
+    return rate_plan
+
+
+def get_rate_plan(db: Session, rate_plan_id: int) -> Optional[Dbrateplan]:
+    return (
+        db.query(Dbrateplan)
+        .filter(Dbrateplan.id == rate_plan_id, Dbrateplan.is_active != IsActive.deleted)
+        .first()
+    )
+
+
+def get_rate_plans_by_hotel(db: Session, hotel_id: int) -> List[Dbrateplan]:
+    return (
+        db.query(Dbrateplan)
+        .filter(
+            Dbrateplan.hotel_id == hotel_id, Dbrateplan.is_active != IsActive.deleted
+        )
+        .order_by(Dbrateplan.id)
+        .all()
+    )
+
+
+def delete_rate_plan(db: Session, rate_plan_id: int) -> Optional[Dbrateplan]:
+    rate_plan = get_rate_plan(db, rate_plan_id)
+    if rate_plan:
+        rate_plan.is_active = IsActive.deleted
+        db.commit()
+    return rate_plan
+
+
+# ------------------------------------------------------------------------------------------
+# Quote engine
+
+
+def covers(plan: Dbrateplan, night: date) -> bool:
+    if plan.start_date is None:
+        return True
+    return plan.start_date <= night <= plan.end_date
+
+
+def plan_priority(plan: Dbrateplan):
+    # Room-specific beats hotel-wide, seasonal beats all-year, newest wins ties
+    return (plan.room_id is not None, plan.start_date is not None, plan.id)
+
+
+def quote_stays(
+    db: Session, rooms: List[Dbroom], check_in_date: date, check_out_date: date
+) -> Dict[int, Decimal]:
+    """
+    Price one stay for many rooms at once. All plans for the rooms' hotels are
+    read in a single query; the nightly rate for each (night, room) pair is then
+    the base price times the best matching season and weekend multipliers, and
+    the best length-of-stay discount is applied to the total.
+    """
+    total_nights = (check_out_date - check_in_date).days
+    if total_nights <= 0 or not rooms:
+        return {}
+
+    hotel_ids = {room.hotel_id for room in rooms}
+    plans_by_hotel = defaultdict(list)
+    for plan in (
+        db.query(Dbrateplan)
+        .filter(
+            Dbrateplan.hotel_id.in_(hotel_ids),
+            Dbrateplan.is_active == IsActive.active,
+        )
+        .all()
+    ):
+        plans_by_hotel[plan.hotel_id].append(plan)
+
+    nights = [check_in_date + timedelta(days=i) for i in range(total_nights)]
+    quotes = {}
+
+    for room in rooms:
+        room_plans = [
+            plan
+            for plan in plans_by_hotel[room.hotel_id]
+            if plan.room_id is None or plan.room_id == room.id
+        ]
+
+        total = Decimal("0")
+        for night in nights:
+            nightly = Decimal(room.price_per_night)
+            applicable = [plan for plan in room_plans if covers(plan, night)]
+            if applicable:
+                plan = max(applicable, key=plan_priority)
+                nightly *= plan.season_multiplier
+                if night.weekday() in WEEKEND_NIGHTS:
+                    nightly *= plan.weekend_multiplier
+            total += nightly
+
+        # Length-of-stay discounts are chosen by the check-in night's season
+        discount = max(
+            (
+                plan.los_discount_percent
+                for plan in room_plans
+                if plan.los_min_nights is not None
+                and plan.los_min_nights <= total_nights
+                and covers(plan, check_in_date)
+            ),
+            default=Decimal("0"),
+        )
+        total *= 1 - Decimal(discount) / 100
+
+        quotes[room.id] = total.quantize(CENT, rounding=ROUND_HALF_UP)
+
+    return quotes
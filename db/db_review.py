@@ -1,9 +1,15 @@
+from collections import defaultdict
+from textwrap import shorten
 from sqlalchemy.orm import Session
 from schemas import IsReviewStatus, ReviewCreate
-from sqlalchemy import func
-from db.models import Dbreview, Dbhotel, Dbuser, Dbbooking
-from typing import Optional, List
-from datetime import date
+from sqlalchemy import case, exists, func
+from decimal import Decimal, ROUND_HALF_UP
+from db.models import Dbreview, Dbhotel, Dbuser, Dbbooking, Dbreviewsummary, IsActive
+from db.loading import with_profile
+from db.db_notification import notify_owner
+from db.database import insert_if_missing
+from typing import Dict, Optional, List
+from datetime import date, timedelta
 
 
 # ------------------------------------------------------------------------------------------
@@ -18,40 +24,325 @@ def create_review(db: Session, request: ReviewCreate):
         status=IsReviewStatus.pending,
     )
     db.add(db_review)
+    apply_summary_change(
+        db, request.hotel_id, None, None, IsReviewStatus.pending, request.rating
+    )
+    notify_owner(
+        db,
+        request.hotel_id,
+        "review_posted",
+        {"rating": str(request.rating), "comment": shorten(request.comment or "", 200)},
+    )
     db.commit()
     db.refresh(db_review)
     return db_review
 
 
+def status_value(status) -> Optional[str]:
+    # Accepts the model enum, the schema enum or a raw string
+    return getattr(status, "value", status)
+
+
+def is_confirmed(status) -> bool:
+    return status_value(status) == IsReviewStatus.confirmed.value
+
+
+def rating_delta(old_status, old_rating, new_status, new_rating):
+    delta_sum = Decimal("0")
+    delta_count = 0
+    if is_confirmed(old_status):
+        delta_sum -= Decimal(str(old_rating))
+        delta_count -= 1
+    if is_confirmed(new_status):
+        delta_sum += Decimal(str(new_rating))
+        delta_count += 1
+    return delta_sum, delta_count
+
+
+def apply_rating_change(
+    db: Session,
+    hotel_id: int,
+    old_status,
+    old_rating: Optional[Decimal],
+    new_status,
+    new_rating: Optional[Decimal],
+):
+    """
+    Move the hotel's running rating totals by one review transition. Does not
+    commit: the caller commits it together with the review change.
+    """
+    delta_sum, delta_count = rating_delta(
+        old_status, old_rating, new_status, new_rating
+    )
+    shift_rating_totals(db, hotel_id, delta_sum, delta_count)
+
+
+def shift_rating_totals(
+    db: Session, hotel_id: int, delta_sum: Decimal, delta_count: int
+):
+    if delta_count == 0 and delta_sum == 0:
+        return
+
+    # Single UPDATE; the right-hand sides all see the pre-update row
+    new_sum = func.coalesce(Dbhotel.rating_sum, 0) + delta_sum
+    new_count = func.coalesce(Dbhotel.rating_count, 0) + delta_count
+    db.query(Dbhotel).filter(Dbhotel.id == hotel_id).update(
+        {
+            Dbhotel.rating_sum: new_sum,
+            Dbhotel.rating_count: new_count,
+            Dbhotel.avg_review_score: case(
+                (new_count > 0, func.round(new_sum / new_count, 2)), else_=None
+            ),
+        },
+        synchronize_session=False,
+    )
+
+
+def reconcile_hotel_ratings(db: Session, hotel_ids: Optional[List[int]] = None) -> int:
+    """Recompute rating totals from the reviews and repair drifted hotels"""
+    totals_query = db.query(
+        Dbreview.hotel_id, func.sum(Dbreview.rating), func.count(Dbreview.id)
+    ).filter(Dbreview.status == IsReviewStatus.confirmed)
+    hotels_query = db.query(
+        Dbhotel.id,
+        Dbhotel.rating_sum,
+        Dbhotel.rating_count,
+        Dbhotel.avg_review_score,
+    )
+    if hotel_ids is not None:
+        totals_query = totals_query.filter(Dbreview.hotel_id.in_(hotel_ids))
+        hotels_query = hotels_query.filter(Dbhotel.id.in_(hotel_ids))
+
+    totals = {
+        hotel_id: (total, count)
+        for hotel_id, total, count in totals_query.group_by(Dbreview.hotel_id).all()
+    }
+
+    repaired = 0
+    for hotel_id, rating_sum, rating_count, avg_review_score in hotels_query.all():
+        total, count = totals.get(hotel_id, (Decimal("0"), 0))
+        avg_rating = round(Decimal(total) / count, 2) if count else None
+
+        if (
+            Decimal(rating_sum or 0) != Decimal(total)
+            or (rating_count or 0) != count
+            or avg_review_score != avg_rating
+        ):
+            db.query(Dbhotel).filter(Dbhotel.id == hotel_id).update(
+                {
+                    Dbhotel.rating_sum: total,
+                    Dbhotel.rating_count: count,
+                    Dbhotel.avg_review_score: avg_rating,
+                },
+                synchronize_session=False,
+            )
+            repaired += 1
+
+    db.commit()
+    return repaired
+
+
 def update_avg_review_score(db: Session, hotel_id: int):
-    total_rating, count = (
-        db.query(func.sum(Dbreview.rating), func.count(Dbreview.rating))
-        .filter(
-            Dbreview.hotel_id == hotel_id, Dbreview.status == IsReviewStatus.confirmed
-        )
+    # Full recompute for one hotel; routine changes go through apply_rating_change
+    reconcile_hotel_ratings(db, [hotel_id])
+
+
+# ------------------------------------------------------------------------------------------
+# per-hotel review summary (star histogram, status counts, recent counts)
+def star_bucket(rating) -> int:
+    stars = int(Decimal(str(rating)).quantize(Decimal("1"), rounding=ROUND_HALF_UP))
+    return min(5, max(1, stars))
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def roll_month(summary: Dbreviewsummary, today: date):
+    """Shift the recent counters if the stored month is no longer current"""
+    this_month = month_start(today)
+    if summary.current_month == this_month:
+        return
+    last_month = month_start(this_month - timedelta(days=1))
+    if summary.current_month == last_month:
+        summary.reviews_last_month = summary.reviews_this_month or 0
+    else:
+        summary.reviews_last_month = 0
+    summary.reviews_this_month = 0
+    summary.current_month = this_month
+
+
+def get_or_create_summary(db: Session, hotel_id: int) -> Dbreviewsummary:
+    summary = (
+        db.query(Dbreviewsummary)
+        .filter(Dbreviewsummary.hotel_id == hotel_id)
+        .with_for_update()
         .first()
     )
+    if summary is None:
+        # Two first reviews of a hotel may get here together: only one row is
+        # inserted, and both then wait on its lock
+        values = {
+            column.name: 0
+            for column in Dbreviewsummary.__table__.columns
+            if column.name not in ("hotel_id", "current_month")
+        }
+        insert_if_missing(db, Dbreviewsummary, {"hotel_id": hotel_id, **values})
+        summary = (
+            db.query(Dbreviewsummary)
+            .filter(Dbreviewsummary.hotel_id == hotel_id)
+            .with_for_update()
+            .one()
+        )
+    return summary
+
+
+def apply_summary_change(
+    db: Session, hotel_id: int, old_status, old_rating, new_status, new_rating
+):
+    """
+    Move one review between status counts and star buckets. A None old_status
+    means a newly submitted review. Does not commit.
+    """
+    summary = get_or_create_summary(db, hotel_id)
+
+    if old_status is None:
+        roll_month(summary, date.today())
+        summary.reviews_this_month += 1
+    move_review_in_summary(summary, old_status, old_rating, new_status, new_rating)
+
+
+def move_review_in_summary(
+    summary: Dbreviewsummary, old_status, old_rating, new_status, new_rating
+):
+    if old_status is not None:
+        column = f"{status_value(old_status)}_count"
+        setattr(summary, column, getattr(summary, column) - 1)
+        if is_confirmed(old_status):
+            column = f"stars_{star_bucket(old_rating)}"
+            setattr(summary, column, getattr(summary, column) - 1)
+
+    column = f"{status_value(new_status)}_count"
+    setattr(summary, column, getattr(summary, column) + 1)
+    if is_confirmed(new_status):
+        column = f"stars_{star_bucket(new_rating)}"
+        setattr(summary, column, getattr(summary, column) + 1)
+
+
+def record_review_transition(
+    db: Session, hotel_id: int, old_status, old_rating, new_status, new_rating
+):
+    apply_rating_change(db, hotel_id, old_status, old_rating, new_status, new_rating)
+    apply_summary_change(db, hotel_id, old_status, old_rating, new_status, new_rating)
+
+
+def rebuild_review_summaries(
+    db: Session, hotel_ids: Optional[List[int]] = None
+) -> int:
+    """Recompute summaries from the review table (backfill and drift repair)"""
+    this_month = month_start(date.today())
+    last_month = month_start(this_month - timedelta(days=1))
+
+    status_query = db.query(Dbreview.hotel_id, Dbreview.status, func.count(Dbreview.id))
+    stars_query = db.query(
+        Dbreview.hotel_id, func.round(Dbreview.rating), func.count(Dbreview.id)
+    ).filter(Dbreview.status == IsReviewStatus.confirmed)
+    recent_query = db.query(
+        Dbreview.hotel_id,
+        func.count(Dbreview.id).filter(Dbreview.created_at >= this_month),
+        func.count(Dbreview.id).filter(
+            Dbreview.created_at >= last_month, Dbreview.created_at < this_month
+        ),
+    )
+    if hotel_ids is not None:
+        status_query = status_query.filter(Dbreview.hotel_id.in_(hotel_ids))
+        stars_query = stars_query.filter(Dbreview.hotel_id.in_(hotel_ids))
+        recent_query = recent_query.filter(Dbreview.hotel_id.in_(hotel_ids))
+
+    rows = {}
+
+    def row_for(hotel_id):
+        if hotel_id not in rows:
+            rows[hotel_id] = {"current_month": this_month}
+        return rows[hotel_id]
+
+    for hotel_id, status, count in status_query.group_by(
+        Dbreview.hotel_id, Dbreview.status
+    ):
+        row_for(hotel_id)[f"{status_value(status)}_count"] = count
+
+    for hotel_id, stars, count in stars_query.group_by(
+        Dbreview.hotel_id, func.round(Dbreview.rating)
+    ):
+        key = f"stars_{star_bucket(stars)}"
+        row = row_for(hotel_id)
+        row[key] = row.get(key, 0) + count
+
+    for hotel_id, this_count, last_count in recent_query.group_by(Dbreview.hotel_id):
+        row = row_for(hotel_id)
+        row["reviews_this_month"] = this_count
+        row["reviews_last_month"] = last_count
+
+    for hotel_id, values in rows.items():
+        summary = get_or_create_summary(db, hotel_id)
+        for column in Dbreviewsummary.__table__.columns:
+            if column.name != "hotel_id":
+                setattr(summary, column.name, values.get(column.name, 0))
 
-    if count:
-        avg_rating = round(total_rating / count, 2)
-    else:
-        avg_rating = None  # No confirmed reviews yet
+    db.commit()
+    return len(rows)
 
-    hotel = db.query(Dbhotel).filter(Dbhotel.id == hotel_id).first()
-    if hotel:
-        hotel.avg_review_score = avg_rating
-        db.commit()
+
+def get_review_summary(db: Session, hotel_id: int) -> Optional[dict]:
+    row = (
+        db.query(Dbhotel.avg_review_score, Dbreviewsummary)
+        .outerjoin(Dbreviewsummary, Dbreviewsummary.hotel_id == Dbhotel.id)
+        .filter(Dbhotel.id == hotel_id, Dbhotel.is_active != IsActive.deleted)
+        .first()
+    )
+    if row is None:
+        return None
+
+    avg_review_score, summary = row
+    if summary is None:
+        summary = Dbreviewsummary(hotel_id=hotel_id)
+
+    # Adjust a stale month on read; the row itself is fixed on the next review
+    this_month = month_start(date.today())
+    this_month_count = summary.reviews_this_month or 0
+    last_month_count = summary.reviews_last_month or 0
+    if summary.current_month != this_month:
+        last_month = month_start(this_month - timedelta(days=1))
+        if summary.current_month == last_month:
+            last_month_count = this_month_count
+        else:
+            last_month_count = 0
+        this_month_count = 0
+
+    return {
+        "hotel_id": hotel_id,
+        "average": avg_review_score,
+        "distribution": {
+            stars: getattr(summary, f"stars_{stars}") or 0 for stars in range(1, 6)
+        },
+        "status_counts": {
+            status.value: getattr(summary, f"{status.value}_count") or 0
+            for status in IsReviewStatus
+        },
+        "reviews_this_month": this_month_count,
+        "reviews_last_month": last_month_count,
+    }
 
 
 # ------------------------------------------------------------------------------------------
 # get review by review_id
 def get_review_by_review_id(db: Session, review_id: int):
-    return (
+    query = (
         db.query(Dbreview)
         .filter(Dbreview.id == review_id)
         .filter(Dbreview.status != "deleted")
-        .first()
     )
+    return with_profile(query, "review_detail").first()
 
 
 # ------------------------------------------------------------------------------------------
@@ -97,51 +388,41 @@ def get_filtered_reviews(
     if search is not None:
         query = query.filter(Dbreview.comment.ilike(f"%{search}%"))
 
-    return query.all()
-
-
-# Helper functions for existence checks
-def user_exists(db: Session, user_id: int) -> bool:
-    return db.query(Dbuser).filter(Dbuser.id == user_id).first() is not None
-
+    return with_profile(query, "review_list").all()
 
-def hotel_exists(db: Session, hotel_id: int) -> bool:
-    return db.query(Dbhotel).filter(Dbhotel.id == hotel_id).first() is not None
-
-
-def booking_exists(db: Session, booking_id: int) -> bool:
-    return db.query(Dbbooking).filter(Dbbooking.id == booking_id).first() is not None
-
-
-def review_exists_for_user_and_hotel(db: Session, user_id: int, hotel_id: int) -> bool:
-    return (
-        db.query(Dbreview)
-        .filter(Dbreview.user_id == user_id, Dbreview.hotel_id == hotel_id)
-        .first()
-        is not None
-    )
-
-
-def review_exists_for_user_and_booking(
-    db: Session, user_id: int, booking_id: int
-) -> bool:
-    return (
-        db.query(Dbreview)
-        .filter(Dbreview.user_id == user_id, Dbreview.booking_id == booking_id)
-        .first()
-        is not None
-    )
 
+# All existence and ownership checks for a review filter, in one SELECT of
+# EXISTS(...) columns. Only the checks that apply to the given filters are run.
+def review_filter_diagnostics(
+    db: Session,
+    user_id: Optional[int] = None,
+    hotel_id: Optional[int] = None,
+    booking_id: Optional[int] = None,
+) -> dict:
+    checks = {}
+    if user_id is not None:
+        checks["user_exists"] = exists().where(Dbuser.id == user_id)
+    if hotel_id is not None:
+        checks["hotel_exists"] = exists().where(Dbhotel.id == hotel_id)
+    if booking_id is not None:
+        checks["booking_exists"] = exists().where(Dbbooking.id == booking_id)
+    if user_id is not None and hotel_id is not None:
+        checks["review_for_user_and_hotel"] = exists().where(
+            Dbreview.user_id == user_id, Dbreview.hotel_id == hotel_id
+        )
+    if user_id is not None and booking_id is not None:
+        checks["booking_belongs_to_user"] = exists().where(
+            Dbbooking.id == booking_id, Dbbooking.user_id == user_id
+        )
+        checks["review_for_user_and_booking"] = exists().where(
+            Dbreview.user_id == user_id, Dbreview.booking_id == booking_id
+        )
 
-def booking_belongs_to_user(db: Session, user_id: int, booking_id: int) -> bool:
-    from db.models import Dbbooking
+    if not checks:
+        return {}
 
-    return (
-        db.query(Dbbooking)
-        .filter(Dbbooking.id == booking_id, Dbbooking.user_id == user_id)
-        .first()
-        is not None
-    )
+    row = db.query(*[check.label(name) for name, check in checks.items()]).one()
+    return {name: bool(value) for name, value in row._mapping.items()}
 
 
 # ------------------------------------------------------------------------------------------
@@ -153,9 +434,14 @@ def update_review_by_id(
     new_comment: Optional[str],
     new_status: Optional[str] = None,
 ) -> Optional[Dbreview]:
-    review = db.query(Dbreview).filter(Dbreview.id == review_id).first()
+    # Locked, so a concurrent update cannot apply its aggregate delta from the
+    # same old status and rating
+    review = (
+        db.query(Dbreview).filter(Dbreview.id == review_id).with_for_update().first()
+    )
     if not review:
         return None
+    old_status, old_rating = review.status, review.rating
     if new_rating is not None:
         review.rating = new_rating
     if new_comment is not None:
@@ -163,6 +449,9 @@ def update_review_by_id(
     if new_status is not None:
         review.status = new_status
 
+    record_review_transition(
+        db, review.hotel_id, old_status, old_rating, review.status, review.rating
+    )
     db.commit()
     db.refresh(review)
     return review
@@ -171,8 +460,89 @@ def update_review_by_id(
 # ------------------------------------------------------------------------------------------
 # delet a review
 def soft_delete_review_by_id(db: Session, review_id: int):
-    review = db.query(Dbreview).filter(Dbreview.id == review_id).first()
+    review = (
+        db.query(Dbreview).filter(Dbreview.id == review_id).with_for_update().first()
+    )
     if review:
+        record_review_transition(
+            db,
+            review.hotel_id,
+            review.status,
+            review.rating,
+            IsReviewStatus.deleted,
+            None,
+        )
         review.status = IsReviewStatus.deleted
         db.commit()
     return review
+
+
+# ------------------------------------------------------------------------------------------
+# bulk moderation
+MODERATION_CHUNK_SIZE = 1000  # Keeps IN (...) lists under driver parameter limits
+
+
+def chunked(items: list, size: int = MODERATION_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def moderate_reviews(db: Session, decisions: Dict[int, str]) -> Dict[int, str]:
+    """
+    Apply review_id -> status decisions with one UPDATE per target status, then
+    move each affected hotel's aggregates once. Returns review_id -> outcome
+    ("updated", "unchanged", "not_found" or "deleted").
+
+    The reviews are locked until the commit, so the old statuses the deltas
+    are computed from cannot change underneath. Rows are locked in id order
+    and summaries in hotel order, so concurrent moderations cannot deadlock.
+    """
+    current = {}
+    for chunk in chunked(sorted(decisions)):
+        for review_id, hotel_id, status, rating in (
+            db.query(Dbreview.id, Dbreview.hotel_id, Dbreview.status, Dbreview.rating)
+            .filter(Dbreview.id.in_(chunk))
+            .order_by(Dbreview.id)
+            .with_for_update()
+        ):
+            current[review_id] = (hotel_id, status, rating)
+
+    outcomes = {}
+    ids_by_status = defaultdict(list)
+    moves_by_hotel = defaultdict(list)
+
+    for review_id, new_status in decisions.items():
+        if review_id not in current:
+            outcomes[review_id] = "not_found"
+            continue
+
+        hotel_id, old_status, rating = current[review_id]
+        if status_value(old_status) == IsReviewStatus.deleted.value:
+            outcomes[review_id] = "deleted"
+        elif status_value(old_status) == new_status:
+            outcomes[review_id] = "unchanged"
+        else:
+            ids_by_status[new_status].append(review_id)
+            moves_by_hotel[hotel_id].append((old_status, rating, new_status))
+            outcomes[review_id] = "updated"
+
+    for new_status, review_ids in ids_by_status.items():
+        for chunk in chunked(review_ids):
+            db.query(Dbreview).filter(Dbreview.id.in_(chunk)).update(
+                {Dbreview.status: new_status}, synchronize_session=False
+            )
+
+    for hotel_id, moves in sorted(moves_by_hotel.items()):
+        summary = get_or_create_summary(db, hotel_id)
+        total_sum, total_count = Decimal("0"), 0
+        for old_status, rating, new_status in moves:
+            delta_sum, delta_count = rating_delta(
+                old_status, rating, new_status, rating
+            )
+            total_sum += delta_sum
+            total_count += delta_count
+            move_review_in_summary(summary, old_status, rating, new_status, rating)
+        shift_rating_totals(db, hotel_id, total_sum, total_count)
+
+    db.commit()
+    return outcomes
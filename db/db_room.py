@@ -1,12 +1,14 @@
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, with_expression
 from db.models import Dbroom, IsActive, Dbbooking, Dbhotel, IsRoomStatus
-from schemas import RoomUpdate, RoomCreate
-from sqlalchemy import or_
+from db.models import room_status_at
+from schemas import RoomUpdate, RoomCreate, SearchSort
+from sqlalchemy import or_, func, case, literal
 from decimal import Decimal
 from typing import Optional, List
 from fastapi import HTTPException
 from datetime import date
 from db.models import Dbuser
+from db.loading import with_profile
 
 
 # Create a Room
@@ -27,7 +29,9 @@ def create_room(db: Session, request: RoomCreate) -> Dbroom:
         )
 
     try:
-        new_room = Dbroom(**request.dict())
+        room_data = request.dict()
+        room_data["service_status"] = room_data.pop("status")
+        new_room = Dbroom(**room_data)
         db.add(new_room)
         db.commit()
         db.refresh(new_room)
@@ -58,7 +62,7 @@ def delete_room(db: Session, room_id: int):
         return None
 
     room.is_active = IsActive.deleted
-    room.status = IsRoomStatus.unavailable
+    room.service_status = IsRoomStatus.unavailable
     db.commit()
     return room
 
@@ -69,6 +73,8 @@ def update_room(db: Session, room_id: int, request: RoomUpdate):
     if not room:
         return None
     for field, value in request.dict(exclude_unset=True).items():
+        if field == "status":
+            field = "service_status"  # Booked/available follow the bookings
         setattr(room, field, value)
     db.commit()
     db.refresh(room)
@@ -77,7 +83,7 @@ def update_room(db: Session, room_id: int, request: RoomUpdate):
 
 #############
 def get_room(db: Session, room_id: int):
-    return (
+    query = (
         db.query(Dbroom)
         .join(Dbhotel)
         .join(Dbuser)
@@ -87,8 +93,8 @@ def get_room(db: Session, room_id: int):
             Dbhotel.is_active != IsActive.deleted,
             Dbuser.status != IsActive.deleted,  # Exclude deleted hotel owners
         )
-        .first()
     )
+    return with_profile(query, "room_detail").first()
 
 
 def get_rooms_by_hotel(
@@ -97,19 +103,86 @@ def get_rooms_by_hotel(
     status: Optional[str] = None,
     skip: int = 0,
     limit: int = 100,
+    on_date: Optional[date] = None,
 ):
-    query = db.query(Dbroom).filter(
-        Dbroom.hotel_id == hotel_id,
-        Dbroom.is_active
-        != IsActive.deleted,  # ✅ include active/inactive, exclude deleted
+    # Status as of on_date (default today), computed from the bookings
+    room_status = room_status_at(on_date or date.today())
+    query = (
+        db.query(Dbroom)
+        .filter(
+            Dbroom.hotel_id == hotel_id,
+            Dbroom.is_active
+            != IsActive.deleted,  # ✅ include active/inactive, exclude deleted
+        )
+        .options(with_expression(Dbroom.status, room_status))
     )
 
     if status:
-        query = query.filter(Dbroom.status == status)
+        query = query.filter(room_status == status)
 
     return query.offset(skip).limit(limit).all()
 
 
+# Facet buckets shown next to room search results
+FACET_AMENITIES = ["wifi", "air_conditioner", "tv"]
+FACET_PRICE_BUCKETS = [
+    ("0-50", None, Decimal("50")),
+    ("50-100", Decimal("50"), Decimal("100")),
+    ("100-200", Decimal("100"), Decimal("200")),
+    ("200+", Decimal("200"), None),
+]
+FACET_BED_COUNTS = [("1", 1, 2), ("2", 2, 3), ("3", 3, 4), ("4+", 4, None)]
+
+
+# Price at which a rating counts half: 4.5 stars at 100 scores like 2.25 stars at 0
+BEST_VALUE_PRICE_SMOOTHING = 100
+
+
+def best_value_score(rating, price):
+    """SQL expression mixing rating and price; unrated hotels count as 0."""
+    return (
+        func.coalesce(rating, 0)
+        * BEST_VALUE_PRICE_SMOOTHING
+        / (price + BEST_VALUE_PRICE_SMOOTHING)
+    )
+
+
+def room_sort_order(sort: SearchSort, search_term: Optional[str] = None):
+    if sort == SearchSort.price_asc:
+        return [Dbroom.price_per_night.asc(), Dbroom.id.asc()]
+    if sort == SearchSort.price_desc:
+        return [Dbroom.price_per_night.desc(), Dbroom.id.asc()]
+    if sort == SearchSort.rating:
+        return [Dbhotel.avg_review_score.desc().nulls_last(), Dbroom.id.asc()]
+    if sort == SearchSort.newest:
+        return [Dbroom.id.desc()]
+    if sort == SearchSort.best_value:
+        return [
+            best_value_score(Dbhotel.avg_review_score, Dbroom.price_per_night).desc(),
+            Dbroom.id.asc(),
+        ]
+
+    # Relevance: exact room number, then prefix, then anything else by rating
+    if search_term:
+        term = search_term.strip()
+        rank = case(
+            (Dbroom.room_number.ilike(term), 0),
+            (Dbroom.room_number.ilike(f"{term}%"), 1),
+            else_=literal(2),
+        )
+        return [rank, Dbhotel.avg_review_score.desc().nulls_last(), Dbroom.id.asc()]
+    return [Dbhotel.avg_review_score.desc().nulls_last(), Dbroom.id.asc()]
+
+
+def range_condition(column, lower, upper):
+    conditions = []
+    if lower is not None:
+        conditions.append(column >= lower)
+    if upper is not None:
+        conditions.append(column < upper)  # Buckets are half-open: [lower, upper)
+    return conditions
+
+
 # Search a Room Using Different Filters
 def advanced_room_search(
     db: Session,
@@ -122,7 +195,56 @@ def advanced_room_search(
     check_in_date: Optional[date] = None,
     check_out_date: Optional[date] = None,
     hotel_id: Optional[int] = None,
+    sort: Optional[SearchSort] = None,
+    skip: int = 0,
+    limit: Optional[int] = None,
 ) -> List[Dbroom]:
+    query = build_room_search_query(
+        db=db,
+        search_term=search_term,
+        wifi=wifi,
+        air_conditioner=air_conditioner,
+        tv=tv,
+        min_price=min_price,
+        max_price=max_price,
+        check_in_date=check_in_date,
+        check_out_date=check_out_date,
+        hotel_id=hotel_id,
+    )
+    return apply_room_sort(query, sort, search_term, skip, limit).all()
+
+
+def apply_room_sort(
+    query,
+    sort: Optional[SearchSort] = None,
+    search_term: Optional[str] = None,
+    skip: int = 0,
+    limit: Optional[int] = None,
+):
+    query = with_profile(query, "room_search")
+
+    # ORDER BY + LIMIT lets the database return the top-k without sorting everything
+    if sort is not None:
+        query = query.order_by(*room_sort_order(sort, search_term))
+    if skip:
+        query = query.offset(skip)
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+
+def build_room_search_query(
+    db: Session,
+    search_term: Optional[str] = None,
+    wifi: Optional[bool] = None,
+    air_conditioner: Optional[bool] = None,
+    tv: Optional[bool] = None,
+    min_price: Optional[Decimal] = None,
+    max_price: Optional[Decimal] = None,
+    check_in_date: Optional[date] = None,
+    check_out_date: Optional[date] = None,
+    hotel_id: Optional[int] = None,
+):
     # Initial query: filter out deleted rooms, hotels, and hotel owners
     query = (
         db.query(Dbroom)
@@ -160,17 +282,58 @@ def advanced_room_search(
         query = query.filter(Dbroom.price_per_night <= max_price)
 
     if check_in_date and check_out_date:
-        overlapping_room_ids = [
-            booking.room_id
-            for booking in db.query(Dbbooking)
+        # Anti-join instead of loading every overlapping booking, so ORDER BY/LIMIT
+        # can be applied by the database
+        overlapping_booking = (
+            db.query(Dbbooking.id)
             .filter(
+                Dbbooking.room_id == Dbroom.id,
                 Dbbooking.is_active == IsActive.active,
                 Dbbooking.check_in_date < check_out_date,
                 Dbbooking.check_out_date > check_in_date,
             )
-            .all()
-        ]
-        if overlapping_room_ids:
-            query = query.filter(~Dbroom.id.in_(overlapping_room_ids))
+            .exists()
+        )
+        query = query.filter(~overlapping_booking)
+
+    return query
+
+
+def room_search_facets(db: Session, query) -> dict:
+    """
+    Count amenities, price buckets and bed counts for a room search query
+    in one aggregate statement (COUNT(*) FILTER (WHERE ...) per facet).
+    """
+    columns = [func.count(Dbroom.id).label("total")]
+
+    for amenity in FACET_AMENITIES:
+        columns.append(
+            func.count(Dbroom.id)
+            .filter(getattr(Dbroom, amenity).is_(True))
+            .label(f"amenity_{amenity}")
+        )
+
+    for label, lower, upper in FACET_PRICE_BUCKETS:
+        conditions = range_condition(Dbroom.price_per_night, lower, upper)
+        columns.append(
+            func.count(Dbroom.id).filter(*conditions).label(f"price_{label}")
+        )
+
+    for label, lower, upper in FACET_BED_COUNTS:
+        conditions = range_condition(Dbroom.bed_count, lower, upper)
+        columns.append(
+            func.count(Dbroom.id).filter(*conditions).label(f"beds_{label}")
+        )
+
+    row = query.with_entities(*columns).one()._mapping
 
-    return query.all()
+    return {
+        "total": row["total"],
+        "amenities": {
+            amenity: row[f"amenity_{amenity}"] for amenity in FACET_AMENITIES
+        },
+        "price_buckets": {
+            label: row[f"price_{label}"] for label, _, _ in FACET_PRICE_BUCKETS
+        },
+        "bed_count": {label: row[f"beds_{label}"] for label, _, _ in FACET_BED_COUNTS},
+    }
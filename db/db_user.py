@@ -1,5 +1,8 @@
+import re
+from typing import Dict, List, Optional, Set
+from sqlalchemy import case, func, insert, or_
 from sqlalchemy.orm import Session
-from db.models import Dbuser
+from db.models import Dbuser, IsActive
 from schemas import UserUpdate, UserBase
 from .Hash import Hash
 
@@ -87,3 +90,119 @@ def update_user(
 def get_user(db: Session, user_id: int) -> Dbuser:
     """Get user by ID"""
     return db.query(Dbuser).filter(Dbuser.id == user_id).first()
+
+
+# ------------------------------------------------------------------------------------------
+# Admin search
+
+EMAIL_SHAPE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
+PHONE_SHAPE = re.compile(r"^\+?\d{6,15}$")
+TRIGRAM_MIN_LENGTH = 3  # Shorter terms have no trigrams to match on
+
+
+def escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def starts_with(column, term: str):
+    """Case-insensitive prefix match that can use the lower(...) prefix indexes"""
+    return func.lower(column).like(f"{escape_like(term.lower())}%", escape="\\")
+
+
+def search_users(
+    db: Session,
+    search_term: Optional[str] = None,
+    username: Optional[str] = None,
+    email: Optional[str] = None,
+    phone_number: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 50,
+) -> List[Dbuser]:
+    """
+    Admin user search. A full email or phone number is looked up by equality;
+    other terms match username/email prefixes, plus trigram similarity on
+    PostgreSQL. Results are ranked exact, prefix, then fuzzy matches.
+    """
+    query = db.query(Dbuser).filter(Dbuser.status != IsActive.deleted)
+    order = []
+
+    # Specific filters
+    if username:
+        query = query.filter(starts_with(Dbuser.username, username.strip()))
+    if email:
+        query = query.filter(starts_with(Dbuser.email, email.strip()))
+    if phone_number:
+        query = query.filter(
+            Dbuser.phone_number.startswith(phone_number.strip(), autoescape=True)
+        )
+
+    term = (search_term or "").strip()
+
+    # Fast paths: one unique-index probe, and no ranking needed
+    if EMAIL_SHAPE.match(term):
+        exact = query.filter(func.lower(Dbuser.email) == term.lower())
+        if skip == 0 and exact.first():
+            return exact.all()
+    elif PHONE_SHAPE.match(term):
+        exact = query.filter(Dbuser.phone_number == term)
+        if skip == 0 and exact.first():
+            return exact.all()
+        query = query.filter(Dbuser.phone_number.startswith(term, autoescape=True))
+        return query.order_by(Dbuser.phone_number).offset(skip).limit(limit).all()
+
+    if term:
+        lowered = term.lower()
+        matches = [starts_with(Dbuser.username, term), starts_with(Dbuser.email, term)]
+        rank = case(
+            (func.lower(Dbuser.username) == lowered, 0),
+            (func.lower(Dbuser.email) == lowered, 0),
+            (matches[0], 1),
+            (matches[1], 2),
+            else_=3,
+        )
+        order.append(rank)
+
+        fuzzy = db.bind.dialect.name == "postgresql" and len(term) >= TRIGRAM_MIN_LENGTH
+        if fuzzy:
+            # `%` is pg_trgm's similarity operator, served by the GIN indexes
+            matches += [
+                func.lower(Dbuser.username).op("%")(lowered),
+                func.lower(Dbuser.email).op("%")(lowered),
+            ]
+            order.append(
+                func.greatest(
+                    func.similarity(func.lower(Dbuser.username), lowered),
+                    func.similarity(func.lower(Dbuser.email), lowered),
+                ).desc()
+            )
+        query = query.filter(or_(*matches))
+
+    return (
+        query.order_by(*order, Dbuser.username, Dbuser.id)
+        .offset(skip)
+        .limit(limit)
+        .all()
+    )
+
+
+# ------------------------------------------------------------------------------------------
+# Bulk import
+
+USER_UNIQUE_FIELDS = ("username", "email", "phone_number")
+
+
+def taken_user_values(db: Session, rows: List[dict]) -> Dict[str, Set[str]]:
+    """Which of the rows' usernames, emails and phone numbers already exist"""
+    taken = {}
+    for field in USER_UNIQUE_FIELDS:
+        column = getattr(Dbuser, field)
+        values = {row[field] for row in rows}
+        query = db.query(column).filter(column.in_(values))
+        taken[field] = {value for (value,) in query}
+    return taken
+
+
+def insert_users(db: Session, rows: List[dict]):
+    """One multi-row INSERT; rows carry hashed_password, not password"""
+    db.execute(insert(Dbuser), rows)
+    db.commit()
@@ -1,69 +1,30 @@
+import os
+import time
+from collections import defaultdict
 from typing import List, Optional
-from datetime import datetime
-import cloudinary.uploader
-from fastapi import HTTPException, status
+from datetime import datetime, timedelta
 
+from sqlalchemy import and_, exists, func, or_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
-from db.models import Dbuser, UploadedFile
+from db.models import (
+    Dbhotel,
+    Dbuser,
+    IsActive,
+    IsUploadStatus,
+    PendingStorageDeletion,
+    StoredObject,
+    UploadedFile,
+    UploadedFileChunk,
+)
+from storage import storage
 
 
-def upload_file(db: Session, user_id: int, file, folder: str = "user_uploads"):
-    try:
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(file.file, folder=folder)
-
-        # Save to database
-        db_file = UploadedFile(
-            user_id=user_id,
-            file_name=file.filename,
-            file_url=upload_result["secure_url"],
-            public_id=upload_result["public_id"],
-        )
-
-        db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
-
-        return db_file
-
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"File upload failed: {str(e)}",
-        )
-
-
-def delete_file(db: Session, file_id: int, user_id: int):
-    try:
-        # Get file from database
-        db_file = (
-            db.query(UploadedFile)
-            .filter(UploadedFile.id == file_id, UploadedFile.user_id == user_id)
-            .first()
-        )
-
-        if not db_file:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND, detail="File not found"
-            )
-
-        # Delete from Cloudinary
-        cloudinary.uploader.destroy(db_file.public_id)
-
-        # Delete from database
-        db.delete(db_file)
-        db.commit()
-
-        return db_file
-
-    except Exception as e:
-        db.rollback()
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"File deletion failed: {str(e)}",
-        )
+DELETE_BATCH_SIZE = 100
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", 200))
+GC_PAUSE = float(os.getenv("GC_PAUSE_SECONDS", 1))
+UPLOAD_SESSION_TTL_HOURS = int(os.getenv("UPLOAD_SESSION_TTL_HOURS", 24))
 
 
 def get_file_by_id(db: Session, file_id: int):
@@ -80,7 +41,9 @@ def get_files_with_filters(
     uploaded_before: Optional[datetime] = None,
     uploaded_after: Optional[datetime] = None,
 ) -> List[UploadedFile]:
-    query = db.query(UploadedFile)
+    query = db.query(UploadedFile).filter(
+        UploadedFile.status == IsUploadStatus.complete
+    )
 
     # For non-superusers, they can only see their own files
     if not current_user.is_superuser:
@@ -100,3 +63,422 @@ def get_files_with_filters(
         query = query.filter(UploadedFile.upload_date <= uploaded_before)
 
     return query.all()
+
+
+# Image renditions
+def get_image_by_url(db: Session, url: str) -> Optional[UploadedFile]:
+    """Uploaded image whose original or full rendition is at url"""
+    return (
+        db.query(UploadedFile)
+        .filter(
+            UploadedFile.status == IsUploadStatus.complete,
+            UploadedFile.thumbnail_url.isnot(None),
+            (UploadedFile.file_url == url) | (UploadedFile.full_url == url),
+        )
+        .first()
+    )
+
+
+# Chunked, resumable uploads
+def chunk_count(upload: UploadedFile) -> int:
+    return -(-upload.total_size // upload.chunk_size)  # Ceiling division
+
+
+def expected_chunk_size(upload: UploadedFile, chunk_index: int) -> Optional[int]:
+    """Byte length chunk_index must have, or None if the index is out of range"""
+    if chunk_index < 0 or chunk_index >= chunk_count(upload):
+        return None
+    return min(upload.chunk_size, upload.total_size - chunk_index * upload.chunk_size)
+
+
+def create_upload_session(
+    db: Session, user_id: int, file_name: str, total_size: int, chunk_size: int
+) -> UploadedFile:
+    upload = UploadedFile(
+        user_id=user_id,
+        file_name=file_name,
+        status=IsUploadStatus.uploading,
+        total_size=total_size,
+        chunk_size=chunk_size,
+        received_bytes=0,
+    )
+    db.add(upload)
+    db.commit()
+    db.refresh(upload)
+    return upload
+
+
+def get_upload_session(db: Session, upload_id: int, user_id: int):
+    return (
+        db.query(UploadedFile)
+        .filter(
+            UploadedFile.id == upload_id,
+            UploadedFile.user_id == user_id,
+            UploadedFile.status == IsUploadStatus.uploading,
+        )
+        .first()
+    )
+
+
+def received_chunk_indexes(db: Session, upload_id: int) -> List[int]:
+    return [
+        index
+        for (index,) in db.query(UploadedFileChunk.chunk_index).filter(
+            UploadedFileChunk.file_id == upload_id
+        )
+    ]
+
+
+def missing_chunk_indexes(db: Session, upload: UploadedFile) -> List[int]:
+    received = set(received_chunk_indexes(db, upload.id))
+    return [index for index in range(chunk_count(upload)) if index not in received]
+
+
+def claim_upload_completion(db: Session, upload: UploadedFile) -> bool:
+    """
+    Move the upload from uploading to assembling, so only one complete request
+    stores it and no more chunks are accepted. False if another request
+    claimed it first.
+    """
+    claimed = (
+        db.query(UploadedFile)
+        .filter(
+            UploadedFile.id == upload.id,
+            UploadedFile.status == IsUploadStatus.uploading,
+        )
+        .update(
+            {UploadedFile.status: IsUploadStatus.assembling},
+            synchronize_session=False,
+        )
+    )
+    db.commit()
+    db.refresh(upload)
+    return claimed == 1
+
+
+def release_upload_completion(db: Session, upload: UploadedFile):
+    # Completing failed: back to uploading, so the client can retry complete
+    db.query(UploadedFile).filter(
+        UploadedFile.id == upload.id,
+        UploadedFile.status == IsUploadStatus.assembling,
+    ).update({UploadedFile.status: IsUploadStatus.uploading}, synchronize_session=False)
+    db.commit()
+
+
+def record_chunk(db: Session, upload: UploadedFile, chunk_index: int, size: int):
+    # Re-sending a chunk (after an interruption) just overwrites it
+    db.merge(UploadedFileChunk(file_id=upload.id, chunk_index=chunk_index, size=size))
+    db.flush()
+    upload.received_bytes = (
+        db.query(func.coalesce(func.sum(UploadedFileChunk.size), 0))
+        .filter(UploadedFileChunk.file_id == upload.id)
+        .scalar()
+    )
+    db.commit()
+    db.refresh(upload)
+    return upload
+
+
+# ------------------------------------------------------------------------------------------
+# Content-addressed storage: a user's uploads with the same content share one object
+
+
+def attach_stored_object(db: Session, db_file: UploadedFile, obj: StoredObject):
+    db_file.stored_object_id = obj.id
+    db_file.content_hash = obj.content_hash
+    db_file.file_url = obj.url
+    db_file.public_id = obj.public_id
+    db_file.backend = obj.backend
+    db_file.thumbnail_url = obj.thumbnail_url
+    db_file.card_url = obj.card_url
+    db_file.full_url = obj.full_url
+    db_file.derivative_public_ids = obj.derivative_public_ids
+    db_file.status = IsUploadStatus.complete
+    db_file.upload_date = datetime.utcnow()
+    db.add(db_file)
+
+    if db_file.id is not None:
+        # A finished chunked upload no longer needs its progress rows
+        db.query(UploadedFileChunk).filter(
+            UploadedFileChunk.file_id == db_file.id
+        ).delete(synchronize_session=False)
+
+
+def reuse_stored_object(
+    db: Session, db_file: UploadedFile, content_hash: str, backend: str
+) -> bool:
+    """
+    Point db_file at its uploader's existing copy of this content, if there is
+    one. Nothing is transferred; the object just gains a reference.
+    """
+    obj = (
+        db.query(StoredObject)
+        .filter(
+            StoredObject.owner_id == db_file.user_id,
+            StoredObject.content_hash == content_hash,
+            StoredObject.backend == backend,
+        )
+        .with_for_update()  # Not destroyed by a concurrent last delete
+        .first()
+    )
+    if not obj:
+        return False
+
+    obj.ref_count += 1
+    attach_stored_object(db, db_file, obj)
+    db.commit()
+    db.refresh(db_file)
+    return True
+
+
+def store_object(
+    db: Session,
+    db_file: UploadedFile,
+    content_hash: str,
+    size: Optional[int],
+    stored: dict,
+    derivatives: Optional[dict] = None,
+) -> bool:
+    """
+    Record freshly uploaded content as a new StoredObject referenced by db_file.
+    Returns False if the same content was stored concurrently; the caller should
+    then destroy its copy and reuse_stored_object() instead.
+    """
+    obj = StoredObject(
+        owner_id=db_file.user_id,
+        content_hash=content_hash,
+        backend=stored["backend"],
+        public_id=stored["public_id"],
+        url=stored["url"],
+        size=size,
+        ref_count=1,
+    )
+    if derivatives:
+        obj.thumbnail_url = derivatives["thumbnail"]["url"]
+        obj.card_url = derivatives["card"]["url"]
+        obj.full_url = derivatives["full"]["url"]
+        obj.derivative_public_ids = {
+            name: item["public_id"] for name, item in derivatives.items()
+        }
+
+    try:
+        db.add(obj)
+        db.flush()
+        attach_stored_object(db, db_file, obj)
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return False
+
+    db.refresh(db_file)
+    return True
+
+
+def stored_public_ids(item) -> List[str]:
+    """Backend ids of a StoredObject or UploadedFile: original plus renditions"""
+    return [item.public_id, *(item.derivative_public_ids or {}).values()]
+
+
+def release_files(
+    db: Session, files: List[UploadedFile]
+) -> List[PendingStorageDeletion]:
+    """
+    Delete the file rows and drop their references in one transaction. Objects
+    that lost their last reference are queued as PendingStorageDeletion rows,
+    which are returned for purge_deletions().
+    """
+    # Lock the rows and drop any deleted since they were loaded, so a file
+    # deleted twice at once (or by a user and the collector) counts once
+    file_ids = [db_file.id for db_file in files]
+    files = (
+        db.query(UploadedFile)
+        .filter(UploadedFile.id.in_(file_ids))
+        .order_by(UploadedFile.id)
+        .with_for_update()
+        .populate_existing()
+        .all()
+    )
+    object_ids = sorted(
+        {db_file.stored_object_id for db_file in files if db_file.stored_object_id}
+    )
+    objects = {}
+    if object_ids:
+        objects = {
+            obj.id: obj
+            for obj in db.query(StoredObject)
+            .filter(StoredObject.id.in_(object_ids))
+            .order_by(StoredObject.id)  # Same lock order everywhere
+            .with_for_update()
+        }
+
+    deletions = []
+    for db_file in files:
+        obj = objects.get(db_file.stored_object_id)
+        if obj is None:
+            # Uploaded before deduplication: the row owns its object
+            backend = db_file.backend
+            doomed = stored_public_ids(db_file)
+        else:
+            obj.ref_count -= 1
+            backend = obj.backend
+            doomed = []
+            if obj.ref_count == 0:
+                doomed = stored_public_ids(obj)
+
+        deletions.extend(
+            PendingStorageDeletion(backend=backend, public_id=public_id)
+            for public_id in doomed
+            if public_id
+        )
+        db.delete(db_file)
+
+    db.flush()
+    for obj in objects.values():
+        if obj.ref_count <= 0:
+            db.delete(obj)
+
+    db.add_all(deletions)
+    db.commit()
+    return deletions
+
+
+def purge_deletions(db: Session, deletions: List[PendingStorageDeletion]) -> int:
+    """
+    Delete queued objects from their backends in batches (blocking; run it in a
+    worker thread). Confirmed deletions are dequeued, failed ones stay queued
+    for the garbage collector. Returns how many were purged.
+    """
+    by_backend = defaultdict(list)
+    for deletion in deletions:
+        by_backend[deletion.backend].append(deletion)
+
+    purged = 0
+    for backend, queued in by_backend.items():
+        for start in range(0, len(queued), DELETE_BATCH_SIZE):
+            batch = queued[start : start + DELETE_BATCH_SIZE]
+            ids = [deletion.id for deletion in batch]
+            try:
+                storage.backend(backend).delete_many(
+                    [deletion.public_id for deletion in batch]
+                )
+            except Exception as e:
+                print(f"Storage deletion failed on {backend}: {e}")
+                db.query(PendingStorageDeletion).filter(
+                    PendingStorageDeletion.id.in_(ids)
+                ).update(
+                    {"attempts": PendingStorageDeletion.attempts + 1},
+                    synchronize_session=False,
+                )
+            else:
+                db.query(PendingStorageDeletion).filter(
+                    PendingStorageDeletion.id.in_(ids)
+                ).delete(synchronize_session=False)
+                purged += len(batch)
+            db.commit()
+
+    return purged
+
+
+# ------------------------------------------------------------------------------------------
+# Garbage collection of files and objects nobody owns any more
+
+
+def shown_by_hotels(*hotel_conditions):
+    return exists().where(
+        Dbhotel.img_link.in_([UploadedFile.file_url, UploadedFile.full_url]),
+        *hotel_conditions,
+    )
+
+
+def orphan_file_condition():
+    live_owner = exists().where(
+        Dbuser.id == UploadedFile.user_id, Dbuser.status != IsActive.deleted
+    )
+    abandoned_upload = and_(
+        # Assembling ones too: their complete request died with its process
+        UploadedFile.status.in_([IsUploadStatus.uploading, IsUploadStatus.assembling]),
+        UploadedFile.upload_date
+        < datetime.utcnow() - timedelta(hours=UPLOAD_SESSION_TTL_HOURS),
+    )
+    # Images shown by a removed hotel of the file's owner and by no live hotel.
+    # Deduplicated files of other users share the url, so the owner must match
+    removed_hotel_media = and_(
+        shown_by_hotels(
+            Dbhotel.is_active == IsActive.deleted,
+            Dbhotel.owner_id == UploadedFile.user_id,
+        ),
+        ~shown_by_hotels(Dbhotel.is_active != IsActive.deleted),
+    )
+    return or_(~live_owner, abandoned_upload, removed_hotel_media)
+
+
+def collect_garbage(
+    db: Session, batch_size: int = GC_BATCH_SIZE, pause_seconds: float = GC_PAUSE
+) -> dict:
+    """
+    Remove orphaned files, unreferenced stored objects and failed backend
+    deletions, batch_size at a time with a pause in between so the database
+    and the storage API are never flooded.
+    """
+    stats = {"files": 0, "objects": 0, "purged": 0}
+
+    while True:
+        files = (
+            db.query(UploadedFile)
+            .filter(orphan_file_condition())
+            .order_by(UploadedFile.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not files:
+            break
+        for db_file in files:
+            if db_file.status != IsUploadStatus.complete:
+                storage.staging.discard(db_file.id)
+        stats["purged"] += purge_deletions(db, release_files(db, files))
+        stats["files"] += len(files)
+        time.sleep(pause_seconds)
+
+    # Objects left without references (e.g. by an interrupted upload)
+    while True:
+        objects = (
+            db.query(StoredObject)
+            .filter(~exists().where(UploadedFile.stored_object_id == StoredObject.id))
+            .order_by(StoredObject.id)
+            .limit(batch_size)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+        if not objects:
+            break
+        deletions = [
+            PendingStorageDeletion(backend=obj.backend, public_id=public_id)
+            for obj in objects
+            for public_id in stored_public_ids(obj)
+        ]
+        for obj in objects:
+            db.delete(obj)
+        db.add_all(deletions)
+        db.commit()
+        stats["purged"] += purge_deletions(db, deletions)
+        stats["objects"] += len(objects)
+        time.sleep(pause_seconds)
+
+    # Retry backend deletions that failed earlier
+    last_id = 0
+    while True:
+        deletions = (
+            db.query(PendingStorageDeletion)
+            .filter(PendingStorageDeletion.id > last_id)
+            .order_by(PendingStorageDeletion.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not deletions:
+            break
+        last_id = deletions[-1].id
+        stats["purged"] += purge_deletions(db, deletions)
+        time.sleep(pause_seconds)
+
+    return stats
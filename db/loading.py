@@ -0,0 +1,33 @@
+import os
+from sqlalchemy.orm import Query, contains_eager, raiseload
+from db.models import Dbroom
+
+
+# Set STRICT_LOADING=1 (e.g. in tests) so any relationship that a profile did not
+# declare raises instead of quietly issuing one query per serialized row.
+STRICT_LOADING = os.getenv("STRICT_LOADING", "0") == "1"
+
+
+# Relationships each endpoint's response needs, loaded up front. The display
+# schemas are flat today, so most profiles only pin "nothing else".
+LOADING_PROFILES = {
+    "booking_list": (),
+    "booking_detail": (),
+    "review_list": (),
+    "review_detail": (),
+    # Room searches already join the hotel; reuse that row instead of a lazy load
+    "room_search": (contains_eager(Dbroom.hotel),),
+    "room_detail": (contains_eager(Dbroom.hotel),),
+    "hotel_list": (),
+    "hotel_detail": (),
+}
+
+
+def with_profile(query: Query, profile: str) -> Query:
+    options = list(LOADING_PROFILES[profile])
+    if STRICT_LOADING:
+        # sql_only: relationships already in the identity map are still readable
+        options.append(raiseload("*", sql_only=True))
+    if not options:
+        return query
+    return query.options(*options)
@@ -1,7 +1,8 @@
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import query_expression, relationship
 from enum import Enum as PyEnum
 from db.database import Base
 from sqlalchemy import Column, DateTime, Enum, Integer, String, Boolean, ForeignKey
+from sqlalchemy import BigInteger, Float, Index, JSON, case, event, select, text
 
 
 
@@ -40,6 +41,38 @@ class Dbuser(Base):
         "Dbpayment", back_populates="user"
     )  # Added for 1:M user-payment
 
+    __table_args__ = (
+        # Admin search (db_user.search_users): case-insensitive prefix matches...
+        Index(
+            "ix_user_username_lower_prefix",
+            func.lower(username).label("username_lower"),
+            postgresql_ops={"username_lower": "text_pattern_ops"},
+        ),
+        Index(
+            "ix_user_email_lower_prefix",
+            func.lower(email).label("email_lower"),
+            postgresql_ops={"email_lower": "text_pattern_ops"},
+        ),
+        Index(
+            "ix_user_phone_number_prefix",
+            phone_number,
+            postgresql_ops={"phone_number": "text_pattern_ops"},
+        ),
+        # ...and substring/fuzzy matches on PostgreSQL (pg_trgm)
+        Index(
+            "ix_user_username_trgm",
+            func.lower(username).label("username_trgm"),
+            postgresql_using="gin",
+            postgresql_ops={"username_trgm": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+        Index(
+            "ix_user_email_trgm",
+            func.lower(email).label("email_trgm"),
+            postgresql_using="gin",
+            postgresql_ops={"email_trgm": "gin_trgm_ops"},
+        ).ddl_if(dialect="postgresql"),
+    )
+
 
 class Dbhotel(Base):
     __tablename__ = "hotel"
@@ -51,16 +84,30 @@ class Dbhotel(Base):
     description = Column(String)
     is_active = Column(Enum(IsActive), default=IsActive.active)
     img_link = Column(String)
+    # Smaller renditions of img_link when it is an uploaded image (see db_hotel)
+    img_thumbnail_link = Column(String, nullable=True)
+    img_card_link = Column(String, nullable=True)
     is_approved = Column(Boolean, default=False)
-    avg_review_score = Column(DECIMAL(3, 2))
+    avg_review_score = Column(DECIMAL(3, 2), index=True)  # Rating sort
+    # Running totals over confirmed reviews, kept in step by db_review
+    rating_sum = Column(DECIMAL(12, 1), nullable=False, default=0, server_default="0")
+    rating_count = Column(Integer, nullable=False, default=0, server_default="0")
     phone_number = Column(String)
     email = Column(String)
+    latitude = Column(Float, nullable=True)
+    longitude = Column(Float, nullable=True)
+    geohash = Column(String(12), nullable=True, index=True)  # See geo_utils
 
     bookings = relationship("Dbbooking", back_populates="hotel")
     rooms = relationship("Dbroom", back_populates="hotel")
     reviews = relationship("Dbreview", back_populates="hotel")
     owner = relationship("Dbuser", back_populates="hotels")
 
+    __table_args__ = (
+        # Bounding-box searches range-scan latitude, then filter longitude
+        Index("ix_hotel_latitude_longitude", "latitude", "longitude"),
+    )
+
 
 class IsRoomStatus(PyEnum):
     available = "available"
@@ -82,10 +129,20 @@ class Dbroom(Base):
     wifi = Column(Boolean, default=False)
     air_conditioner = Column(Boolean, default=False)
     tv = Column(Boolean, default=False)
-    status = Column(Enum(IsRoomStatus), default=IsRoomStatus.available)
+    # Only "unavailable" (out of service) is stored; booked and available are
+    # derived from bookings, see room_status_at below
+    service_status = Column(
+        "status", Enum(IsRoomStatus), default=IsRoomStatus.available
+    )
     bed_count = Column(Integer, nullable=False)
     hotel = relationship("Dbhotel", back_populates="rooms")
 
+    __table_args__ = (
+        # Price sorting, and the cheapest-room lookup per hotel
+        Index("ix_room_price_per_night", "price_per_night"),
+        Index("ix_room_hotel_id_price_per_night", "hotel_id", "price_per_night"),
+    )
+
 
 class IsBookingStatus(PyEnum):
     pending = "pending"
@@ -119,6 +176,43 @@ class Dbbooking(Base):
         "Dbreview", back_populates="booking", uselist=False
     )  # Changed to singular
 
+    __table_args__ = (
+        # Overlap checks and room_status_at: "is this room booked on these dates"
+        Index("ix_booking_room_id_dates", "room_id", "check_in_date", "check_out_date"),
+    )
+
+
+def room_status_at(day):
+    """
+    SQL expression for a room's status on day: unavailable when out of service,
+    booked when a live booking covers that night, otherwise available. The
+    booking lookup is an index probe on ix_booking_room_id_dates.
+    """
+    occupied = (
+        select(Dbbooking.id)
+        .where(
+            Dbbooking.room_id == Dbroom.id,
+            Dbbooking.is_active == IsActive.active,
+            Dbbooking.status != "cancelled",
+            Dbbooking.check_in_date <= day,
+            Dbbooking.check_out_date > day,
+        )
+        .exists()
+    )
+    return case(
+        (
+            Dbroom.service_status == IsRoomStatus.unavailable,
+            IsRoomStatus.unavailable.value,
+        ),
+        (occupied, IsRoomStatus.reserved.value),
+        else_=IsRoomStatus.available.value,
+    )
+
+
+# Loaded for today by default; queries for another date use
+# .options(with_expression(Dbroom.status, room_status_at(day)))
+Dbroom.status = query_expression(room_status_at(func.current_date()))
+
 
 class IsPaymentStatus(PyEnum):
     pending = "pending"
@@ -138,10 +232,31 @@ class Dbpayment(Base):
     amount = Column(DECIMAL(10, 2), nullable=False)
     status = Column(Enum(IsPaymentStatus), nullable=False)
     payment_date = Column(Date, nullable=False)
+    # When the charge was last handed to the pipeline; stale pending ones expire
+    submitted_at = Column(DateTime(timezone=True), nullable=True)
+    # When a pipeline worker handed it to the gateway; sent ones never expire
+    sent_at = Column(DateTime(timezone=True), nullable=True)
+    # Charged for a booking that was cancelled meanwhile; the money must go back
+    refund_needed = Column(Boolean, nullable=False, default=False)
 
     booking = relationship("Dbbooking", back_populates="payment")  # Changed to singular
     user = relationship("Dbuser", back_populates="payments")  # Updated
 
+    __table_args__ = (
+        Index("ix_payment_status_submitted_at", "status", "submitted_at"),
+    )
+
+
+class Dbpaymentrollup(Base):
+    __tablename__ = "payment_daily_rollup"
+
+    # Payments per day x status x hotel, kept in step by db_payment
+    day = Column(Date, primary_key=True)
+    status = Column(Enum(IsPaymentStatus), primary_key=True)
+    hotel_id = Column(Integer, primary_key=True)
+    payment_count = Column(Integer, nullable=False, default=0)
+    amount_sum = Column(DECIMAL(14, 2), nullable=False, default=0)
+
 
 # ---------------------------------------------------------------------
 class IsReviewStatus(PyEnum):
@@ -173,12 +288,217 @@ class Dbreview(Base):
     booking = relationship("Dbbooking", back_populates="review")  # Changed to singular
 
 
+class Dbreviewsummary(Base):
+    __tablename__ = "hotel_review_summary"
+
+    # One row per hotel, maintained alongside review changes in db_review
+    hotel_id = Column(
+        Integer, ForeignKey("hotel.id", ondelete="CASCADE"), primary_key=True
+    )
+    stars_1 = Column(Integer, nullable=False, default=0)  # Confirmed reviews only
+    stars_2 = Column(Integer, nullable=False, default=0)
+    stars_3 = Column(Integer, nullable=False, default=0)
+    stars_4 = Column(Integer, nullable=False, default=0)
+    stars_5 = Column(Integer, nullable=False, default=0)
+    pending_count = Column(Integer, nullable=False, default=0)
+    confirmed_count = Column(Integer, nullable=False, default=0)
+    rejected_count = Column(Integer, nullable=False, default=0)
+    deleted_count = Column(Integer, nullable=False, default=0)
+    current_month = Column(Date, nullable=True)  # First day of the month counted
+    reviews_this_month = Column(Integer, nullable=False, default=0)
+    reviews_last_month = Column(Integer, nullable=False, default=0)
+
+
+class Dbrateplan(Base):
+    __tablename__ = "rate_plan"
+
+    id = Column(Integer, primary_key=True, index=True)
+    hotel_id = Column(
+        Integer, ForeignKey("hotel.id", ondelete="CASCADE"), nullable=False, index=True
+    )
+    room_id = Column(
+        Integer, ForeignKey("room.id", ondelete="CASCADE"), nullable=True
+    )  # None = applies to every room in the hotel
+    name = Column(String, nullable=False)
+    start_date = Column(Date, nullable=True)  # Season window; None = all year
+    end_date = Column(Date, nullable=True)
+    season_multiplier = Column(DECIMAL(5, 2), nullable=False, default=1)
+    weekend_multiplier = Column(DECIMAL(5, 2), nullable=False, default=1)  # Fri/Sat
+    los_min_nights = Column(Integer, nullable=True)  # Length-of-stay discount
+    los_discount_percent = Column(DECIMAL(5, 2), nullable=False, default=0)
+    is_active = Column(Enum(IsActive), default=IsActive.active)
+
+
+class Dbjobrun(Base):
+    """One run of a periodic background job, with what it did"""
+
+    __tablename__ = "job_run"
+
+    id = Column(Integer, primary_key=True)
+    job_name = Column(String(50), nullable=False, index=True)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    rows_scanned = Column(Integer, nullable=False, default=0)
+    rows_updated = Column(Integer, nullable=False, default=0)
+    error = Column(String, nullable=True)
+
+
+class IsJobStatus(PyEnum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    dead = "dead"  # Out of attempts; kept for inspection and manual retry
+
+
+class Dbjob(Base):
+    """Durable job queue, worked by task/job_worker.py"""
+
+    __tablename__ = "job_queue"
+
+    id = Column(Integer, primary_key=True)
+    kind = Column(String(50), nullable=False)  # Handler name
+    payload = Column(JSON, nullable=False)
+    status = Column(Enum(IsJobStatus), nullable=False, default=IsJobStatus.queued)
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=5)
+    run_at = Column(DateTime(timezone=True), nullable=False)  # Not before
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=True)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
+    locked_by = Column(String(100), nullable=True)  # Worker running it
+    last_error = Column(String, nullable=True)
+
+    __table_args__ = (
+        # Dequeue scans queued jobs in run_at order
+        Index("ix_job_queue_status_run_at", "status", "run_at"),
+    )
+
+
+class Dbownernotification(Base):
+    """An event for a hotel owner, waiting for the next digest email"""
+
+    __tablename__ = "owner_notification"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    kind = Column(String(50), nullable=False)  # See email_templates
+    payload = Column(JSON, nullable=False)
+    created_at = Column(DateTime(timezone=True), nullable=False)
+    digested_at = Column(DateTime(timezone=True), nullable=True)
+
+    __table_args__ = (
+        # The digest job reads undigested events grouped by owner
+        Index("ix_owner_notification_pending", "digested_at", "owner_id"),
+    )
+
+
+class IsUploadStatus(PyEnum):
+    uploading = "uploading"  # Chunked upload in progress
+    assembling = "assembling"  # Complete was called; the content is being stored
+    complete = "complete"
+
+
+class StoredObject(Base):
+    """
+    One stored copy of some content uploaded by one user. Every UploadedFile of
+    that user with the same content refers to it; ref_count is the number of
+    those rows, and the object is destroyed on the backend when the last one is
+    deleted. Copies are never shared between users: finding another user's copy
+    would reveal that they uploaded the content, and hand out their URLs.
+    """
+
+    __tablename__ = "stored_objects"
+
+    id = Column(Integer, primary_key=True)
+    owner_id = Column(Integer, ForeignKey("user.id"), nullable=False)
+    content_hash = Column(String(64), nullable=False)  # SHA-256, hex
+    backend = Column(String, nullable=False)
+    public_id = Column(String, nullable=False)
+    url = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=True)
+    ref_count = Column(Integer, nullable=False, default=1)
+    thumbnail_url = Column(String, nullable=True)
+    card_url = Column(String, nullable=True)
+    full_url = Column(String, nullable=True)
+    derivative_public_ids = Column(JSON, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    __table_args__ = (
+        # The content-hash index; also stops two copies of a user's content
+        Index(
+            "ux_stored_object_owner_hash",
+            "owner_id",
+            "content_hash",
+            "backend",
+            unique=True,
+        ),
+    )
+
+
 class UploadedFile(Base):
     __tablename__ = "uploaded_files"
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, index=True)
     file_name = Column(String)
-    file_url = Column(String)
-    public_id = Column(String)  # Cloudinary public ID for deletion
+    file_url = Column(String, index=True)  # Looked up when hotels link images
+    public_id = Column(String)  # Storage backend ID for deletion
     upload_date = Column(DateTime(timezone=True), server_default=func.now())
+    backend = Column(String, nullable=False, server_default="cloudinary")
+    status = Column(
+        Enum(IsUploadStatus),
+        nullable=False,
+        server_default=IsUploadStatus.complete.value,
+    )
+    # Chunked uploads: progress is the set of chunk rows received so far
+    total_size = Column(BigInteger, nullable=True)
+    chunk_size = Column(Integer, nullable=True)
+    received_bytes = Column(BigInteger, nullable=False, server_default="0")
+    # Resized renditions of images (see image_derivatives), on the same backend
+    thumbnail_url = Column(String, nullable=True)
+    card_url = Column(String, nullable=True)
+    full_url = Column(String, nullable=True)
+    derivative_public_ids = Column(JSON, nullable=True)  # {rendition: public_id}
+    # Shared stored copy; the columns above are copied from it. Rows uploaded
+    # before deduplication have none and own their object outright
+    stored_object_id = Column(
+        Integer, ForeignKey("stored_objects.id", ondelete="SET NULL"), index=True
+    )
+    content_hash = Column(String(64), nullable=True)
+
+    chunks = relationship(
+        "UploadedFileChunk", cascade="all, delete-orphan", passive_deletes=True
+    )
+
+
+class PendingStorageDeletion(Base):
+    """
+    Backend object whose database rows are gone. Written in the same
+    transaction that drops the last reference, and removed once the backend
+    confirms, so a failed delete is retried by the garbage collector.
+    """
+
+    __tablename__ = "pending_storage_deletions"
+
+    id = Column(Integer, primary_key=True)
+    backend = Column(String, nullable=False)
+    public_id = Column(String, nullable=False)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+
+class UploadedFileChunk(Base):
+    __tablename__ = "uploaded_file_chunks"
+
+    file_id = Column(
+        Integer, ForeignKey("uploaded_files.id", ondelete="CASCADE"), primary_key=True
+    )
+    chunk_index = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
+
+
+@event.listens_for(Base.metadata, "before_create")
+def create_postgresql_extensions(target, connection, **kw):
+    # The trigram indexes on Dbuser need pg_trgm
+    if connection.dialect.name == "postgresql":
+        connection.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
@@ -0,0 +1,97 @@
+from string import Template
+from typing import Dict, List, Tuple, Union
+
+
+# $name placeholders, as in string.Template; $$ is a literal $
+TEMPLATE_SOURCES = {
+    "hotel_approved": (
+        "Your Hotel Has Been Approved",
+        "Congratulations $username,\n\n"
+        "Your hotel '$hotel_name' has been approved.\n\n"
+        "Best regards,\nHotel Management Team.",
+    ),
+    "hotel_rejected": (
+        "Your Hotel Has Been Rejected",
+        "Dear $username,\n\n"
+        "Your hotel '$hotel_name' has been rejected. "
+        "Please contact support for further information.\n\n"
+        "Best regards,\nHotel Management Team.",
+    ),
+    "owner_digest": (
+        "Your hotels: $event_count new updates",
+        "Dear $username,\n\n"
+        "Here is what happened at your hotels since $since:\n\n"
+        "$events\n\n"
+        "Best regards,\nHotel Management Team.",
+    ),
+}
+
+# One line per event in the owner digest
+EVENT_LINE_SOURCES = {
+    "booking_created": "- New booking #$booking_id at $hotel_name: "
+    "$check_in_date to $check_out_date ($total_cost)",
+    "booking_cancelled": "- Booking #$booking_id at $hotel_name was cancelled "
+    "($check_in_date to $check_out_date)",
+    "review_posted": "- New $rating-star review of $hotel_name: $comment",
+}
+
+
+class CompiledTemplate:
+    """
+    A template split once into literal text and field names, so rendering is
+    a single join with no parsing.
+    """
+
+    def __init__(self, source: str):
+        self.parts: List[Union[str, Tuple[str]]] = []
+        position = 0
+        for match in Template.pattern.finditer(source):
+            if match.group("invalid") is not None:
+                raise ValueError(f"Invalid placeholder at {match.start()}: {source!r}")
+            self.parts.append(source[position : match.start()])
+            if match.group("escaped") is not None:
+                self.parts.append("$")
+            else:
+                # Field names are wrapped in a tuple to tell them from text
+                self.parts.append((match.group("named") or match.group("braced"),))
+            position = match.end()
+        self.parts.append(source[position:])
+
+    def render(self, context: Dict) -> str:
+        return "".join(
+            part if isinstance(part, str) else str(context[part[0]])
+            for part in self.parts
+        )
+
+
+class TemplateRegistry:
+    def __init__(self):
+        self.messages: Dict[str, Tuple[CompiledTemplate, CompiledTemplate]] = {}
+        self.event_lines: Dict[str, CompiledTemplate] = {}
+
+    def compile(self):
+        """Compile every template; called at startup so a broken one fails fast"""
+        if self.messages:
+            return
+        self.event_lines = {
+            kind: CompiledTemplate(source)
+            for kind, source in EVENT_LINE_SOURCES.items()
+        }
+        # Set last: it marks the registry as compiled
+        self.messages = {
+            name: (CompiledTemplate(subject), CompiledTemplate(body))
+            for name, (subject, body) in TEMPLATE_SOURCES.items()
+        }
+
+    def render(self, name: str, **context) -> Tuple[str, str]:
+        """(subject, body) of a message template"""
+        self.compile()
+        subject, body = self.messages[name]
+        return subject.render(context), body.render(context)
+
+    def render_event(self, kind: str, context: Dict) -> str:
+        self.compile()
+        return self.event_lines[kind].render(context)
+
+
+templates = TemplateRegistry()
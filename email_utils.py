@@ -1,15 +1,203 @@
+import asyncio
+import os
+import time
 from email.message import EmailMessage
+from threading import Lock, Thread
+from typing import List, Optional
 import aiosmtplib
+from tracing import tracer
 
-async def send_email(to_email: str, subject: str, body: str):
+
+SMTP_HOST = os.getenv("SMTP_HOST", "localhost")
+SMTP_PORT = int(os.getenv("SMTP_PORT", 1025))  # MailHog default
+SMTP_USERNAME = os.getenv("SMTP_USERNAME")
+SMTP_PASSWORD = os.getenv("SMTP_PASSWORD")
+SMTP_POOL_SIZE = int(os.getenv("SMTP_POOL_SIZE", 3))
+SMTP_RATE_PER_SECOND = float(os.getenv("SMTP_RATE_PER_SECOND", 10))
+MAIL_FROM = os.getenv("MAIL_FROM", "no-reply@hotelapp.com")
+
+CONNECTION_ERRORS = (
+    aiosmtplib.SMTPServerDisconnected,
+    aiosmtplib.SMTPConnectError,
+    aiosmtplib.SMTPTimeoutError,
+    ConnectionError,
+)
+
+
+def build_message(to_email: str, subject: str, body: str) -> EmailMessage:
     message = EmailMessage()
-    message["From"] = "no-reply@hotelapp.com"
+    message["From"] = MAIL_FROM
     message["To"] = to_email
     message["Subject"] = subject
     message.set_content(body)
+    return message
+
+
+class RateLimiter:
+    """
+    Token bucket: at most `rate` acquisitions per second, bursts up to `rate`.
+    The bucket holds at least one token, so rates below 1 still let one through.
+    """
+
+    def __init__(self, rate: float):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.capacity, self.tokens + (now - self.updated) * self.rate
+                )
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Mailer:
+    """
+    Keeps up to pool_size SMTP connections open and reuses them, so messages
+    skip the connect/EHLO/login handshake. The connections live on the
+    mailer's own event loop thread; send() and send_batch() can be called from
+    any event loop, and send_batch_sync() from plain threads (the job worker).
+    """
+
+    def __init__(
+        self,
+        hostname: str = SMTP_HOST,
+        port: int = SMTP_PORT,
+        pool_size: int = SMTP_POOL_SIZE,
+        rate_per_second: float = SMTP_RATE_PER_SECOND,
+        username: Optional[str] = SMTP_USERNAME,
+        password: Optional[str] = SMTP_PASSWORD,
+    ):
+        self.hostname = hostname
+        self.port = port
+        self.pool_size = pool_size
+        self.rate_per_second = rate_per_second
+        self.username = username
+        self.password = password
+        self.loop = None
+        self.starting = Lock()
+
+    def start(self):
+        with self.starting:
+            if self.loop is None:
+                loop = asyncio.new_event_loop()
+                Thread(target=loop.run_forever, daemon=True).start()
+                asyncio.run_coroutine_threadsafe(self.setup(), loop).result()
+                self.loop = loop
+
+    async def setup(self):
+        # Created on the mailer loop, which owns them
+        self.limiter = RateLimiter(self.rate_per_second)
+        self.pool: asyncio.Queue = asyncio.Queue()
+        for _ in range(self.pool_size):
+            self.pool.put_nowait(None)  # Connected on first use
+
+    async def connect(self) -> aiosmtplib.SMTP:
+        smtp = aiosmtplib.SMTP(hostname=self.hostname, port=self.port)
+        await smtp.connect()
+        if self.username:
+            await smtp.login(self.username, self.password)
+        return smtp
+
+    async def deliver(self, message: EmailMessage):
+        with tracer.span("smtp.send", to=message["To"]):
+            await self.limiter.acquire()
+            smtp = await self.pool.get()
+            try:
+                for attempt in range(2):
+                    try:
+                        if smtp is None or not smtp.is_connected:
+                            smtp = await self.connect()
+                        await smtp.send_message(message)
+                        return
+                    except CONNECTION_ERRORS:
+                        # Idle connections get dropped by the server; reconnect once
+                        if smtp is not None:
+                            smtp.close()
+                        smtp = None
+                        if attempt:
+                            raise
+            finally:
+                # A refused message leaves the connection usable, so it goes back
+                self.pool.put_nowait(smtp)
+
+    async def deliver_batch(
+        self, messages: List[EmailMessage]
+    ) -> List[Optional[Exception]]:
+        # The pool bounds how many are in flight; one failure does not stop the rest
+        results = await asyncio.gather(
+            *(self.deliver(message) for message in messages), return_exceptions=True
+        )
+        return [
+            result if isinstance(result, Exception) else None for result in results
+        ]
+
+    async def send(self, message: EmailMessage):
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(self.deliver(message), self.loop)
+        await asyncio.wrap_future(future)
+
+    async def send_batch(self, messages: List[EmailMessage]):
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(
+            self.deliver_batch(messages), self.loop
+        )
+        return await asyncio.wrap_future(future)
+
+    def send_batch_sync(
+        self, messages: List[EmailMessage]
+    ) -> List[Optional[Exception]]:
+        """Send from a plain thread; returns one error (or None) per message"""
+        self.start()
+        return asyncio.run_coroutine_threadsafe(
+            self.deliver_batch(messages), self.loop
+        ).result()
+
+    async def close_all(self):
+        while not self.pool.empty():
+            smtp = self.pool.get_nowait()
+            if smtp is not None and smtp.is_connected:
+                await smtp.quit()
+
+    def close(self):
+        if self.loop is not None:
+            asyncio.run_coroutine_threadsafe(self.close_all(), self.loop).result()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop = None
+
+
+mailer = Mailer()
+
+
+async def send_email(to_email: str, subject: str, body: str):
+    with tracer.span("email.send", to=to_email):
+        await mailer.send(build_message(to_email, subject, body))
+
 
-    await aiosmtplib.send(
-        message,
-        hostname="localhost",
-        port=1025  # MailHog default
-    )
\ No newline at end of file
+if __name__ == "__main__":
+    # Smoke test against a local debugging SMTP server (MailHog on port 1025:
+    # docker run -p 1025:1025 -p 8025:8025 mailhog/mailhog)
+    count = 50
+    messages = [
+        build_message(f"guest{i}@example.com", f"Test {i}", "Pooled delivery test")
+        for i in range(count)
+    ]
+    started = time.perf_counter()
+    errors = mailer.send_batch_sync(messages)
+    elapsed = time.perf_counter() - started
+    failed = [error for error in errors if error is not None]
+    print(f"Sent {count - len(failed)}/{count} in {elapsed:.2f}s")
+    if failed:
+        print(f"First error: {failed[0]!r}")
+    mailer.close()
@@ -0,0 +1,105 @@
+import math
+from typing import List, Tuple
+
+
+BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 12  # Stored precision (~3.7cm x 1.9cm cells)
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def encode_geohash(
+    latitude: float, longitude: float, precision: int = GEOHASH_PRECISION
+) -> str:
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    geohash = []
+    bits = 0
+    bit_count = 0
+    even = True  # Geohash interleaves bits starting with longitude
+
+    while len(geohash) < precision:
+        if even:
+            mid = (lon_range[0] + lon_range[1]) / 2
+            if longitude >= mid:
+                bits = (bits << 1) | 1
+                lon_range[0] = mid
+            else:
+                bits = bits << 1
+                lon_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                bits = (bits << 1) | 1
+                lat_range[0] = mid
+            else:
+                bits = bits << 1
+                lat_range[1] = mid
+        even = not even
+        bit_count += 1
+
+        if bit_count == 5:
+            geohash.append(BASE32[bits])
+            bits = 0
+            bit_count = 0
+
+    return "".join(geohash)
+
+
+def cell_size_degrees(precision: int) -> Tuple[float, float]:
+    """Return the (latitude, longitude) size in degrees of a cell at this precision"""
+    total_bits = 5 * precision
+    lon_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2**lat_bits), 360.0 / (2**lon_bits)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    d_phi = math.radians(lat2 - lat1)
+    d_lambda = math.radians(lon2 - lon1)
+    a = (
+        math.sin(d_phi / 2) ** 2
+        + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    )
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def covered_radius_km(latitude: float, precision: int) -> float:
+    """
+    Smallest distance from a point to the edge of the 3x3 block of cells
+    around it. Everything closer than this is guaranteed to be in the block.
+    """
+    lat_deg, lon_deg = cell_size_degrees(precision)
+    # Longitude degrees shrink towards the poles; use the worst case in the block
+    worst_lat = min(90.0, abs(latitude) + lat_deg)
+    return min(
+        lat_deg * KM_PER_DEGREE,
+        lon_deg * KM_PER_DEGREE * math.cos(math.radians(worst_lat)),
+    )
+
+
+def precision_for_radius(latitude: float, radius_km: float) -> int:
+    """Finest precision whose 3x3 neighbourhood still covers the radius"""
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        if covered_radius_km(latitude, precision) >= radius_km:
+            return precision
+    return 0  # The radius is larger than any cell; scan everything
+
+
+def neighbour_cells(latitude: float, longitude: float, precision: int) -> List[str]:
+    """The cell containing the point plus its eight neighbours (deduplicated)"""
+    lat_deg, lon_deg = cell_size_degrees(precision)
+    cells = []
+    for d_lat in (-1, 0, 1):
+        lat = latitude + d_lat * lat_deg
+        if lat < -90.0 or lat > 90.0:
+            continue
+        for d_lon in (-1, 0, 1):
+            lon = longitude + d_lon * lon_deg
+            lon = ((lon + 180.0) % 360.0) - 180.0  # Wrap across the antimeridian
+            cell = encode_geohash(lat, lon, precision)
+            if cell not in cells:
+                cells.append(cell)
+    return cells
+
@@ -0,0 +1,121 @@
+import asyncio
+import io
+import mimetypes
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import BinaryIO, Dict, Optional, Union
+from PIL import Image, ImageOps
+
+
+# name: (max width, max height, JPEG quality); images are never upscaled
+RENDITIONS = {
+    "thumbnail": (200, 200, 70),
+    "card": (640, 480, 80),
+    "full": (1920, 1920, 85),
+}
+DERIVATIVE_PROCESSES = int(os.getenv("DERIVATIVE_PROCESSES", os.cpu_count() or 1))
+# Larger sources are stored as-is, without renditions
+MAX_DERIVATIVE_SOURCE_BYTES = int(
+    os.getenv("MAX_DERIVATIVE_SOURCE_BYTES", 50 * 1024 * 1024)
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = Lock()
+
+
+def is_image(file_name: Optional[str], content_type: Optional[str] = None) -> bool:
+    if not content_type and file_name:
+        content_type, _ = mimetypes.guess_type(file_name)
+    return bool(content_type) and content_type.startswith("image/")
+
+
+def render_derivatives(source: Union[BinaryIO, str]) -> Dict[str, bytes]:
+    """
+    Decode the image once and encode every rendition as a progressive JPEG.
+    source is an open file (read by PIL as it decodes) or a path on disk.
+    """
+    with Image.open(source) as image:
+        # Let the JPEG decoder scale down while decoding instead of afterwards
+        largest = max(RENDITIONS.values())
+        image.draft("RGB", (largest[0], largest[1]))
+        image = ImageOps.exif_transpose(image).convert("RGB")
+
+        renditions = {}
+        for name, (width, height, quality) in RENDITIONS.items():
+            resized = image.copy()
+            resized.thumbnail((width, height), Image.LANCZOS)
+            out = io.BytesIO()
+            resized.save(
+                out, "JPEG", quality=quality, optimize=True, progressive=True
+            )
+            renditions[name] = out.getvalue()
+        return renditions
+
+
+def get_pool() -> ProcessPoolExecutor:
+    # Created on first use so importing this module does not fork workers
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: forking copies the parent's threads' locks
+            # (the event loop, the DB pool) in whatever state they were in
+            _pool = ProcessPoolExecutor(
+                max_workers=DERIVATIVE_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool
+
+
+async def store_derivatives(
+    storage, source: Union[BinaryIO, str], folder: str, size: Optional[int]
+) -> Optional[Dict[str, dict]]:
+    """
+    Render the renditions in the process pool and upload them in parallel.
+    Returns {name: {"url": ..., "public_id": ...}}, or None when the source is
+    too large or not a decodable image; the original upload stands either way.
+    """
+    if size is not None and size > MAX_DERIVATIVE_SOURCE_BYTES:
+        return None
+
+    loop = asyncio.get_running_loop()
+    try:
+        if isinstance(source, str):
+            # A staged file: a worker process opens it by path
+            renditions = await loop.run_in_executor(
+                get_pool(), render_derivatives, source
+            )
+        else:
+            # A spooled upload has no path and cannot cross to a process, so
+            # PIL reads it in a storage thread instead of copying it to bytes
+            source.seek(0)
+            renditions = await storage.run(render_derivatives, source)
+    except Exception as e:
+        print(f"Could not render derivatives in {folder}: {e}")
+        return None
+
+    names = list(renditions)
+    stored = await asyncio.gather(
+        *(
+            storage.upload_stream(
+                io.BytesIO(renditions[name]),
+                folder=f"{folder}/derivatives",
+                size=len(renditions[name]),
+                suffix=".jpg",
+            )
+            for name in names
+        ),
+        return_exceptions=True,
+    )
+
+    failed = [result for result in stored if isinstance(result, Exception)]
+    if failed:
+        # All or nothing, so a file never points at half of its renditions
+        print(f"Could not store derivatives in {folder}: {failed[0]}")
+        for result in stored:
+            if not isinstance(result, Exception):
+                await storage.delete(result["public_id"], backend=result["backend"])
+        return None
+
+    return dict(zip(names, stored))
@@ -1,11 +1,25 @@
+import os
 from threading import Thread
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
+from fastapi.staticfiles import StaticFiles
 from auth import authentication
 from cloudinary_config import configure_cloudinary
-from routers import files, hotel, user, booking, review, room, payment
+from routers import files, hotel, user, booking, review, room, payment, rate_plan
+from routers import debug, job
 from db import models
 from db.database import engine
-from task.background_tasks import update_room_status_periodically
+from task.payment_pipeline import payment_pipeline
+from storage import LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL, STORAGE_BACKEND
+from task.background_tasks import (
+    reconcile_aggregates_periodically,
+    collect_orphan_files_periodically,
+    expire_stale_payments_periodically,
+    schedule_owner_digests_periodically,
+    write_profiles_periodically,
+)
+from email_templates import templates
+from tracing import tracer
+from profiler import PROFILE_CONTINUOUS
 
 
 app = FastAPI()
@@ -13,10 +27,40 @@ app.include_router(authentication.router)
 app.include_router(user.router)
 app.include_router(hotel.router)
 app.include_router(room.router)
+app.include_router(rate_plan.router)
 app.include_router(booking.router)
 app.include_router(payment.router)
 app.include_router(review.router)
 app.include_router(files.router)
+app.include_router(job.router)
+app.include_router(debug.router)
+
+# The local storage backend serves its files from this app
+if STORAGE_BACKEND == "local":
+    os.makedirs(LOCAL_STORAGE_DIR, exist_ok=True)
+    app.mount(
+        LOCAL_STORAGE_URL, StaticFiles(directory=LOCAL_STORAGE_DIR), name="media"
+    )
+
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    # Root span of the request; sampled traces get their id back in a header
+    with tracer.trace(
+        f"{request.method} {request.url.path}",
+        traceparent=request.headers.get("traceparent"),
+        method=request.method,
+        path=request.url.path,
+    ) as span:
+        response = await call_next(request)
+        span.set("status_code", response.status_code)
+        if span.trace_id:
+            route = request.scope.get("route")
+            if route is not None:
+                # Name by route template so /bookings/1 and /bookings/2 group
+                span.name = f"{request.method} {route.path}"
+            response.headers["X-Trace-Id"] = span.trace_id
+        return response
 
 
 @app.get("/")
@@ -27,11 +71,16 @@ def read_root():
 @app.on_event("startup")
 def start_periodic_task():
     configure_cloudinary()
-    thread = Thread(target=update_room_status_periodically)
-    thread.daemon = (
-        True  # Daemon threads automatically close when the main program exits
-    )
-    thread.start()
+    templates.compile()
+    # Daemon threads automatically close when the main program exits
+    Thread(target=reconcile_aggregates_periodically, daemon=True).start()
+    Thread(target=collect_orphan_files_periodically, daemon=True).start()
+    Thread(target=expire_stale_payments_periodically, daemon=True).start()
+    Thread(target=schedule_owner_digests_periodically, daemon=True).start()
+    if PROFILE_CONTINUOUS:
+        Thread(target=write_profiles_periodically, daemon=True).start()
+
+    payment_pipeline.start()
 
 
 models.Base.metadata.create_all(engine)
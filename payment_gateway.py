@@ -0,0 +1,58 @@
+import os
+import random
+import time
+import uuid
+from decimal import Decimal
+from typing import Optional
+
+
+class GatewayResult:
+    def __init__(
+        self,
+        approved: bool,
+        reference: Optional[str] = None,
+        reason: Optional[str] = None,
+    ):
+        self.approved = approved
+        self.reference = reference  # Processor's transaction id
+        self.reason = reason  # Decline or error message
+
+
+class PaymentGateway:
+    """Interface for card processors. charge() blocks until the processor answers."""
+
+    def charge(self, payment_id: int, amount: Decimal, card: dict) -> GatewayResult:
+        raise NotImplementedError
+
+
+class FakePaymentGateway(PaymentGateway):
+    """
+    In-process stand-in for a real processor, for local runs and tests.
+    Adds latency_ms per call and declines a failure_rate share of charges.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 300,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
+        self.latency_ms = latency_ms
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+    def charge(self, payment_id: int, amount: Decimal, card: dict) -> GatewayResult:
+        time.sleep(self.latency_ms / 1000)
+
+        if self.random.random() < self.failure_rate:
+            return GatewayResult(approved=False, reason="Card declined")
+
+        return GatewayResult(approved=True, reference=uuid.uuid4().hex)
+
+
+def get_payment_gateway() -> PaymentGateway:
+    """Gateway used by the app; only the fake exists until a processor is wired in"""
+    return FakePaymentGateway(
+        latency_ms=float(os.getenv("PAYMENT_GATEWAY_LATENCY_MS", 300)),
+        failure_rate=float(os.getenv("PAYMENT_GATEWAY_FAILURE_RATE", 0)),
+    )
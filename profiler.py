@@ -0,0 +1,113 @@
+import os
+import socket
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional
+
+
+PROFILE_CONTINUOUS = os.getenv("PROFILE_CONTINUOUS", "false").lower() == "true"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Continuous mode samples slowly and writes one profile per window
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", 100))
+PROFILE_WINDOW_SECONDS = int(os.getenv("PROFILE_WINDOW_SECONDS", 60))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 60 * 24))  # A day of minute profiles
+
+# (file, function) of leaf frames of threads that are waiting, not running:
+# pool threads, event loops in select() and loops in sleep(). None matches
+# any function of the file
+IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("selectors.py", "select"),
+    ("thread.py", "_worker"),
+    ("background_tasks.py", None),
+    ("job_worker.py", "run_forever"),
+    ("job_worker.py", "work"),
+    ("tracing.py", "export_forever"),
+    ("profiler.py", "sample_stacks"),  # The continuous profiler
+}
+
+# One on-demand profile at a time; overlapping ones would skew each other
+profile_lock = threading.Lock()
+
+_labels: Dict[object, str] = {}
+
+
+def frame_label(code) -> str:
+    label = _labels.get(code)
+    if label is None:
+        file_name = os.path.basename(code.co_filename)
+        # ";" separates frames in the collapsed format
+        label = f"{code.co_name} ({file_name}:{code.co_firstlineno})".replace(";", ":")
+        _labels[code] = label
+    return label
+
+
+def is_idle(code) -> bool:
+    file_name = os.path.basename(code.co_filename)
+    return (file_name, code.co_name) in IDLE_LEAVES or (file_name, None) in IDLE_LEAVES
+
+
+def sample_stacks(
+    seconds: float, interval_ms: float, include_idle: bool = False
+) -> Counter:
+    """
+    Sample every thread's Python stack every interval_ms for `seconds`.
+    Nothing is hooked into the profiled code: the cost is one stack walk per
+    thread per sample, on this thread. Returns collapsed stack -> samples.
+    """
+    me = threading.get_ident()
+    interval = interval_ms / 1000
+    stacks: Counter = Counter()
+    deadline = time.monotonic() + seconds
+
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == me or (not include_idle and is_idle(frame.f_code)):
+                continue
+            frames = []
+            while frame is not None:
+                frames.append(frame_label(frame.f_code))
+                frame = frame.f_back
+            frames.append(names.get(ident, f"thread-{ident}").replace(";", ":"))
+            stacks[";".join(reversed(frames))] += 1
+        time.sleep(interval)
+
+    return stacks
+
+
+def collapse(stacks: Counter) -> str:
+    """Brendan Gregg's collapsed format, as read by flamegraph.pl and speedscope"""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def profile(
+    seconds: float, interval_ms: float, include_idle: bool = False
+) -> Optional[str]:
+    """Collapsed profile of this process, or None if one is already running"""
+    if not profile_lock.acquire(blocking=False):
+        return None
+    try:
+        return collapse(sample_stacks(seconds, interval_ms, include_idle))
+    finally:
+        profile_lock.release()
+
+
+def write_profile(stacks: Counter, directory: str = PROFILE_DIR) -> str:
+    os.makedirs(directory, exist_ok=True)
+    stamp = time.strftime("%Y%m%dT%H%M%S", time.gmtime())
+    path = os.path.join(
+        directory, f"{socket.gethostname()}-{os.getpid()}-{stamp}.collapsed"
+    )
+    with open(path, "w") as out:
+        out.write(collapse(stacks))
+
+    # Keep the newest PROFILE_KEEP profiles of this process
+    prefix = f"{socket.gethostname()}-{os.getpid()}-"
+    own = sorted(name for name in os.listdir(directory) if name.startswith(prefix))
+    for name in own[:-PROFILE_KEEP]:
+        os.remove(os.path.join(directory, name))
+    return path
@@ -0,0 +1,32 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from auth.oauth2 import get_current_user
+from db.models import Dbuser
+import profiler
+
+
+router = APIRouter(prefix="/debug", tags=["Debug"])
+
+
+# Sync on purpose: sampling sleeps, so it runs in the threadpool and the event
+# loop (which it also samples) keeps serving requests
+@router.get(
+    "/profile",
+    response_class=PlainTextResponse,
+    summary="Sample this worker process",
+    description="Collapsed stacks (one 'frame;frame;... count' per line) for "
+    "flamegraph.pl or speedscope. Covers only the worker that serves the call.",
+)
+def profile_process(
+    seconds: float = Query(10, gt=0, le=60),
+    interval_ms: float = Query(10, ge=1, le=1000),
+    include_idle: bool = Query(False, description="Keep threads that are waiting"),
+    user: Dbuser = Depends(get_current_user),
+):
+    if not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    collapsed = profiler.profile(seconds, interval_ms, include_idle)
+    if collapsed is None:
+        raise HTTPException(status_code=409, detail="A profile is already running")
+    return collapsed
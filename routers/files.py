@@ -1,19 +1,67 @@
-from fastapi import APIRouter, Query, UploadFile, File, Depends, HTTPException, status
+from fastapi import (
+    APIRouter,
+    Query,
+    Request,
+    UploadFile,
+    File,
+    Depends,
+    HTTPException,
+    status,
+)
 from sqlalchemy.orm import Session
-from cloudinary_config import get_cloudinary
 from db import file_services
 from db.database import get_db
-from typing import List, Optional
-import cloudinary
-import cloudinary.uploader
+from typing import BinaryIO, List, Optional, Union
 from datetime import datetime
 from auth.oauth2 import get_current_user
-from db.models import Dbuser, UploadedFile
-from schemas import FileUploadOut
+from db.models import Dbuser, IsUploadStatus, UploadedFile
+from schemas import (
+    FileBulkDeleteRequest,
+    FileBulkDeleteResult,
+    FileUploadOut,
+    UploadSessionCreate,
+    UploadSessionOut,
+)
+from storage import content_hash, storage
+from image_derivatives import is_image, store_derivatives
 
 router = APIRouter(prefix="/files", tags=["files"])
 
-cloudinary = get_cloudinary()
+
+async def store_content(
+    db: Session,
+    db_file: UploadedFile,
+    fileobj: BinaryIO,
+    derivative_source: Union[BinaryIO, str],
+    size: Optional[int],
+    image: bool,
+) -> UploadedFile:
+    """
+    Complete db_file with its content. Content that is already stored is only
+    referenced again; anything new is uploaded once, with its image renditions.
+    """
+    digest = await storage.run(content_hash, fileobj)
+    if file_services.reuse_stored_object(db, db_file, digest, storage.default):
+        return db_file
+
+    # Upload to the storage backend off the event loop
+    folder = f"user_uploads/{db_file.user_id}"
+    stored = await storage.upload_stream(fileobj, folder=folder, size=size)
+
+    # Thumbnail, card and full renditions so list pages skip the original
+    derivatives = None
+    if image:
+        derivatives = await store_derivatives(
+            storage, derivative_source, folder=folder, size=size
+        )
+
+    if not file_services.store_object(db, db_file, digest, size, stored, derivatives):
+        # The same content was stored concurrently: keep that copy, drop ours
+        await storage.delete_stored(stored, derivatives)
+        if not file_services.reuse_stored_object(db, db_file, digest, storage.default):
+            raise RuntimeError("Stored copy was deleted during the upload")
+
+    return db_file
 
 
 @router.post("/", response_model=FileUploadOut, status_code=status.HTTP_201_CREATED)
@@ -23,33 +71,206 @@ async def upload_file(
     user: Dbuser = Depends(get_current_user),
 ):
     try:
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            file.file, folder=f"user_uploads/{user.id}"
+        db_file = UploadedFile(user_id=user.id, file_name=file.filename)
+        return await store_content(
+            db,
+            db_file,
+            file.file,
+            derivative_source=file.file,
+            size=file.size,
+            image=is_image(file.filename, file.content_type),
         )
 
-        # Save to database
-        db_file = UploadedFile(
-            user_id=user.id,
-            file_name=file.filename,
-            file_url=upload_result["secure_url"],
-            public_id=upload_result["public_id"],
-            upload_date=datetime.utcnow(),
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"File upload failed: {str(e)}",
         )
 
-        db.add(db_file)
-        db.commit()
-        db.refresh(db_file)
 
-        return db_file
+# Chunked, resumable uploads: start, send chunks (in any order, in parallel),
+# check progress to resume, then complete
+
+
+def upload_session_out(db: Session, upload: UploadedFile) -> UploadSessionOut:
+    return UploadSessionOut(
+        id=upload.id,
+        file_name=upload.file_name,
+        status=upload.status.value,
+        total_size=upload.total_size,
+        chunk_size=upload.chunk_size,
+        chunk_count=file_services.chunk_count(upload),
+        received_bytes=upload.received_bytes,
+        missing_chunks=file_services.missing_chunk_indexes(db, upload),
+    )
+
+
+def get_upload_or_404(db: Session, upload_id: int, user: Dbuser) -> UploadedFile:
+    upload = file_services.get_upload_session(db, upload_id, user.id)
+    if not upload:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found"
+        )
+    return upload
+
+
+@router.post(
+    "/uploads", response_model=UploadSessionOut, status_code=status.HTTP_201_CREATED
+)
+async def start_chunked_upload(
+    request: UploadSessionCreate,
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(get_current_user),
+):
+    upload = file_services.create_upload_session(
+        db,
+        user_id=user.id,
+        file_name=request.file_name,
+        total_size=request.total_size,
+        chunk_size=request.chunk_size,
+    )
+    await storage.run(storage.staging.create, upload.id, upload.total_size)
+    return upload_session_out(db, upload)
+
+
+@router.get("/uploads/{upload_id}", response_model=UploadSessionOut)
+async def get_chunked_upload(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(get_current_user),
+):
+    return upload_session_out(db, get_upload_or_404(db, upload_id, user))
+
+
+@router.put(
+    "/uploads/{upload_id}/chunks/{chunk_index}", response_model=UploadSessionOut
+)
+async def upload_chunk(
+    upload_id: int,
+    chunk_index: int,
+    request: Request,
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(get_current_user),
+):
+    upload = get_upload_or_404(db, upload_id, user)
+
+    expected_size = file_services.expected_chunk_size(upload, chunk_index)
+    if expected_size is None:
+        raise HTTPException(status_code=400, detail="Chunk index out of range")
 
+    wrong_size = HTTPException(
+        status_code=400,
+        detail=f"Chunk {chunk_index} must be exactly {expected_size} bytes",
+    )
+    declared = request.headers.get("content-length")
+    if declared is not None and declared != str(expected_size):
+        raise wrong_size
+
+    # Read at most one byte past the expected size, whatever the client sends
+    data = bytearray()
+    async for piece in request.stream():
+        data += piece
+        if len(data) > expected_size:
+            raise wrong_size
+    if len(data) != expected_size:
+        raise wrong_size
+
+    await storage.run(
+        storage.staging.write_chunk,
+        upload.id,
+        chunk_index * upload.chunk_size,
+        data,
+    )
+    upload = file_services.record_chunk(db, upload, chunk_index, len(data))
+    return upload_session_out(db, upload)
+
+
+@router.post("/uploads/{upload_id}/complete", response_model=FileUploadOut)
+async def complete_chunked_upload(
+    upload_id: int,
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(get_current_user),
+):
+    upload = get_upload_or_404(db, upload_id, user)
+
+    # Claimed before anything is read, so concurrent completes store it once
+    if not file_services.claim_upload_completion(db, upload):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="Upload is already being completed",
+        )
+
+    missing = file_services.missing_chunk_indexes(db, upload)
+    if missing:
+        file_services.release_upload_completion(db, upload)
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail=f"Missing chunks: {missing}",
+        )
+
+    try:
+        staged = await storage.run(storage.staging.open, upload.id)
+        try:
+            # The renditions worker process reads the staged file itself
+            upload = await store_content(
+                db,
+                upload,
+                staged,
+                derivative_source=storage.staging.path(upload.id),
+                size=upload.total_size,
+                image=is_image(upload.file_name),
+            )
+        finally:
+            staged.close()
     except Exception as e:
         db.rollback()
+        # The staged chunks are kept, so the client can retry complete
+        file_services.release_upload_completion(db, upload)
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"File upload failed: {str(e)}",
         )
 
+    await storage.run(storage.staging.discard, upload.id)
+    return upload
+
+
+@router.post("/bulk-delete", response_model=FileBulkDeleteResult)
+async def bulk_delete_files(
+    request: FileBulkDeleteRequest,
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(get_current_user),
+):
+    file_ids = list(dict.fromkeys(request.file_ids))
+    files = (
+        db.query(UploadedFile)
+        .filter(UploadedFile.id.in_(file_ids), UploadedFile.user_id == user.id)
+        .all()
+    )
+    found = {db_file.id for db_file in files}
+
+    try:
+        for db_file in files:
+            if db_file.status != IsUploadStatus.complete:
+                await storage.run(storage.staging.discard, db_file.id)
+
+        # One transaction for the rows, then batched backend deletes
+        deletions = file_services.release_files(db, files)
+        await storage.run(file_services.purge_deletions, db, deletions)
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"File deletion failed: {str(e)}",
+        )
+
+    return FileBulkDeleteResult(
+        deleted=[file_id for file_id in file_ids if file_id in found],
+        not_found=[file_id for file_id in file_ids if file_id not in found],
+    )
+
 
 @router.delete("/{file_id}", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_file(
@@ -69,12 +290,14 @@ async def delete_file(
         )
 
     try:
-        # Delete from Cloudinary
-        cloudinary.uploader.destroy(db_file.public_id)
+        if db_file.status != IsUploadStatus.complete:
+            await storage.run(storage.staging.discard, db_file.id)
+
+        # Delete from database; the stored object goes with its last reference
+        deletions = file_services.release_files(db, [db_file])
 
-        # Delete from database
-        db.delete(db_file)
-        db.commit()
+        # Delete from the storage backend off the event loop
+        await storage.run(file_services.purge_deletions, db, deletions)
 
         return {"message": "File deleted successfully"}
 
@@ -1,9 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from db.database import get_db
 from db import db_hotel
 from db.models import Dbuser
-from schemas import HotelBase, HotelDisplay, UpdateHotelResponse, HotelUpdate
+from schemas import (
+    HotelBase,
+    HotelDisplay,
+    UpdateHotelResponse,
+    HotelUpdate,
+    SearchSort,
+)
 from typing import Optional, List
 from auth.oauth2 import get_current_user
 from fastapi import Response
@@ -51,8 +57,49 @@ def get_hotels(
     max_rating: Optional[float] = Query(None, ge=1.0, le=5.0),
     owner_id: Optional[int] = None,
     is_approved: Optional[bool] = None,
+    latitude: Optional[float] = Query(None, ge=-90.0, le=90.0),
+    longitude: Optional[float] = Query(None, ge=-180.0, le=180.0),
+    radius_km: Optional[float] = Query(
+        None, gt=0, description="Only hotels within this distance of the point"
+    ),
+    nearest: Optional[int] = Query(
+        None, gt=0, le=100, description="Return the k hotels closest to the point"
+    ),
+    min_latitude: Optional[float] = Query(None, ge=-90.0, le=90.0),
+    max_latitude: Optional[float] = Query(None, ge=-90.0, le=90.0),
+    min_longitude: Optional[float] = Query(None, ge=-180.0, le=180.0),
+    max_longitude: Optional[float] = Query(None, ge=-180.0, le=180.0),
+    sort: Optional[SearchSort] = Query(
+        None,
+        description="Order results; ignored for point searches, which sort by distance",
+    ),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, gt=0, le=100),
     db: Session = Depends(get_db),
 ):
+    if (latitude is None) != (longitude is None):
+        raise HTTPException(
+            status_code=400, detail="latitude and longitude must be given together"
+        )
+
+    if (radius_km is not None or nearest is not None) and latitude is None:
+        raise HTTPException(
+            status_code=400,
+            detail="radius_km and nearest require latitude and longitude",
+        )
+
+    if (min_latitude is None) != (max_latitude is None) or (
+        min_longitude is None
+    ) != (max_longitude is None):
+        raise HTTPException(
+            status_code=400, detail="Bounding box needs both a min and a max bound"
+        )
+
+    if min_latitude is not None and min_latitude > max_latitude:
+        raise HTTPException(
+            status_code=400, detail="min_latitude cannot be greater than max_latitude"
+        )
+
     if owner_id is not None:
         user = db.query(Dbuser).filter(Dbuser.id == owner_id).first()
         if not user:
@@ -66,8 +113,17 @@ def get_hotels(
         max_rating=max_rating,
         is_approved=is_approved,
         owner_id=owner_id,
-        skip=0,
-        limit=100,
+        latitude=latitude,
+        longitude=longitude,
+        radius_km=radius_km,
+        nearest=nearest,
+        min_latitude=min_latitude,
+        max_latitude=max_latitude,
+        min_longitude=min_longitude,
+        max_longitude=max_longitude,
+        sort=sort,
+        skip=skip,
+        limit=limit,
     )
 
 
@@ -81,7 +137,6 @@ def get_hotels(
 def update_hotel(
     id: int,
     request: HotelUpdate,
-    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     user: Dbuser = Depends(get_current_user),
 ):
@@ -99,7 +154,7 @@ def update_hotel(
             status_code=403, detail="Only an admin can update is_approved"
         )
 
-    updated_hotel = db_hotel.update_hotel(db, id, request, background_tasks, user)
+    updated_hotel = db_hotel.update_hotel(db, id, request, user)
 
     if not updated_hotel:
         raise HTTPException(status_code=500, detail="Failed to update hotel")
@@ -0,0 +1,50 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import List, Optional
+from auth.oauth2 import get_current_user
+from db.database import get_db
+from db import db_job
+from db.models import Dbuser, IsJobStatus
+from schemas import JobShow, JobStatus
+
+
+router = APIRouter(prefix="/jobs", tags=["Job queue"])
+
+
+def require_superuser(user: Dbuser = Depends(get_current_user)) -> Dbuser:
+    if not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Admins only")
+    return user
+
+
+@router.get("/metrics", summary="Queue depth and job latency")
+def get_queue_metrics(
+    window_minutes: int = Query(60, gt=0, le=24 * 60),
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(require_superuser),
+):
+    return db_job.queue_metrics(db, window_minutes)
+
+
+@router.get("/", response_model=List[JobShow])
+def get_jobs(
+    status: Optional[JobStatus] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, gt=0, le=500),
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(require_superuser),
+):
+    job_status = IsJobStatus(status.value) if status else None
+    return db_job.get_jobs(db, job_status, skip, limit)
+
+
+@router.post("/{job_id}/retry", response_model=JobShow, summary="Requeue a dead job")
+def retry_job(
+    job_id: int,
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(require_superuser),
+):
+    job = db_job.retry_dead_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Dead job not found")
+    return job
@@ -1,20 +1,26 @@
 from fastapi import APIRouter, Depends, HTTPException, Path, Query, status
 from sqlalchemy.orm import Session
 from db.database import get_db
-from schemas import PaymentCreate, PaymentShow, PaymentStatus
+from schemas import PaymentCreate, PaymentReportRow, PaymentShow, PaymentStatus
 from db import db_payment
 from auth.oauth2 import get_current_user
-from db.models import Dbuser, Dbbooking
+from db.models import Dbuser, Dbbooking, IsPaymentStatus
 from decimal import Decimal
-from typing import List, Optional
+from typing import List, Literal, Optional
 from datetime import date
 from db.db_payment import search_payments
+from task.payment_pipeline import payment_pipeline
 
 
 router = APIRouter(prefix="/payments", tags=["payment"])
 
 
-@router.post("/", response_model=PaymentShow, status_code=status.HTTP_201_CREATED)
+@router.post(
+    "/",
+    response_model=PaymentShow,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Submit a payment; it settles asynchronously",
+)
 def make_payment_for_user(
     payment: PaymentCreate,
     db: Session = Depends(get_db),
@@ -34,7 +40,7 @@ def make_payment_for_user(
         )
 
     existing_payment = db_payment.get_payment_by_booking(db, payment.booking_id)
-    if existing_payment:
+    if existing_payment and existing_payment.status != IsPaymentStatus.failed:
         raise HTTPException(
             status_code=400, detail="Payment already exists for this booking."
         )
@@ -53,26 +59,74 @@ def make_payment_for_user(
             detail=f"Overpayment detected. You must pay exactly {expected_amount}.",
         )
 
-    # when the card is valid and the amount is exact the payment is completed
-    payment_status = "completed"
+    # Save as pending; the pipeline charges the card and settles the payment
+    # and the booking together once the gateway answers
+    if existing_payment:
+        saved_payment = db_payment.retry_failed_payment(db, existing_payment, payment)
+        if saved_payment is None:
+            raise HTTPException(
+                status_code=409, detail="Payment already exists for this booking."
+            )
+    else:
+        saved_payment = db_payment.create_payment(
+            db,
+            payment,
+            user_id=current_user.id,
+            status=PaymentStatus.pending.value,
+            amount=payment.amount,
+        )
 
-    # Save payment
-    saved_payment = db_payment.create_payment(
-        db,
-        payment,
-        user_id=current_user.id,
-        status=payment_status,
-        amount=payment.amount,
+    payment_pipeline.submit(
+        saved_payment.id,
+        saved_payment.amount,
+        card={
+            "card_number": payment.card_number,
+            "expiry_month": payment.expiry_month,
+            "expiry_year": payment.expiry_year,
+            "cvv": payment.cvv,
+        },
     )
 
-    # Update booking status if payment completed
-    if payment_status == PaymentStatus.completed:
-        booking.status = "confirmed"
-        db.commit()
-
     return saved_payment
 
 
+# -------------------------------------------------------------------------------------------
+# Aggregated payment report (superadmin), read from the daily rollups
+@router.get(
+    "/reports/daily",
+    response_model=List[PaymentReportRow],
+    summary="Payment totals by day, status and hotel (superadmin)",
+)
+def payment_report(
+    group_by: List[Literal["day", "status", "hotel"]] = Query(
+        ["day"], description="Dimensions to group by"
+    ),
+    start_date: Optional[date] = Query(None, description="Start of payment date"),
+    end_date: Optional[date] = Query(None, description="End of payment date"),
+    status: Optional[PaymentStatus] = Query(None, description="Filter by status"),
+    hotel_id: Optional[int] = Query(None, gt=0, description="Filter by hotel ID"),
+    db: Session = Depends(get_db),
+    current_user: Dbuser = Depends(get_current_user),
+):
+    if not current_user.is_superuser:
+        raise HTTPException(
+            status_code=403, detail="Only admins can view payment reports."
+        )
+    if start_date and end_date and start_date > end_date:
+        raise HTTPException(
+            status_code=400, detail="start_date cannot be after end_date"
+        )
+
+    return db_payment.payment_report(
+        db,
+        group_by=list(dict.fromkeys(group_by)),
+        start_date=start_date,
+        end_date=end_date,
+        status=status,
+        hotel_id=hotel_id,
+    )
+
+
 # -------------------------------------------------------------------------------------------
 # Get the payment with payment_id
 @router.get(
@@ -116,6 +170,9 @@ def search_payments_superadmin_only(
     end_date: Optional[date] = Query(None, description="End of payment date"),
     min_amount: Optional[Decimal] = Query(None, gt=0, description="Minimum amount"),
     max_amount: Optional[Decimal] = Query(None, gt=0, description="Maximum amount"),
+    refund_needed: Optional[bool] = Query(
+        None, description="Charged for a booking cancelled meanwhile"
+    ),
     db: Session = Depends(get_db),
     current_user: Dbuser = Depends(get_current_user),
 ):
@@ -162,6 +219,7 @@ def search_payments_superadmin_only(
         end_date=end_date,
         min_amount=min_amount,
         max_amount=max_amount,
+        refund_needed=refund_needed,
     )
 
     if not results:
@@ -0,0 +1,77 @@
+from fastapi import APIRouter, Depends, HTTPException, Response, status
+from sqlalchemy.orm import Session
+from typing import List
+from datetime import date
+from auth.oauth2 import get_current_user
+from db.database import get_db
+from db import db_hotel, db_rate_plan, db_room
+from db.models import Dbuser, IsActive
+from schemas import RatePlanBase, RatePlanShow
+
+
+router = APIRouter(prefix="/rate-plans", tags=["Rate plan"])
+
+
+def check_hotel_owner(db: Session, hotel_id: int, user: Dbuser):
+    hotel = db_hotel.get_hotel(db, hotel_id)
+    if not hotel or hotel.is_active == IsActive.deleted:
+        raise HTTPException(status_code=404, detail="Hotel not found")
+    if hotel.owner_id != user.id and not user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+    return hotel
+
+
+@router.post("/", response_model=RatePlanShow, status_code=status.HTTP_201_CREATED)
+def create_rate_plan(
+    request: RatePlanBase,
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(get_current_user),
+):
+    check_hotel_owner(db, request.hotel_id, user)
+
+    if request.room_id is not None:
+        room = db_room.get_room(db, request.room_id)
+        if not room or room.hotel_id != request.hotel_id:
+            raise HTTPException(status_code=404, detail="Room not found in this hotel")
+
+    return db_rate_plan.create_rate_plan(db, request)
+
+
+@router.get("/", response_model=List[RatePlanShow], summary="Rate plans of a hotel")
+def get_rate_plans(hotel_id: int, db: Session = Depends(get_db)):
+    return db_rate_plan.get_rate_plans_by_hotel(db, hotel_id)
+
+
+@router.get("/quote", summary="Quote a stay for rooms of a hotel")
+def quote_stay(
+    hotel_id: int,
+    check_in_date: date,
+    check_out_date: date,
+    db: Session = Depends(get_db),
+):
+    if check_in_date >= check_out_date:
+        raise HTTPException(
+            status_code=400, detail="check_in_date must be before check_out_date."
+        )
+
+    rooms = db_room.get_rooms_by_hotel(db, hotel_id)
+    quotes = db_rate_plan.quote_stays(db, rooms, check_in_date, check_out_date)
+    return [
+        {"room_id": room_id, "total_price": total} for room_id, total in quotes.items()
+    ]
+
+
+@router.delete("/{rate_plan_id}", status_code=status.HTTP_204_NO_CONTENT)
+def delete_rate_plan(
+    rate_plan_id: int,
+    db: Session = Depends(get_db),
+    user: Dbuser = Depends(get_current_user),
+):
+    rate_plan = db_rate_plan.get_rate_plan(db, rate_plan_id)
+    if not rate_plan:
+        raise HTTPException(status_code=404, detail="Rate plan not found")
+
+    check_hotel_owner(db, rate_plan.hotel_id, user)
+    db_rate_plan.delete_rate_plan(db, rate_plan_id)
+
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
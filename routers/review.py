@@ -8,12 +8,14 @@ from schemas import (
     IsReviewStatus,
     ReviewCreate,
     IsReviewStatusSearch,
+    ReviewSummary,
+    ReviewModerationRequest,
+    ReviewModerationResponse,
 )
 from db import db_review
 from typing import List, Optional
 from datetime import date
 from auth.oauth2 import get_current_user
-from db.db_review import update_avg_review_score
 
 
 router = APIRouter(prefix="/reviews", tags=["Review"])
@@ -76,6 +78,22 @@ def submit_review(
     return db_review.create_review(db=db, request=request)
 
 
+# -------------------------------------------------------------------------------------------------
+# Star distribution, status counts and recent counts for one hotel
+
+
+@router.get(
+    "/hotels/{hotel_id}/summary",
+    response_model=ReviewSummary,
+    summary="Review summary of a hotel",
+)
+def get_hotel_review_summary(hotel_id: int, db: Session = Depends(get_db)):
+    summary = db_review.get_review_summary(db, hotel_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Hotel not found.")
+    return summary
+
+
 # -------------------------------------------------------------------------------------------------
 # Get the review with review_id
 
@@ -145,42 +163,11 @@ def filter_reviews(
         None, description="End date for filtering reviews"
     ),
     search: Optional[str] = Query(None, description="Search term in review comments"),
+    diagnostics: bool = Query(
+        True,
+        description="Explain empty results (missing user, hotel, booking). Set false for light public traffic.",
+    ),
 ):
-    # Existence checks
-    if user_id is not None and not db_review.user_exists(db, user_id):
-        raise HTTPException(
-            status_code=404, detail=f"User with ID {user_id} does not exist."
-        )
-
-    if hotel_id is not None and not db_review.hotel_exists(db, hotel_id):
-        raise HTTPException(
-            status_code=404, detail=f"Hotel with ID {hotel_id} does not exist."
-        )
-
-    if booking_id is not None and not db_review.booking_exists(db, booking_id):
-        raise HTTPException(
-            status_code=404, detail=f"Booking with ID {booking_id} does not exist."
-        )
-
-    if user_id is not None and hotel_id is not None:
-        if not db_review.review_exists_for_user_and_hotel(db, user_id, hotel_id):
-            raise HTTPException(
-                status_code=400,
-                detail=f"User ID {user_id} does not have any reviews for Hotel ID {hotel_id}.",
-            )
-
-    if user_id is not None and booking_id is not None:
-        if not db_review.booking_belongs_to_user(db, user_id, booking_id):
-            raise HTTPException(
-                status_code=400,
-                detail=f"Booking ID {booking_id} does not belong to User ID {user_id}.",
-            )
-        if not db_review.review_exists_for_user_and_booking(db, user_id, booking_id):
-            raise HTTPException(
-                status_code=400,
-                detail=f"User ID {user_id} has not submitted a review for Booking ID {booking_id}.",
-            )
-
     # Validate rating format
     min_rating = validate_rating(min_rating, "min_rating")
     max_rating = validate_rating(max_rating, "max_rating")
@@ -199,6 +186,46 @@ def filter_reviews(
         search=search,
     )
 
+    # Any match means every existence check would have passed, so the
+    # diagnostics query only runs for empty results, and never in light mode
+    if not reviews and diagnostics:
+        checks = db_review.review_filter_diagnostics(
+            db, user_id=user_id, hotel_id=hotel_id, booking_id=booking_id
+        )
+
+        if not checks.get("user_exists", True):
+            raise HTTPException(
+                status_code=404, detail=f"User with ID {user_id} does not exist."
+            )
+
+        if not checks.get("hotel_exists", True):
+            raise HTTPException(
+                status_code=404, detail=f"Hotel with ID {hotel_id} does not exist."
+            )
+
+        if not checks.get("booking_exists", True):
+            raise HTTPException(
+                status_code=404, detail=f"Booking with ID {booking_id} does not exist."
+            )
+
+        if not checks.get("review_for_user_and_hotel", True):
+            raise HTTPException(
+                status_code=400,
+                detail=f"User ID {user_id} does not have any reviews for Hotel ID {hotel_id}.",
+            )
+
+        if not checks.get("booking_belongs_to_user", True):
+            raise HTTPException(
+                status_code=400,
+                detail=f"Booking ID {booking_id} does not belong to User ID {user_id}.",
+            )
+
+        if not checks.get("review_for_user_and_booking", True):
+            raise HTTPException(
+                status_code=400,
+                detail=f"User ID {user_id} has not submitted a review for Booking ID {booking_id}.",
+            )
+
     # No match
     if not reviews:
         raise HTTPException(
@@ -244,27 +271,60 @@ def edit_review(
             detail="You can only edit reviews that are pending. Contact support for other changes.",
         )
 
-    updated_review = db_review.update_review_by_id(
+    # Edits by non-admins go back to pending; the hotel's rating totals are
+    # adjusted in the same transaction
+    if current_user.is_superuser:
+        new_status = updated_review.status.value if updated_review.status else None
+    else:
+        new_status = IsReviewStatus.pending.value
+
+    return db_review.update_review_by_id(
         db=db,
         review_id=review_id,
         new_rating=updated_review.rating,
         new_comment=updated_review.comment,
-        new_status=updated_review.status.value
-        if current_user.is_superuser and updated_review.status
-        else None,
+        new_status=new_status,
     )
 
-    # Reset status if edited by non-admin
+
+# -------------------------------------------------------------------------------------------------
+# bulk moderation - only admin
+
+
+@router.post(
+    "/moderate",
+    response_model=ReviewModerationResponse,
+    summary="Moderate many reviews at once (admin only)",
+)
+def moderate_reviews(
+    request: ReviewModerationRequest,
+    db: Session = Depends(get_db),
+    current_user: Dbuser = Depends(get_current_user),
+):
     if not current_user.is_superuser:
-        updated_review.status = IsReviewStatus.pending
-        db.commit()
+        raise HTTPException(
+            status_code=403, detail="Only admins can moderate reviews."
+        )
 
-    # If admin confirmed the review, update the hotel's average score
-    if current_user.is_superuser:
-        hotel_id = db.query(Dbreview.hotel_id).filter(Dbreview.id == review_id).scalar()
-        update_avg_review_score(db=db, hotel_id=hotel_id)
+    decisions = {item.review_id: item.status.value for item in request.items}
+    if len(decisions) != len(request.items):
+        raise HTTPException(
+            status_code=400, detail="Each review can only appear once per request."
+        )
 
-    return updated_review
+    outcomes = db_review.moderate_reviews(db, decisions)
+
+    return ReviewModerationResponse(
+        updated=sum(1 for outcome in outcomes.values() if outcome == "updated"),
+        results=[
+            {
+                "review_id": item.review_id,
+                "status": item.status,
+                "result": outcomes[item.review_id],
+            }
+            for item in request.items
+        ],
+    )
 
 
 # -------------------------------------------------------------------------------------------------
@@ -297,9 +357,5 @@ def delete_review(
     if review.status.value == IsReviewStatus.deleted.value:
         raise HTTPException(status_code=400, detail="Review is already deleted.")
 
-    # Soft delete
-    review.status = IsReviewStatus.deleted
-    db.commit()
-
-    # Recalculate average score using with function
-    update_avg_review_score(db=db, hotel_id=review.hotel_id)
+    # Soft delete; adjusts the hotel's rating totals in the same commit
+    db_review.soft_delete_review_by_id(db, review_id)
@@ -1,11 +1,18 @@
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
 from sqlalchemy.orm import Session
 from db.database import get_db
-from db import db_room, db_hotel
+from db import db_room, db_hotel, db_rate_plan
 from db.models import Dbuser, Dbhotel
-from schemas import RoomBase, RoomDisplay, RoomUpdate, RoomCreate
+from schemas import (
+    RoomBase,
+    RoomDisplay,
+    RoomUpdate,
+    RoomCreate,
+    RoomSearchWithFacets,
+    SearchSort,
+)
 from decimal import Decimal
-from typing import Optional, List
+from typing import Literal, Optional, List, Union
 from auth.oauth2 import get_current_user
 from datetime import date
 from db.models import IsActive, IsRoomStatus
@@ -71,7 +78,12 @@ def update_room(
 
 
 # Advanced room search with filters and availability
-@router.get("/", response_model=List[RoomDisplay], summary="Room search")
+@router.get(
+    "/",
+    response_model=Union[List[RoomDisplay], RoomSearchWithFacets],
+    summary="Room search",
+    description="Set facets=true to also get amenity, price and bed counts for the same filters.",
+)
 def search_rooms(
     hotel_id: Optional[int] = None,
     search_term: Optional[str] = None,
@@ -82,9 +94,15 @@ def search_rooms(
     max_price: Optional[Decimal] = None,
     check_in_date: Optional[date] = None,
     check_out_date: Optional[date] = None,
+    facets: bool = False,
+    sort: Optional[SearchSort] = Query(
+        None, description="Order results; best_value mixes hotel rating and price"
+    ),
+    skip: int = Query(0, ge=0),
+    limit: Optional[int] = Query(None, gt=0, le=500),
     db: Session = Depends(get_db),
 ):
-    return db_room.advanced_room_search(
+    query = db_room.build_room_search_query(
         db=db,
         search_term=search_term,
         wifi=wifi,
@@ -97,6 +115,42 @@ def search_rooms(
         hotel_id=hotel_id,
     )
 
+    results = db_room.apply_room_sort(query, sort, search_term, skip, limit).all()
+
+    # Quote the whole stay for every result in one pass
+    if check_in_date and check_out_date:
+        quotes = db_rate_plan.quote_stays(db, results, check_in_date, check_out_date)
+        for room in results:
+            room.total_price = quotes.get(room.id)
+
+    if not facets:
+        return results
+
+    return RoomSearchWithFacets(
+        results=results,
+        facets=db_room.room_search_facets(db, query),
+    )
+
+
+# Rooms of a hotel with their status on a date
+@router.get(
+    "/hotel/{hotel_id}",
+    response_model=List[RoomDisplay],
+    summary="Rooms of a hotel",
+    description="status is derived from bookings for on_date (default today).",
+)
+def get_hotel_rooms(
+    hotel_id: int,
+    status: Optional[Literal["available", "booked", "unavailable"]] = None,
+    on_date: Optional[date] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, gt=0, le=500),
+    db: Session = Depends(get_db),
+):
+    return db_room.get_rooms_by_hotel(
+        db, hotel_id, status=status, skip=skip, limit=limit, on_date=on_date
+    )
+
 
 #  Get a room by an id
 @router.get("/{room_id}", response_model=RoomDisplay, summary="Get a room by room ID")
@@ -131,7 +185,7 @@ def delete_room(
         )
 
     room.is_active = IsActive.deleted
-    room.status = IsRoomStatus.unavailable
+    room.service_status = IsRoomStatus.unavailable
     db.commit()
 
     return Response(status_code=status.HTTP_204_NO_CONTENT)
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, File, HTTPException, Query, UploadFile, status
 from sqlalchemy.orm import Session
 from auth.oauth2 import create_access_token, get_current_user
 from db.database import get_db
-from schemas import UserBase, UpdateUserResponse, UserDisplay, UserUpdate
+from schemas import (
+    UserBase,
+    UpdateUserResponse,
+    UserDisplay,
+    UserImportResult,
+    UserUpdate,
+)
 from db import db_user
 from db.models import Dbuser
+import csv
+import io
 import re
 from db.models import IsActive
-from typing import List, Optional
-from sqlalchemy import or_
+from typing import List, Literal, Optional
 from fastapi import Response
 
 router = APIRouter(prefix="/users", tags=["user"])
@@ -72,6 +79,44 @@ def register_user(request: UserBase, db: Session = Depends(get_db)):
     return UserDisplay.model_validate(new_user)
 
 
+# Admin imports users in bulk
+@router.post(
+    "/import",
+    response_model=UserImportResult,
+    summary="Admin bulk imports users",
+    description="CSV with a header row, or NDJSON: username, email, password, "
+    "phone_number. Invalid and conflicting rows are reported and skipped.",
+)
+def import_users(
+    file: UploadFile = File(...),
+    file_format: Optional[Literal["csv", "ndjson"]] = Query(
+        None, alias="format", description="Defaults to the file extension"
+    ),
+    db: Session = Depends(get_db),
+    current_user: Dbuser = Depends(get_current_user),
+):
+    if not current_user.is_superuser:
+        raise HTTPException(status_code=403, detail="Not authorized")
+
+    # Imported here: user_import uses this module's validators
+    import user_import
+
+    file_format = file_format or user_import.detect_format(file.filename)
+    if not file_format:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unknown file type; use .csv or .ndjson, or pass format",
+        )
+
+    fileobj = io.TextIOWrapper(file.file, encoding="utf-8-sig", newline="")
+    try:
+        return user_import.import_users(db, fileobj, file_format)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail=f"Unreadable file: {e}"
+        )
+
+
 @router.patch("/{user_id}", response_model=UpdateUserResponse)
 async def update_user(
     user_id: int,
@@ -166,34 +211,24 @@ def get_all_users(
     username: Optional[str] = None,
     email: Optional[str] = None,
     phone_number: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, gt=0, le=100),
     db: Session = Depends(get_db),
     current_user: Dbuser = Depends(get_current_user),
 ):
     if not current_user.is_superuser:
         raise HTTPException(status_code=403, detail="Not authorized")
 
-    query = db.query(Dbuser).filter(Dbuser.status != IsActive.deleted)
-
-    # 🔍 Fuzzy match on any field
-    if search_term:
-        search = f"%{search_term.strip()}%"
-        query = query.filter(
-            or_(
-                Dbuser.username.ilike(search),
-                Dbuser.email.ilike(search),
-                Dbuser.phone_number.ilike(search),
-            )
-        )
-
-    # 🔎 Specific filters
-    if username:
-        query = query.filter(Dbuser.username.ilike(f"%{username.strip()}%"))
-    if email:
-        query = query.filter(Dbuser.email.ilike(f"%{email.strip()}%"))
-    if phone_number:
-        query = query.filter(Dbuser.phone_number.ilike(f"%{phone_number.strip()}%"))
-
-    return query.all()
+    # Prefix matches on indexed columns, best matches first
+    return db_user.search_users(
+        db,
+        search_term=search_term,
+        username=username,
+        email=email,
+        phone_number=phone_number,
+        skip=skip,
+        limit=limit,
+    )
 
 
 # Admin sees user's info
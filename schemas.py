@@ -1,7 +1,7 @@
 from decimal import Decimal
 from datetime import date, timedelta, datetime
 import re
-from typing import Annotated, Literal, Optional, List
+from typing import Annotated, Dict, Literal, Optional, List
 from db.models import IsActive
 from pydantic import (
     BaseModel,
@@ -81,6 +81,18 @@ class TokenResponse(BaseModel):
     token_type: str
 
 
+class UserImportError(BaseModel):
+    row: int  # 1-based data row (CSV header and blank lines not counted)
+    field: Optional[str] = None  # Set for validation errors and conflicts
+    detail: str
+
+
+class UserImportResult(BaseModel):
+    created: int
+    failed: int
+    errors: List[UserImportError]
+
+
 # Hotel
 
 
@@ -93,6 +105,8 @@ class HotelBase(BaseModel):
     phone_number: Optional[str]
     email: Optional[str]
     is_approved: bool = False
+    latitude: Optional[float] = Field(None, ge=-90.0, le=90.0)
+    longitude: Optional[float] = Field(None, ge=-180.0, le=180.0)
 
 
 class HotelDisplay(BaseModel):
@@ -101,10 +115,15 @@ class HotelDisplay(BaseModel):
     location: str
     description: Optional[str]
     img_link: Optional[str]
+    img_thumbnail_link: Optional[str] = None  # For list pages
+    img_card_link: Optional[str] = None
     is_approved: bool
     avg_review_score: Optional[Decimal]
     phone_number: Optional[str]
     email: Optional[str]
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
+    distance_km: Optional[float] = None  # Only set by geospatial searches
 
     class Config:
         from_attributes = True
@@ -124,6 +143,8 @@ class HotelUpdate(BaseModel):
     phone_number: Optional[str] = None
     email: Optional[str] = None
     is_approved: Optional[bool] = None
+    latitude: Optional[float] = Field(None, ge=-90.0, le=90.0)
+    longitude: Optional[float] = Field(None, ge=-180.0, le=180.0)
 
 
 # Room
@@ -136,7 +157,7 @@ class RoomBase(BaseModel):
     wifi: bool = False
     air_conditioner: bool = False
     tv: bool = False
-    status: Literal["available", "booked"] = "available"
+    status: Literal["available", "unavailable"] = "available"  # Booked is derived
     bed_count: int
 
 
@@ -161,6 +182,7 @@ class RoomDisplay(BaseModel):
     tv: bool
     status: str
     bed_count: int
+    total_price: Optional[Decimal] = None  # Stay quote, when dates are searched
 
     class Config:
         from_attributes = True
@@ -172,11 +194,23 @@ class RoomUpdate(BaseModel):
     wifi: Optional[bool] = None
     air_conditioner: Optional[bool] = None
     tv: Optional[bool] = None
-    status: Optional[Literal["available", "booked", "unavailable"]] = None
+    status: Optional[Literal["available", "unavailable"]] = None
     bed_count: Optional[int] = None
     is_active: Optional[Literal["inactive", "active", "deleted"]] = "active"
 
 
+class RoomFacets(BaseModel):
+    total: int
+    amenities: Dict[str, int]
+    price_buckets: Dict[str, int]
+    bed_count: Dict[str, int]
+
+
+class RoomSearchWithFacets(BaseModel):
+    results: List[RoomDisplay]
+    facets: RoomFacets
+
+
 class RoomSearch(BaseModel):
     search_term: Optional[str] = None
     amenities: Optional[List[str]] = Field(None, example=["wifi", "air_conditioner"])
@@ -187,6 +221,42 @@ class RoomSearch(BaseModel):
     location: Optional[str] = None
 
 
+# Rate plans
+
+
+class RatePlanBase(BaseModel):
+    hotel_id: int
+    room_id: Optional[int] = None
+    name: str
+    start_date: Optional[date] = None
+    end_date: Optional[date] = Field(None, validate_default=True)
+    season_multiplier: condecimal(gt=0, max_digits=5, decimal_places=2) = Decimal("1")
+    weekend_multiplier: condecimal(gt=0, max_digits=5, decimal_places=2) = Decimal(
+        "1"
+    )
+    los_min_nights: Optional[int] = Field(None, ge=2)
+    los_discount_percent: condecimal(ge=0, lt=100, max_digits=5, decimal_places=2) = (
+        Decimal("0")
+    )
+
+    @field_validator("end_date")
+    @classmethod
+    def validate_season(cls, v, info):
+        start = info.data.get("start_date")
+        if (start is None) != (v is None):
+            raise ValueError("start_date and end_date must be given together")
+        if start is not None and v < start:
+            raise ValueError("end_date cannot be before start_date")
+        return v
+
+
+class RatePlanShow(RatePlanBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+
 # Booking
 
 
@@ -320,11 +390,20 @@ class PaymentShow(BaseModel):
     amount: Decimal
     status: PaymentStatus
     payment_date: date
+    refund_needed: bool = False
 
     class Config:
         from_attributes = True
 
 
+class PaymentReportRow(BaseModel):
+    day: Optional[date] = None
+    status: Optional[PaymentStatus] = None
+    hotel_id: Optional[int] = None
+    payment_count: int
+    amount_sum: Decimal
+
+
 # Review
 
 
@@ -379,6 +458,44 @@ class ReviewUpdate(BaseModel):
     status: Optional[IsReviewStatus] = None  # Admin only
 
 
+class SearchSort(str, Enum):
+    price_asc = "price_asc"
+    price_desc = "price_desc"
+    rating = "rating"
+    newest = "newest"
+    relevance = "relevance"
+    best_value = "best_value"
+
+
+class ReviewModerationItem(BaseModel):
+    review_id: int
+    status: IsReviewStatusSearch
+
+
+class ReviewModerationRequest(BaseModel):
+    items: List[ReviewModerationItem] = Field(..., min_length=1, max_length=5000)
+
+
+class ReviewModerationResult(BaseModel):
+    review_id: int
+    status: IsReviewStatusSearch
+    result: Literal["updated", "unchanged", "not_found", "deleted"]
+
+
+class ReviewModerationResponse(BaseModel):
+    updated: int
+    results: List[ReviewModerationResult]
+
+
+class ReviewSummary(BaseModel):
+    hotel_id: int
+    average: Optional[Decimal]
+    distribution: Dict[int, int]  # Stars (1-5) -> confirmed reviews
+    status_counts: Dict[str, int]
+    reviews_this_month: int
+    reviews_last_month: int
+
+
 class HotelSearch(BaseModel):
     search_term: Optional[str] = None
     min_price: Optional[Decimal] = None
@@ -390,8 +507,66 @@ class FileUploadOut(BaseModel):
     id: int
     user_id: int
     file_name: str
-    file_url: str
+    file_url: Optional[str]  # None while a chunked upload is in progress
     upload_date: datetime
+    # Resized renditions; only set for images
+    thumbnail_url: Optional[str] = None
+    card_url: Optional[str] = None
+    full_url: Optional[str] = None
+
+    class Config:
+        from_attributes = True
+
+
+class FileBulkDeleteRequest(BaseModel):
+    file_ids: List[int] = Field(..., min_length=1, max_length=1000)
+
+
+class FileBulkDeleteResult(BaseModel):
+    deleted: List[int]
+    not_found: List[int]  # Missing or not yours
+
+
+class UploadSessionCreate(BaseModel):
+    file_name: str
+    total_size: int = Field(..., gt=0, description="Size of the whole file in bytes")
+    chunk_size: int = Field(
+        8 * 1024 * 1024,
+        ge=256 * 1024,
+        le=16 * 1024 * 1024,
+        description="Bytes per chunk; only the last chunk may be shorter",
+    )
+
+
+class UploadSessionOut(BaseModel):
+    id: int
+    file_name: str
+    status: str
+    total_size: int
+    chunk_size: int
+    chunk_count: int
+    received_bytes: int
+    missing_chunks: List[int]
+
+
+class JobStatus(str, Enum):
+    queued = "queued"
+    running = "running"
+    done = "done"
+    dead = "dead"
+
+
+class JobShow(BaseModel):
+    id: int
+    kind: str
+    status: JobStatus
+    attempts: int
+    max_attempts: int
+    run_at: datetime
+    created_at: datetime
+    started_at: Optional[datetime]
+    finished_at: Optional[datetime]
+    last_error: Optional[str]
 
     class Config:
         from_attributes = True
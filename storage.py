@@ -0,0 +1,220 @@
+import asyncio
+import hashlib
+import os
+import shutil
+import uuid
+from contextvars import copy_context
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import BinaryIO, Dict, List, Optional
+import cloudinary.api
+import cloudinary.uploader
+from cloudinary_config import get_cloudinary
+from tracing import tracer
+
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")  # or "local"
+STORAGE_THREADS = int(os.getenv("STORAGE_THREADS", 8))
+MAX_CONCURRENT_UPLOADS = int(os.getenv("MAX_CONCURRENT_UPLOADS", 4))
+LOCAL_STORAGE_DIR = os.getenv("LOCAL_STORAGE_DIR", "media")
+LOCAL_STORAGE_URL = os.getenv("LOCAL_STORAGE_URL", "/media")
+# Must be one shared volume when several API processes or hosts serve uploads
+UPLOAD_STAGING_DIR = os.getenv("UPLOAD_STAGING_DIR", "upload_staging")
+# Files above this go through Cloudinary's chunked upload API
+LARGE_UPLOAD_BYTES = 20 * 1024 * 1024
+UPLOAD_CHUNK_BYTES = 6 * 1024 * 1024
+HASH_BLOCK_BYTES = 1024 * 1024
+CLOUDINARY_DELETE_BATCH = 100  # Most public ids delete_resources accepts per call
+
+
+def content_hash(fileobj: BinaryIO) -> str:
+    """SHA-256 of the whole stream, read in blocks; leaves it rewound"""
+    digest = hashlib.sha256()
+    fileobj.seek(0)
+    for block in iter(lambda: fileobj.read(HASH_BLOCK_BYTES), b""):
+        digest.update(block)
+    fileobj.seek(0)
+    return digest.hexdigest()
+
+
+class StorageBackend:
+    """Blocking storage client; use it through AsyncStorage from async code"""
+
+    name: str = None
+
+    def upload(
+        self, fileobj: BinaryIO, folder: str, size: int = None, suffix: str = ""
+    ) -> dict:
+        """
+        Store the stream and return {"url": ..., "public_id": ...}. suffix is a
+        file extension for backends whose ids are paths (Cloudinary ignores it).
+        """
+        raise NotImplementedError
+
+    def delete(self, public_id: str):
+        raise NotImplementedError
+
+    def delete_many(self, public_ids: List[str]):
+        """Delete many objects; backends with a batch API override this"""
+        for public_id in public_ids:
+            self.delete(public_id)
+
+
+class CloudinaryStorage(StorageBackend):
+    name = "cloudinary"
+
+    def upload(
+        self, fileobj: BinaryIO, folder: str, size: int = None, suffix: str = ""
+    ) -> dict:
+        get_cloudinary()
+        # fileobj is the upload's spooled temp file; the SDK reads it as it sends,
+        # so the body is never copied into memory here
+        large = size is not None and size > LARGE_UPLOAD_BYTES
+        with tracer.span("cloudinary.upload", folder=folder, size=size, large=large):
+            if large:
+                result = cloudinary.uploader.upload_large(
+                    fileobj, folder=folder, chunk_size=UPLOAD_CHUNK_BYTES
+                )
+            else:
+                result = cloudinary.uploader.upload(fileobj, folder=folder)
+        return {"url": result["secure_url"], "public_id": result["public_id"]}
+
+    def delete(self, public_id: str):
+        get_cloudinary()
+        with tracer.span("cloudinary.destroy", public_id=public_id):
+            cloudinary.uploader.destroy(public_id)
+
+    def delete_many(self, public_ids: List[str]):
+        get_cloudinary()
+        for start in range(0, len(public_ids), CLOUDINARY_DELETE_BATCH):
+            batch = public_ids[start : start + CLOUDINARY_DELETE_BATCH]
+            # Ids that are already gone come back as "not_found", which is fine
+            with tracer.span("cloudinary.delete_resources", count=len(batch)):
+                cloudinary.api.delete_resources(batch)
+
+
+class LocalStorage(StorageBackend):
+    """Files on the local disk, served under LOCAL_STORAGE_URL (tests, on-prem)"""
+
+    name = "local"
+
+    def __init__(self, root: str, base_url: str):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+
+    def upload(
+        self, fileobj: BinaryIO, folder: str, size: int = None, suffix: str = ""
+    ) -> dict:
+        public_id = f"{folder}/{uuid.uuid4().hex}{suffix}"
+        path = os.path.join(self.root, public_id)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as out:
+            shutil.copyfileobj(fileobj, out)
+        return {"url": f"{self.base_url}/{public_id}", "public_id": public_id}
+
+    def delete(self, public_id: str):
+        path = os.path.join(self.root, public_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class ChunkStaging:
+    """
+    Staging area for chunked uploads. Each upload is one pre-sized file and
+    every chunk is written at its own offset, so chunks can arrive in parallel
+    and in any order, and a resumed upload only sends the missing ones.
+
+    The chunk rows are in the database but the bytes are on this local disk,
+    so every process that accepts chunks or completes uploads must see the
+    same root: with more than one host (or container) behind the load
+    balancer, mount UPLOAD_STAGING_DIR from a shared volume (NFS, EFS, ...).
+    Otherwise a chunk written on one host is missing on the host that
+    completes the upload, and the stored file is silently corrupt.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, upload_id: int) -> str:
+        return os.path.join(self.root, f"{upload_id}.part")
+
+    def create(self, upload_id: int, total_size: int):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.path(upload_id), "wb") as staged:
+            staged.truncate(total_size)
+
+    def write_chunk(self, upload_id: int, offset: int, data: bytes):
+        with open(self.path(upload_id), "r+b") as staged:
+            staged.seek(offset)
+            staged.write(data)
+
+    def open(self, upload_id: int) -> BinaryIO:
+        return open(self.path(upload_id), "rb")
+
+    def discard(self, upload_id: int):
+        if os.path.exists(self.path(upload_id)):
+            os.remove(self.path(upload_id))
+
+
+class AsyncStorage:
+    """
+    Runs blocking storage clients in a bounded thread pool so the event loop
+    keeps serving other requests, and caps concurrent uploads per worker.
+    """
+
+    def __init__(
+        self,
+        backends: Dict[str, StorageBackend],
+        default: str,
+        threads: int,
+        max_uploads: int,
+    ):
+        self.backends = backends
+        self.default = default
+        self.executor = ThreadPoolExecutor(
+            max_workers=threads, thread_name_prefix="storage"
+        )
+        self.upload_slots = asyncio.Semaphore(max_uploads)
+        self.staging = ChunkStaging(UPLOAD_STAGING_DIR)
+
+    def backend(self, name: Optional[str] = None) -> StorageBackend:
+        return self.backends[name or self.default]
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Run in a copy of the caller's context, so spans nest under its trace
+        call = partial(copy_context().run, func, *args, **kwargs)
+        return await loop.run_in_executor(self.executor, call)
+
+    async def upload(self, file, folder: str) -> dict:
+        return await self.upload_stream(file.file, folder, size=file.size)
+
+    async def upload_stream(
+        self, fileobj: BinaryIO, folder: str, size: int = None, suffix: str = ""
+    ):
+        backend = self.backend()
+        async with self.upload_slots:
+            stored = await self.run(
+                backend.upload, fileobj, folder, size=size, suffix=suffix
+            )
+        stored["backend"] = backend.name
+        return stored
+
+    async def delete(self, public_id: str, backend: Optional[str] = None):
+        return await self.run(self.backend(backend).delete, public_id)
+
+    async def delete_stored(self, stored: dict, derivatives: Optional[dict] = None):
+        """Undo upload_stream (and store_derivatives) results"""
+        for item in [stored, *(derivatives or {}).values()]:
+            await self.delete(item["public_id"], backend=item["backend"])
+
+
+storage = AsyncStorage(
+    {
+        "cloudinary": CloudinaryStorage(),
+        "local": LocalStorage(LOCAL_STORAGE_DIR, LOCAL_STORAGE_URL),
+    },
+    default=STORAGE_BACKEND,
+    threads=STORAGE_THREADS,
+    max_uploads=MAX_CONCURRENT_UPLOADS,
+)
@@ -1,42 +1,85 @@
 import time
-from datetime import date
+import profiler
 from sqlalchemy.orm import Session
-from db.models import Dbbooking, Dbroom, IsRoomStatus
+from db.db_job import enqueue_job
+from db.db_notification import DIGEST_WINDOW_MINUTES
+from db.db_review import reconcile_hotel_ratings, rebuild_review_summaries
+from db.db_payment import reconcile_recent_payment_rollups
 from db.database import (
     SessionLocal,
 )  # Ensure SessionLocal is imported from your database config
 
 
-def update_room_status_periodically():
+def reconcile_aggregates_periodically():
     while True:
         db: Session = SessionLocal()
 
         try:
-            # Log the start of the task
-            print("Checking for expired bookings...")
-
-            # Find all expired bookings
-            expired_bookings = (
-                db.query(Dbbooking)
-                .filter(Dbbooking.check_out_date < date.today())
-                .all()
-            )
+            # Repair any drift in the incrementally maintained aggregates
+            repaired = reconcile_hotel_ratings(db)
+            print(f"Rating reconciliation repaired {repaired} hotels.")
+            rebuilt = rebuild_review_summaries(db)
+            print(f"Rebuilt review summaries for {rebuilt} hotels.")
+            rollups = reconcile_recent_payment_rollups(db)
+            print(f"Rebuilt {rollups} payment rollup rows.")
+        finally:
+            db.close()
+
+        time.sleep(60 * 60 * 24)  # Once a day
+
+
+def collect_orphan_files_periodically():
+    while True:
+        db: Session = SessionLocal()
+
+        try:
+            # The collection itself runs on a job worker (task/job_worker.py)
+            enqueue_job(db, "collect_orphan_files", {}, singleton=True)
+        except Exception as e:
+            print(f"Could not schedule garbage collection: {e}")
+        finally:
+            db.close()
+
+        time.sleep(60 * 60)  # Hourly
+
+
+def expire_stale_payments_periodically():
+    while True:
+        db: Session = SessionLocal()
+
+        try:
+            # Payments whose charge was lost; failed ones can be paid again
+            enqueue_job(db, "expire_stale_payments", {}, singleton=True)
+        except Exception as e:
+            print(f"Could not schedule payment expiry: {e}")
+        finally:
+            db.close()
+
+        time.sleep(5 * 60)
+
+
+def schedule_owner_digests_periodically():
+    while True:
+        time.sleep(DIGEST_WINDOW_MINUTES * 60)  # One digest per owner per window
 
-            if expired_bookings:
-                print(f"Found {len(expired_bookings)} expired bookings.")
-
-            for booking in expired_bookings:
-                # Find the corresponding room and mark it as available
-                room = db.query(Dbroom).filter(Dbroom.id == booking.room_id).first()
-                if room:
-                    room.status = IsRoomStatus.available  # Set room status to available
-                    db.commit()
-                    print(f"Room {room.id} status updated to available.")
-            else:
-                print("No expired bookings found.")
+        db: Session = SessionLocal()
+        try:
+            enqueue_job(db, "send_owner_digests", {}, singleton=True)
+        except Exception as e:
+            print(f"Could not schedule owner digests: {e}")
         finally:
-            db.close()  # Always close the session after use
+            db.close()
+
 
-        time.sleep(
-            60 * 60 * 24
-        )  # Wait for 24 hours before running again (can adjust the interval)
+def write_profiles_periodically():
+    # Continuous low-rate profiling: one collapsed profile per window on disk
+    while True:
+        try:
+            stacks = profiler.sample_stacks(
+                profiler.PROFILE_WINDOW_SECONDS, profiler.PROFILE_INTERVAL_MS
+            )
+            if stacks:
+                profiler.write_profile(stacks)
+        except Exception as e:
+            print(f"Continuous profiling failed: {e}")
+            time.sleep(profiler.PROFILE_WINDOW_SECONDS)
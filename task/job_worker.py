@@ -0,0 +1,218 @@
+import argparse
+import os
+import socket
+import time
+from threading import Thread
+from typing import Callable, Dict, List, Optional
+from db.database import SessionLocal
+from db.models import Dbjob
+from email_utils import build_message, mailer
+from email_templates import templates
+from tracing import tracer
+from profiler import PROFILE_CONTINUOUS
+from task.background_tasks import write_profiles_periodically
+from db.db_job import (
+    claim_job,
+    claim_more_jobs,
+    complete_job,
+    fail_job,
+    finish_job_run,
+    requeue_stuck_jobs,
+    start_job_run,
+)
+
+
+JOB_WORKER_THREADS = int(os.getenv("JOB_WORKER_THREADS", 4))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", 1))
+
+# kind -> handler, kind -> most jobs of that kind running at once across all
+# workers (None for no limit), and kind -> jobs claimed together for a batch
+# handler. A handler takes one payload; a batch handler takes a list of them
+# and returns one error (or None) per payload
+HANDLERS: Dict[str, Callable] = {}
+CONCURRENCY: Dict[str, Optional[int]] = {}
+BATCH_SIZES: Dict[str, int] = {}
+
+
+def job_handler(
+    kind: str, max_concurrency: Optional[int] = None, batch_size: Optional[int] = None
+):
+    def register(func):
+        HANDLERS[kind] = func
+        CONCURRENCY[kind] = max_concurrency
+        if batch_size:
+            BATCH_SIZES[kind] = batch_size
+        return func
+
+    return register
+
+
+# ------------------------------------------------------------------------------------------
+# Handlers
+
+
+# Up to two batches in flight; the mailer also caps connections and rate
+@job_handler("send_email", max_concurrency=100, batch_size=50)
+def send_email_jobs(payloads: List[dict]) -> List[Optional[Exception]]:
+    # Queued emails go out together over the mailer's pooled connections
+    return mailer.send_batch_sync(
+        [
+            build_message(payload["to_email"], payload["subject"], payload["body"])
+            for payload in payloads
+        ]
+    )
+
+
+@job_handler("collect_orphan_files", max_concurrency=1)
+def collect_orphan_files_job(payload: dict):
+    from db.file_services import collect_garbage
+
+    db = SessionLocal()
+    try:
+        run = start_job_run(db, "collect_orphan_files")
+        try:
+            stats = collect_garbage(db)
+        except Exception as e:
+            db.rollback()
+            finish_job_run(db, run, error=str(e))
+            raise
+        finish_job_run(
+            db,
+            run,
+            rows_scanned=stats["files"] + stats["objects"],
+            rows_updated=stats["purged"],
+        )
+    finally:
+        db.close()
+
+
+@job_handler("send_owner_digests", max_concurrency=1)
+def send_owner_digests_job(payload: dict):
+    from db.db_notification import send_owner_digests
+
+    db = SessionLocal()
+    try:
+        sent = send_owner_digests(db)
+        print(f"Queued {sent} owner digests")
+    finally:
+        db.close()
+
+
+@job_handler("settle_payment")
+def settle_payment_job(payload: dict):
+    from db.db_payment import settle_payment
+
+    db = SessionLocal()
+    try:
+        settle_payment(db, payload["payment_id"], approved=payload["approved"])
+    finally:
+        db.close()
+
+
+@job_handler("expire_stale_payments", max_concurrency=1)
+def expire_stale_payments_job(payload: dict):
+    from db.db_payment import expire_stale_payments
+
+    db = SessionLocal()
+    try:
+        expired = expire_stale_payments(db)
+        if expired:
+            print(f"Failed {expired} payments left pending")
+    finally:
+        db.close()
+
+
+# ------------------------------------------------------------------------------------------
+# Worker
+
+
+class JobWorker:
+    """
+    Worker process for the job queue: `threads` threads each claim one job at
+    a time, so a process never runs more than that many jobs at once.
+    """
+
+    def __init__(
+        self, threads: int = JOB_WORKER_THREADS, poll: float = JOB_POLL_SECONDS
+    ):
+        self.threads = threads
+        self.poll = poll
+        self.name = f"{socket.gethostname()}:{os.getpid()}"
+
+    def run_forever(self):
+        for index in range(self.threads):
+            Thread(target=self.work, args=(index,), daemon=True).start()
+        print(f"Job worker {self.name} running {self.threads} threads")
+
+        while True:
+            # Recover jobs whose worker died mid-run
+            db = SessionLocal()
+            try:
+                recovered = requeue_stuck_jobs(db)
+                if recovered:
+                    print(f"Requeued or dead-lettered {recovered} stuck jobs")
+            finally:
+                db.close()
+            time.sleep(60)
+
+    def work(self, index: int):
+        worker = f"{self.name}/{index}"
+        while True:
+            db = SessionLocal()
+            try:
+                job = claim_job(db, worker, CONCURRENCY)
+                if not job:
+                    time.sleep(self.poll)
+                    continue
+
+                if job.kind in BATCH_SIZES:
+                    jobs = [job] + claim_more_jobs(
+                        db,
+                        worker,
+                        job.kind,
+                        BATCH_SIZES[job.kind] - 1,
+                        CONCURRENCY[job.kind],
+                    )
+                    self.run_batch(db, jobs)
+                else:
+                    self.run_batch(db, [job])
+            except Exception as e:
+                # Database trouble; back off and keep the thread alive
+                print(f"Job worker {worker} error: {e}")
+                time.sleep(self.poll)
+            finally:
+                db.close()
+
+    def run_batch(self, db, jobs: List[Dbjob]):
+        kind = jobs[0].kind
+        # Each batch is the root of its own trace
+        with tracer.trace(f"job {kind}", jobs=len(jobs)):
+            try:
+                handler = HANDLERS[kind]
+                if kind in BATCH_SIZES:
+                    errors = handler([job.payload for job in jobs])
+                else:
+                    handler(jobs[0].payload)
+                    errors = [None]
+            except Exception as e:
+                errors = [e] * len(jobs)
+
+        for job, error in zip(jobs, errors):
+            if error is None:
+                complete_job(db, job)
+            else:
+                job = fail_job(db, job, f"{type(error).__name__}: {error}")
+                print(f"Job {job.id} ({kind}) failed, now {job.status.value}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the job queue worker")
+    parser.add_argument("--threads", type=int, default=JOB_WORKER_THREADS)
+    parser.add_argument("--poll", type=float, default=JOB_POLL_SECONDS)
+    args = parser.parse_args()
+
+    templates.compile()
+    if PROFILE_CONTINUOUS:
+        Thread(target=write_profiles_periodically, daemon=True).start()
+
+    JobWorker(threads=args.threads, poll=args.poll).run_forever()
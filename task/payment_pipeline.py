@@ -0,0 +1,144 @@
+import os
+import time
+from decimal import Decimal
+from queue import Queue
+from threading import Thread
+from typing import Callable, Optional
+from payment_gateway import GatewayResult, PaymentGateway, get_payment_gateway
+
+
+class PaymentJob:
+    def __init__(self, payment_id: int, amount: Decimal, card: dict):
+        self.payment_id = payment_id
+        self.amount = amount
+        self.card = card  # Kept in memory only, never written to the database
+
+
+def claim_in_database(payment_id: int) -> bool:
+    from db.database import SessionLocal
+    from db.db_payment import mark_payment_sent
+
+    db = SessionLocal()
+    try:
+        return mark_payment_sent(db, payment_id)
+    finally:
+        db.close()
+
+
+def settle_in_database(payment_id: int, result: GatewayResult):
+    # Imported here so the pipeline itself does not need a database
+    from db.database import SessionLocal
+    from db.db_job import enqueue_job
+    from db.db_payment import settle_payment
+
+    db = SessionLocal()
+    try:
+        try:
+            settle_payment(db, payment_id, approved=result.approved)
+        except Exception as e:
+            db.rollback()
+            # The card was charged (or declined): keep the answer on the durable
+            # job queue rather than lose it
+            print(f"Settling payment {payment_id} failed, queued for retry: {e}")
+            enqueue_job(
+                db,
+                "settle_payment",
+                {"payment_id": payment_id, "approved": result.approved},
+                max_attempts=5,
+            )
+    finally:
+        db.close()
+
+
+class PaymentPipeline:
+    """
+    Request threads submit() a payment and return straight away; worker threads
+    claim it, call the gateway and settle the payment (and booking) when it
+    answers. A payment that cannot be claimed (it expired first) is not charged.
+    """
+
+    def __init__(
+        self,
+        gateway: PaymentGateway,
+        workers: int = 4,
+        settle: Callable[[int, GatewayResult], None] = settle_in_database,
+        claim: Callable[[int], bool] = claim_in_database,
+    ):
+        self.gateway = gateway
+        self.workers = workers
+        self.settle = settle
+        self.claim = claim
+        self.queue: Queue = Queue()
+        self.threads = []
+
+    def start(self):
+        for _ in range(self.workers):
+            thread = Thread(target=self.work, daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, payment_id: int, amount: Decimal, card: dict):
+        self.queue.put(PaymentJob(payment_id, amount, card))
+
+    def join(self):
+        """Block until every submitted payment has been settled"""
+        self.queue.join()
+
+    def work(self):
+        while True:
+            job: Optional[PaymentJob] = self.queue.get()
+            try:
+                try:
+                    claimed = self.claim(job.payment_id)
+                except Exception as e:
+                    # Unrecorded charges could not be told from lost ones; the
+                    # payment stays unsent and expires, and can be retried
+                    print(f"Failed to claim payment {job.payment_id}: {e}")
+                    claimed = False
+                if not claimed:
+                    continue
+
+                try:
+                    result = self.gateway.charge(job.payment_id, job.amount, job.card)
+                except Exception as e:
+                    result = GatewayResult(approved=False, reason=str(e))
+
+                try:
+                    self.settle(job.payment_id, result)
+                except Exception as e:
+                    # Not even queued: the payment stays pending (it was sent,
+                    # so it does not expire) until it is reconciled by hand
+                    print(f"Failed to settle payment {job.payment_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+
+payment_pipeline = PaymentPipeline(
+    gateway=get_payment_gateway(),
+    workers=int(os.getenv("PAYMENT_WORKERS", 4)),
+)
+
+
+def measure_throughput(workers: int, payments: int, latency_ms: float) -> float:
+    """Payments settled per second against the fake gateway, with no database"""
+    from payment_gateway import FakePaymentGateway
+
+    pipeline = PaymentPipeline(
+        gateway=FakePaymentGateway(latency_ms=latency_ms),
+        workers=workers,
+        settle=lambda payment_id, result: None,
+        claim=lambda payment_id: True,
+    )
+    pipeline.start()
+
+    started = time.perf_counter()
+    for payment_id in range(payments):
+        pipeline.submit(payment_id, Decimal("100.00"), {})
+    pipeline.join()
+    return payments / (time.perf_counter() - started)
+
+
+if __name__ == "__main__":
+    for workers in (1, 2, 4, 8, 16, 32):
+        rate = measure_throughput(workers, payments=workers * 20, latency_ms=100)
+        print(f"{workers:>2} workers: {rate:7.1f} payments/s at 100ms gateway latency")
@@ -0,0 +1,124 @@
+import asyncio
+import socket
+import time
+import pytest
+from aiosmtpd.controller import Controller
+from email_utils import Mailer, RateLimiter, build_message
+
+
+class RecordingHandler:
+    def __init__(self):
+        self.messages = []
+        self.peers = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.peers.add(session.peer)
+        return "250 OK"
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def smtp_server():
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=free_port())
+    controller.start()
+    yield controller
+    controller.stop()
+
+
+def make_messages(count: int):
+    return [
+        build_message(f"guest{i}@example.com", f"Test {i}", "Pooled delivery test")
+        for i in range(count)
+    ]
+
+
+def test_reuses_pooled_connections(smtp_server):
+    mailer = Mailer(
+        hostname="127.0.0.1",
+        port=smtp_server.port,
+        pool_size=2,
+        rate_per_second=1000,
+        username=None,
+    )
+    try:
+        errors = mailer.send_batch_sync(make_messages(20))
+    finally:
+        mailer.close()
+
+    assert errors == [None] * 20
+    assert len(smtp_server.handler.messages) == 20
+    # One connection per pool slot, not per message
+    assert len(smtp_server.handler.peers) <= 2
+
+
+def test_rate_limits_delivery(smtp_server):
+    mailer = Mailer(
+        hostname="127.0.0.1",
+        port=smtp_server.port,
+        pool_size=3,
+        rate_per_second=20,
+        username=None,
+    )
+    try:
+        started = time.perf_counter()
+        errors = mailer.send_batch_sync(make_messages(30))
+        elapsed = time.perf_counter() - started
+    finally:
+        mailer.close()
+
+    assert errors == [None] * 30
+    # A burst of 20, then 10 more at 20 per second
+    assert elapsed >= 0.45
+
+
+def test_reconnects_after_server_drops_connections():
+    handler = RecordingHandler()
+    port = free_port()
+    server = Controller(handler, hostname="127.0.0.1", port=port)
+    server.start()
+    mailer = Mailer(
+        hostname="127.0.0.1",
+        port=port,
+        pool_size=1,
+        rate_per_second=1000,
+        username=None,
+    )
+    try:
+        assert mailer.send_batch_sync(make_messages(1)) == [None]
+
+        # The server restarts: the pooled connection is dead
+        server.stop()
+        server = Controller(handler, hostname="127.0.0.1", port=port)
+        server.start()
+
+        assert mailer.send_batch_sync(make_messages(2)) == [None, None]
+    finally:
+        mailer.close()
+        server.stop()
+
+    assert len(handler.messages) == 3
+    assert len(handler.peers) == 2
+
+
+def test_rate_below_one_does_not_hang():
+    async def acquire_twice():
+        limiter = RateLimiter(0.5)
+        await asyncio.wait_for(limiter.acquire(), timeout=1)
+        started = time.monotonic()
+        await asyncio.wait_for(limiter.acquire(), timeout=5)
+        return time.monotonic() - started
+
+    # One message straight away, the next one two seconds later
+    assert 1.5 <= asyncio.run(acquire_twice()) < 5
+
+
+def test_rejects_non_positive_rate():
+    with pytest.raises(ValueError):
+        RateLimiter(0)
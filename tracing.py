@@ -0,0 +1,335 @@
+import atexit
+import json
+import os
+import random
+import time
+import urllib.request
+from contextvars import ContextVar
+from queue import Empty, Full, Queue
+from threading import Lock, Thread
+from typing import Callable, Dict, List, Optional
+
+
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", 0.01))  # 0 turns tracing off
+# Follow the caller's sampled flag only behind a trusted gateway; otherwise any
+# client could have every one of its requests traced
+TRACE_TRUST_PARENT = os.getenv("TRACE_TRUST_PARENT", "false").lower() == "true"
+TRACE_EXPORTER = os.getenv("TRACE_EXPORTER", "console")  # console, file, zipkin
+TRACE_FILE = os.getenv("TRACE_FILE", "traces.jsonl")
+TRACE_ZIPKIN_URL = os.getenv("TRACE_ZIPKIN_URL", "http://localhost:9411/api/v2/spans")
+TRACE_SERVICE_NAME = os.getenv("TRACE_SERVICE_NAME", "hotel-api")
+TRACE_QUEUE_SIZE = 10000  # Finished spans waiting for export; more are dropped
+TRACE_EXPORT_BATCH = 512
+TRACE_EXPORT_INTERVAL_SECONDS = 2
+TRACE_MAX_ATTRIBUTE_LENGTH = 500
+
+# The span new spans become children of. Context variables follow asyncio
+# tasks and the threads FastAPI runs sync endpoints on
+_current: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+def new_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+class Span:
+    """One timed operation; use as a context manager to make it the parent"""
+
+    __slots__ = (
+        "tracer",
+        "name",
+        "trace_id",
+        "span_id",
+        "parent_id",
+        "attributes",
+        "error",
+        "start",
+        "started",
+        "duration",
+        "token",
+    )
+
+    def __init__(
+        self, tracer, name: str, trace_id: str, parent_id: Optional[str], attributes
+    ):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.attributes = attributes
+        self.error = None
+        self.start = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.token = None
+
+    def set(self, key: str, value):
+        self.attributes[key] = value
+
+    def finish(self, error: Optional[BaseException] = None):
+        self.duration = time.perf_counter() - self.started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer.finish(self)
+
+    def traceparent(self) -> str:
+        """W3C trace context header for calls this span makes"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": round(self.duration * 1000, 3),
+            "attributes": {
+                key: str(value)[:TRACE_MAX_ATTRIBUTE_LENGTH]
+                for key, value in self.attributes.items()
+            },
+            "error": self.error,
+        }
+
+    def __enter__(self):
+        self.token = _current.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current.reset(self.token)
+        self.finish(exc)
+
+
+class NoopSpan:
+    """Stands in for spans of unsampled traces, so callers never branch"""
+
+    trace_id = None
+
+    def set(self, key: str, value):
+        pass
+
+    def finish(self, error: Optional[BaseException] = None):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NOOP_SPAN = NoopSpan()
+
+
+# ------------------------------------------------------------------------------------------
+# Exporters
+
+
+class Exporter:
+    """Receives finished spans in batches, on the tracer's export thread"""
+
+    def export(self, spans: List[dict]):
+        raise NotImplementedError
+
+
+class ConsoleExporter(Exporter):
+    def export(self, spans: List[dict]):
+        for span in spans:
+            parts = [f"[trace {span['trace_id'][:8]}]", span["name"]]
+            parts.append(f"{span['duration_ms']:.1f}ms")
+            parts.extend(f"{k}={v}" for k, v in span["attributes"].items())
+            if span["error"]:
+                parts.append(f"ERROR {span['error']}")
+            print(" ".join(parts))
+
+
+class FileExporter(Exporter):
+    """One JSON span per line; works offline"""
+
+    def __init__(self, path: str = TRACE_FILE):
+        self.path = path
+
+    def export(self, spans: List[dict]):
+        with open(self.path, "a") as out:
+            for span in spans:
+                out.write(json.dumps(span) + "\n")
+
+
+class ZipkinExporter(Exporter):
+    """Zipkin v2 JSON over HTTP; Jaeger accepts it on the same port"""
+
+    def __init__(self, url: str = TRACE_ZIPKIN_URL, service: str = TRACE_SERVICE_NAME):
+        self.url = url
+        self.service = service
+
+    def export(self, spans: List[dict]):
+        body = [
+            {
+                "traceId": span["trace_id"],
+                "id": span["span_id"],
+                "parentId": span["parent_id"],
+                "name": span["name"],
+                "timestamp": int(span["start"] * 1_000_000),
+                "duration": max(1, int(span["duration_ms"] * 1000)),
+                "localEndpoint": {"serviceName": self.service},
+                "tags": {
+                    **span["attributes"],
+                    **({"error": span["error"]} if span["error"] else {}),
+                },
+            }
+            for span in spans
+        ]
+        request = urllib.request.Request(
+            self.url,
+            data=json.dumps(body).encode(),
+            headers={"Content-Type": "application/json"},
+        )
+        urllib.request.urlopen(request, timeout=5).close()
+
+
+# name -> factory; add to it to plug in another exporter by TRACE_EXPORTER
+EXPORTERS: Dict[str, Callable[[], Exporter]] = {
+    "console": ConsoleExporter,
+    "file": FileExporter,
+    "zipkin": ZipkinExporter,
+}
+
+
+# ------------------------------------------------------------------------------------------
+# Tracer
+
+
+class Tracer:
+    """
+    Head-based sampling: whether a trace is recorded is decided once, when
+    its root span starts (or taken from the caller's traceparent header, if
+    trust_parent). A caller's trace id is always kept. Everything under an
+    unsampled root is a no-op, and finished spans are exported in batches off
+    the request path.
+    """
+
+    def __init__(
+        self,
+        sample_rate: float = TRACE_SAMPLE_RATE,
+        exporter: Optional[Exporter] = None,
+        trust_parent: bool = TRACE_TRUST_PARENT,
+    ):
+        self.sample_rate = sample_rate
+        self.exporter = exporter
+        self.trust_parent = trust_parent
+        self.queue: Queue = Queue(maxsize=TRACE_QUEUE_SIZE)
+        self.dropped = 0
+        self.started = False
+        self.starting = Lock()
+
+    def trace(self, name: str, traceparent: Optional[str] = None, **attributes):
+        """Root span of a request or job; a child span if one is already open"""
+        parent = _current.get()
+        if parent is not None:
+            return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+        remote = parse_traceparent(traceparent)
+        if remote:
+            trace_id, parent_id, sampled = remote
+        else:
+            trace_id, parent_id, sampled = new_id(128), None, None
+        if sampled is None or not self.trust_parent:
+            sampled = self.sample_rate > 0 and random.random() < self.sample_rate
+        if not sampled:
+            return NOOP_SPAN
+        return Span(self, name, trace_id, parent_id, attributes)
+
+    def span(self, name: str, **attributes):
+        """Child of the current span; a no-op outside a sampled trace"""
+        parent = _current.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(self, name, parent.trace_id, parent.span_id, attributes)
+
+    def finish(self, span: Span):
+        self.start()
+        try:
+            self.queue.put_nowait(span)
+        except Full:
+            self.dropped += 1
+
+    def start(self):
+        if self.started:
+            return
+        with self.starting:
+            if not self.started:
+                if self.exporter is None:
+                    self.exporter = EXPORTERS[TRACE_EXPORTER]()
+                Thread(target=self.export_forever, daemon=True).start()
+                atexit.register(self.flush)
+                self.started = True
+
+    def export_forever(self):
+        while True:
+            time.sleep(TRACE_EXPORT_INTERVAL_SECONDS)
+            self.flush()
+
+    def flush(self):
+        while True:
+            spans = []
+            try:
+                while len(spans) < TRACE_EXPORT_BATCH:
+                    spans.append(self.queue.get_nowait().to_dict())
+            except Empty:
+                pass
+            if not spans:
+                return
+            try:
+                self.exporter.export(spans)
+            except Exception as e:
+                # Tracing must never take the app down; these spans are lost
+                print(f"Trace export failed ({len(spans)} spans): {e}")
+                return
+
+
+def parse_traceparent(header: Optional[str]):
+    """(trace id, parent span id, sampled) from a W3C traceparent header"""
+    parts = (header or "").split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    try:
+        sampled = bool(int(parts[3], 16) & 1)
+    except ValueError:
+        return None
+    return parts[1], parts[2], sampled
+
+
+tracer = Tracer()
+
+
+def instrument_engine(engine):
+    """A span for every SQL statement run on the engine"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def start_statement(conn, cursor, statement, parameters, context, executemany):
+        span = tracer.span(
+            "sql",
+            statement=statement,
+            executemany=executemany,
+            db=engine.dialect.name,
+        )
+        if span is not NOOP_SPAN:
+            context._trace_span = span
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def finish_statement(conn, cursor, statement, parameters, context, executemany):
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.set("rows", cursor.rowcount)
+            span.finish()
+            context._trace_span = None
+
+    @event.listens_for(engine, "handle_error")
+    def fail_statement(exception_context):
+        context = exception_context.execution_context
+        span = getattr(context, "_trace_span", None)
+        if span is not None:
+            span.finish(exception_context.original_exception)
+            context._trace_span = None
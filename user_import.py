@@ -0,0 +1,232 @@
+import argparse
+import csv
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from threading import Lock
+from typing import Iterator, List, Optional, TextIO, Tuple, Union
+from fastapi import HTTPException
+from pydantic import ValidationError
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from db import db_user
+from db.Hash import Hash
+from routers.user import validate_password, validate_phone, validate_username
+from schemas import UserBase, UserImportError, UserImportResult
+
+
+USER_IMPORT_BATCH_SIZE = int(os.getenv("USER_IMPORT_BATCH_SIZE", 1000))
+HASH_PROCESSES = int(os.getenv("HASH_PROCESSES", os.cpu_count() or 1))
+
+USER_FIELDS = ("username", "email", "password", "phone_number")
+
+# Same rules as POST /users
+ROW_VALIDATORS = (
+    ("username", validate_username),
+    ("password", validate_password),
+    ("phone_number", validate_phone),
+)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    # bcrypt is CPU-bound by design, so it runs on every core, not in threads
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Spawned, not forked: forking copies the parent's threads' locks
+            # (the event loop, the DB pool) in whatever state they were in
+            _pool = ProcessPoolExecutor(
+                max_workers=HASH_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _pool
+
+
+def detect_format(file_name: Optional[str]) -> Optional[str]:
+    extension = os.path.splitext(file_name or "")[1].lower()
+    if extension == ".csv":
+        return "csv"
+    if extension in (".ndjson", ".jsonl"):
+        return "ndjson"
+    return None
+
+
+def read_rows(fileobj: TextIO, file_format: str) -> Iterator[Tuple[int, object]]:
+    """(row number, record); a line that is not valid JSON gives a None record"""
+    if file_format == "csv":
+        yield from enumerate(csv.DictReader(fileobj), start=1)
+        return
+
+    number = 0
+    for line in fileobj:
+        if not line.strip():
+            continue
+        number += 1
+        try:
+            yield number, json.loads(line)
+        except json.JSONDecodeError:
+            yield number, None
+
+
+def validate_row(number: int, record: object) -> Union[UserBase, UserImportError]:
+    if not isinstance(record, dict):
+        return UserImportError(row=number, detail="Not a JSON object")
+
+    try:
+        user = UserBase(**{field: record.get(field) for field in USER_FIELDS})
+    except ValidationError as e:
+        error = e.errors()[0]
+        field = str(error["loc"][0]) if error["loc"] else None
+        return UserImportError(row=number, field=field, detail=error["msg"])
+
+    for field, validate in ROW_VALIDATORS:
+        try:
+            validate(getattr(user, field))
+        except HTTPException as e:
+            return UserImportError(row=number, field=field, detail=e.detail)
+    return user
+
+
+def hash_passwords(passwords: List[str]) -> List[str]:
+    chunksize = max(1, len(passwords) // (HASH_PROCESSES * 4))
+    return list(get_pool().map(Hash.bcrypt, passwords, chunksize=chunksize))
+
+
+def drop_conflicts(
+    db: Session, batch: List[Tuple[int, UserBase]], errors: List[UserImportError]
+) -> List[Tuple[int, UserBase]]:
+    """Report rows whose username, email or phone is already registered"""
+    taken = db_user.taken_user_values(db, [user.model_dump() for _, user in batch])
+    fresh = []
+    for number, user in batch:
+        field = next(
+            (f for f in db_user.USER_UNIQUE_FIELDS if getattr(user, f) in taken[f]),
+            None,
+        )
+        if field:
+            detail = f"{field} already taken"
+            errors.append(UserImportError(row=number, field=field, detail=detail))
+        else:
+            fresh.append((number, user))
+    return fresh
+
+
+def insert_batch(
+    db: Session, batch: List[Tuple[int, UserBase]], errors: List[UserImportError]
+) -> int:
+    batch = drop_conflicts(db, batch, errors)
+    if not batch:
+        return 0
+
+    # Only rows that will be inserted pay for bcrypt
+    hashes = hash_passwords([user.password for _, user in batch])
+    rows = [
+        {
+            "username": user.username,
+            "email": user.email,
+            "phone_number": user.phone_number,
+            "hashed_password": hashed,
+        }
+        for (_, user), hashed in zip(batch, hashes)
+    ]
+    try:
+        db_user.insert_users(db, rows)
+        return len(rows)
+    except IntegrityError:
+        db.rollback()
+
+    # Someone registered one of these after the check: insert row by row, so
+    # only the rows that collide fail
+    created = 0
+    for (number, user), row in zip(batch, rows):
+        try:
+            db_user.insert_users(db, [row])
+            created += 1
+        except IntegrityError:
+            db.rollback()
+            if drop_conflicts(db, [(number, user)], errors):
+                # Not visible to us yet; the constraint still rejected it
+                detail = "Conflicted with a concurrent signup"
+                errors.append(UserImportError(row=number, detail=detail))
+    return created
+
+
+def import_users(
+    db: Session,
+    fileobj: TextIO,
+    file_format: str,
+    batch_size: int = USER_IMPORT_BATCH_SIZE,
+) -> UserImportResult:
+    """
+    Validate every row, then insert the valid ones batch by batch. Each batch
+    is checked against existing users in one query per unique field, hashed
+    in the process pool and written in one INSERT. Bad rows are reported and
+    skipped; they do not stop the import.
+    """
+    created = 0
+    errors: List[UserImportError] = []
+    seen = {field: set() for field in db_user.USER_UNIQUE_FIELDS}
+    batch: List[Tuple[int, UserBase]] = []
+
+    for number, record in read_rows(fileobj, file_format):
+        user = validate_row(number, record)
+        if isinstance(user, UserImportError):
+            errors.append(user)
+            continue
+
+        # Within the file, the first row with a value wins
+        duplicate = next(
+            (f for f in db_user.USER_UNIQUE_FIELDS if getattr(user, f) in seen[f]),
+            None,
+        )
+        if duplicate:
+            errors.append(
+                UserImportError(
+                    row=number,
+                    field=duplicate,
+                    detail=f"Duplicate {duplicate} earlier in the file",
+                )
+            )
+            continue
+        for field in db_user.USER_UNIQUE_FIELDS:
+            seen[field].add(getattr(user, field))
+
+        batch.append((number, user))
+        if len(batch) >= batch_size:
+            created += insert_batch(db, batch, errors)
+            batch = []
+
+    if batch:
+        created += insert_batch(db, batch, errors)
+
+    errors.sort(key=lambda error: error.row)
+    return UserImportResult(created=created, failed=len(errors), errors=errors)
+
+
+if __name__ == "__main__":
+    from db.database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Bulk import users from CSV/NDJSON")
+    parser.add_argument("path")
+    parser.add_argument("--format", choices=("csv", "ndjson"), dest="file_format")
+    parser.add_argument("--batch-size", type=int, default=USER_IMPORT_BATCH_SIZE)
+    args = parser.parse_args()
+
+    file_format = args.file_format or detect_format(args.path)
+    if not file_format:
+        parser.error("Cannot tell the format from the file name; pass --format")
+
+    db = SessionLocal()
+    try:
+        with open(args.path, encoding="utf-8-sig", newline="") as fileobj:
+            result = import_users(db, fileobj, file_format, args.batch_size)
+    finally:
+        db.close()
+
+    for error in result.errors:
+        print(f"Row {error.row}: {error.field or 'row'}: {error.detail}")
+    print(f"Created {result.created} users, {result.failed} rows failed")